@@ -4,6 +4,6 @@ Validates URLs and UTM parameters against a marketing taxonomy,
 suggests fixes, and generates marketer-friendly QA summaries.
 """
 
-from .utm_qa_agent import UTMQAAgent, UTMCheckResult, UTMCheckIssue
+from .utm_qa_agent import CompiledTaxonomy, UTMQAAgent, UTMCheckResult, UTMCheckIssue
 
-__all__ = ["UTMQAAgent", "UTMCheckResult", "UTMCheckIssue"]
+__all__ = ["UTMQAAgent", "UTMCheckResult", "UTMCheckIssue", "CompiledTaxonomy"]
@@ -0,0 +1,66 @@
+"""Multi-process execution of the deterministic UTM checks.
+
+URL parsing and rule checks are CPU-bound, so large exports are split into
+chunks and checked in a process pool. Each worker builds its own agent from
+the taxonomy once, at start-up, rather than per chunk.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional
+
+from .utm_qa_agent import UTMCheckResult, UTMQAAgent
+
+_worker_agent: Optional[UTMQAAgent] = None
+
+
+def _init_worker(taxonomy: Dict[str, Any]) -> None:
+    global _worker_agent
+    _worker_agent = UTMQAAgent.from_taxonomy(taxonomy)
+
+
+def _check_chunk(chunk: List[str]) -> List[UTMCheckResult]:
+    return [_worker_agent.check_rules(s) for s in chunk]
+
+
+def iter_check_parallel(
+    taxonomy: Dict[str, Any],
+    inputs: Iterable[str],
+    workers: Optional[int] = None,
+    chunk_size: int = 2000,
+    max_pending: Optional[int] = None,
+) -> Iterator[UTMCheckResult]:
+    """
+    Run ``check_rules`` over ``inputs`` in a process pool, yielding results in order.
+
+    Args:
+        taxonomy: Raw taxonomy dict, sent to each worker once.
+        inputs: URL / param strings; consumed lazily.
+        workers: Process count (default: ``os.cpu_count()``).
+        chunk_size: Inputs per task; larger chunks amortize pickling overhead.
+        max_pending: Chunks in flight at once (default: ``2 * workers``), which
+            bounds memory when ``inputs`` is a long stream.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+
+    iterator = iter(inputs)
+    pending: Deque[Future] = deque()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(taxonomy,))
+    try:
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            pending.append(pool.submit(_check_chunk, chunk))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # Also reached when the consumer stops early; don't wait on unneeded chunks.
+        pool.shutdown(wait=True, cancel_futures=True)
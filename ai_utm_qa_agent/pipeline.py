@@ -0,0 +1,203 @@
+"""Streaming input and output for bulk UTM validation.
+
+Readers and writers work on one row at a time, and results are produced in
+fixed-size chunks, so memory use stays flat no matter how large the export.
+"""
+
+import csv
+import json
+import sys
+from dataclasses import asdict
+from itertools import islice
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional
+
+INPUT_FORMATS = ("txt", "csv", "jsonl")
+OUTPUT_FORMATS = ("jsonl", "csv")
+
+CSV_FIELDS = [
+    "original_url",
+    "normalized_url",
+    "channel_guess",
+    "is_pass",
+    "suggested_url",
+    "issue_count",
+    "issues",
+    "explanation",
+]
+
+
+def detect_format(path: Optional[str], allowed: Iterable[str], default: str) -> str:
+    """Infer a format from a file extension, falling back to ``default``."""
+    if path and path != "-":
+        suffix = Path(path).suffix.lower().lstrip(".")
+        if suffix == "json":
+            suffix = "jsonl"
+        if suffix in allowed:
+            return suffix
+    return default
+
+
+def _looks_like_input(value: str) -> bool:
+    return "=" in value or "://" in value
+
+
+def iter_inputs(
+    stream: IO[str],
+    fmt: str = "txt",
+    column: str = "url",
+    on_skip: Optional[Callable[[int, str], None]] = None,
+) -> Iterator[str]:
+    """
+    Yield URL / param strings from an open text stream.
+
+    - ``txt``: one input per line; blank lines and ``#`` comments are skipped.
+    - ``csv``: the ``column`` field of each row, matched case-insensitively;
+      if no header names it and the first row looks like data (contains
+      ``=`` or ``://``), every row is data and the first column is used.
+      A header row without ``column`` raises ValueError.
+    - ``jsonl``: a bare JSON string per line, or an object's ``column`` field.
+      Lines that are not valid JSON, are neither a string nor an object, or
+      have no non-empty string ``column``, are skipped rather than ending
+      the stream.
+
+    ``on_skip(line_number, reason)`` is called for each skipped JSONL line.
+    """
+    if fmt == "txt":
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    elif fmt == "csv":
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header is None:
+            return
+        names = [name.strip().lower() for name in header]
+        if column.lower() in names:
+            index = names.index(column.lower())
+        elif header and _looks_like_input(header[0]):
+            # No header row; treat every row as data and read the first column.
+            index = 0
+            yield header[0].strip()
+        else:
+            raise ValueError(f"CSV header {header} has no '{column}' column; pick one with --column")
+        for row in reader:
+            if len(row) > index and row[index].strip():
+                yield row[index].strip()
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                if on_skip is not None:
+                    on_skip(line_number, f"invalid JSON ({exc.msg})")
+                continue
+            if isinstance(record, str):
+                value = record
+            elif isinstance(record, dict):
+                value = record.get(column)
+            else:
+                if on_skip is not None:
+                    on_skip(line_number, f"expected a string or object, got {type(record).__name__}")
+                continue
+            if value is not None and not isinstance(value, str):
+                if on_skip is not None:
+                    on_skip(line_number, f"'{column}' is a {type(value).__name__}, not a string")
+            elif not value:
+                if on_skip is not None:
+                    on_skip(line_number, f"missing '{column}'")
+            else:
+                yield value
+    else:
+        raise ValueError(f"Unsupported input format '{fmt}'; expected one of {INPUT_FORMATS}")
+
+
+def stream_results(
+    agent,
+    inputs: Iterable[str],
+    rules_only: bool = False,
+    chunk_size: int = 1000,
+    max_cached_signatures: int = 10000,
+    workers: int = 1,
+) -> Iterator:
+    """
+    Validate ``inputs`` lazily, ``chunk_size`` rows at a time.
+
+    Explanations are remembered by issue signature across chunks (up to
+    ``max_cached_signatures``), so a repeated issue set costs one LLM call
+    for the whole stream rather than one per chunk. With ``workers > 1`` the
+    rule checks run in a process pool; output order is unchanged.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if workers > 1:
+        from ai_utm_qa_agent.parallel import iter_check_parallel
+
+        checked = iter_check_parallel(agent.taxonomy, inputs, workers=workers, chunk_size=chunk_size)
+    else:
+        checked = (agent.check_rules(s) for s in inputs)
+
+    explanations: Dict = {}
+    while True:
+        chunk: List = list(islice(checked, chunk_size))
+        if not chunk:
+            return
+        if not rules_only:
+            if len(explanations) > max_cached_signatures:
+                explanations.clear()
+            agent.explain_results(chunk, explanations)
+        yield from chunk
+
+
+def result_to_row(result) -> Dict[str, object]:
+    """Flatten a ``UTMCheckResult`` into a CSV-friendly row."""
+    return {
+        "original_url": result.original_url,
+        "normalized_url": result.normalized_url,
+        "channel_guess": result.channel_guess or "",
+        "is_pass": result.is_pass,
+        "suggested_url": result.suggested_url or "",
+        "issue_count": len(result.issues),
+        "issues": "; ".join(f"{i.severity}:{i.param}:{i.message}" for i in result.issues),
+        "explanation": result.explanation,
+    }
+
+
+def write_results(results: Iterable, out: IO[str], fmt: str = "jsonl") -> Dict[str, int]:
+    """Write results to ``out`` as they arrive; returns row and failure counts."""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{fmt}'; expected one of {OUTPUT_FORMATS}")
+
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+
+    counts = {"total": 0, "failed": 0}
+    for result in results:
+        if writer is not None:
+            writer.writerow(result_to_row(result))
+        else:
+            out.write(json.dumps(asdict(result), ensure_ascii=False))
+            out.write("\n")
+        counts["total"] += 1
+        if not result.is_pass:
+            counts["failed"] += 1
+    out.flush()
+    return counts
+
+
+def open_input(path: str) -> IO[str]:
+    if path == "-":
+        return sys.stdin
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def open_output(path: str) -> IO[str]:
+    if path == "-":
+        return sys.stdout
+    return open(path, "w", encoding="utf-8", newline="")
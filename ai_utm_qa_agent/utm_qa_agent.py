@@ -1,16 +1,21 @@
+import argparse
 import json
+import os
+import re
 import sys
 import urllib.parse
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Pattern, Tuple
 
 # Add parent directory to path for shared imports when running as script
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from shared import call_llm
+from shared import acall_llm, call_llm, gather_bounded, metrics
 
-@dataclass
+IssueSignature = Tuple[Tuple[str, Optional[str], str, str], ...]
+
+@dataclass(frozen=True, slots=True)
 class UTMCheckIssue:
     type: str
     param: Optional[str]
@@ -18,7 +23,7 @@ class UTMCheckIssue:
     severity: str  # "error", "warning", "info"
 
 
-@dataclass
+@dataclass(slots=True)
 class UTMCheckResult:
     original_url: str
     normalized_url: str
@@ -29,6 +34,47 @@ class UTMCheckResult:
     explanation: str
 
 
+@dataclass(frozen=True)
+class CompiledTaxonomy:
+    """Lookup structures derived once from the raw taxonomy JSON."""
+
+    required_params: Tuple[str, ...]
+    allowed_sources: FrozenSet[str]
+    allowed_mediums: FrozenSet[str]
+    campaign_prefix_pattern: Optional[Pattern[str]]
+    channel_defaults: Dict[str, Dict[str, str]]
+    medium_to_channel: Dict[str, str]
+    # Original lists, kept so issue messages read exactly as before.
+    source_list: List[str]
+    medium_list: List[str]
+    prefix_list: List[str]
+
+    @classmethod
+    def from_dict(cls, taxonomy: Dict[str, Any]) -> "CompiledTaxonomy":
+        allowed = taxonomy["allowed_values"]
+        prefixes = allowed["utm_campaign_prefixes"]
+        pattern = re.compile("|".join(re.escape(p) for p in prefixes)) if prefixes else None
+
+        # First channel wins, matching the original linear scan order.
+        medium_to_channel: Dict[str, str] = {}
+        for channel, defaults in taxonomy["channel_defaults"].items():
+            medium = defaults.get("utm_medium")
+            if medium is not None:
+                medium_to_channel.setdefault(medium, channel)
+
+        return cls(
+            required_params=tuple(taxonomy["required_params"]),
+            allowed_sources=frozenset(allowed["utm_source"]),
+            allowed_mediums=frozenset(allowed["utm_medium"]),
+            campaign_prefix_pattern=pattern,
+            channel_defaults=taxonomy["channel_defaults"],
+            medium_to_channel=medium_to_channel,
+            source_list=allowed["utm_source"],
+            medium_list=allowed["utm_medium"],
+            prefix_list=prefixes,
+        )
+
+
 class UTMQAAgent:
     def __init__(self, taxonomy_path: str = "utm_taxonomy.json") -> None:
         resolved_path = Path(taxonomy_path)
@@ -40,6 +86,19 @@ class UTMQAAgent:
 
         with resolved_path.open("r", encoding="utf-8") as f:
             self.taxonomy = json.load(f)
+        # Snapshot of self.taxonomy; call compile_taxonomy() again after editing it.
+        self.compile_taxonomy()
+
+    @classmethod
+    def from_taxonomy(cls, taxonomy: Dict[str, Any]) -> "UTMQAAgent":
+        """Build an agent from an already-loaded taxonomy dict (no file access)."""
+        agent = cls.__new__(cls)
+        agent.taxonomy = taxonomy
+        agent.compile_taxonomy()
+        return agent
+
+    def compile_taxonomy(self) -> None:
+        self.compiled = CompiledTaxonomy.from_dict(self.taxonomy)
 
     def parse_url_or_params(self, input_str: str) -> Tuple[str, Dict[str, str]]:
         """
@@ -60,17 +119,14 @@ class UTMQAAgent:
 
     def guess_channel(self, params: Dict[str, str]) -> Optional[str]:
         source = params.get("utm_source", "").lower()
-        if source in self.taxonomy["channel_defaults"]:
+        if source in self.compiled.channel_defaults:
             return source
         medium = params.get("utm_medium", "").lower()
-        for channel, defaults in self.taxonomy["channel_defaults"].items():
-            if medium == defaults.get("utm_medium"):
-                return channel
-        return None
+        return self.compiled.medium_to_channel.get(medium)
 
     def check_required_params(self, params: Dict[str, str]) -> List[UTMCheckIssue]:
         issues: List[UTMCheckIssue] = []
-        for req in self.taxonomy["required_params"]:
+        for req in self.compiled.required_params:
             if req not in params or not params[req]:
                 issues.append(
                     UTMCheckIssue(
@@ -84,40 +140,40 @@ class UTMQAAgent:
 
     def check_allowed_values(self, params: Dict[str, str]) -> List[UTMCheckIssue]:
         issues: List[UTMCheckIssue] = []
-        allowed = self.taxonomy["allowed_values"]
+        compiled = self.compiled
         utm_source = params.get("utm_source", "").lower()
         utm_medium = params.get("utm_medium", "").lower()
         utm_campaign = params.get("utm_campaign", "")
 
-        if utm_source and utm_source not in allowed["utm_source"]:
+        if utm_source and utm_source not in compiled.allowed_sources:
             issues.append(
                 UTMCheckIssue(
                     type="invalid_value",
                     param="utm_source",
-                    message=f"utm_source '{utm_source}' is not in allowed list {allowed['utm_source']}",
+                    message=f"utm_source '{utm_source}' is not in allowed list {compiled.source_list}",
                     severity="warning",
                 )
             )
 
-        if utm_medium and utm_medium not in allowed["utm_medium"]:
+        if utm_medium and utm_medium not in compiled.allowed_mediums:
             issues.append(
                 UTMCheckIssue(
                     type="invalid_value",
                     param="utm_medium",
-                    message=f"utm_medium '{utm_medium}' is not in allowed list {allowed['utm_medium']}",
+                    message=f"utm_medium '{utm_medium}' is not in allowed list {compiled.medium_list}",
                     severity="warning",
                 )
             )
 
-        if utm_campaign and allowed["utm_campaign_prefixes"]:
-            if not any(utm_campaign.startswith(prefix) for prefix in allowed["utm_campaign_prefixes"]):
+        if utm_campaign and compiled.campaign_prefix_pattern is not None:
+            if not compiled.campaign_prefix_pattern.match(utm_campaign):
                 issues.append(
                     UTMCheckIssue(
                         type="naming_convention",
                         param="utm_campaign",
                         message=(
                             f"utm_campaign '{utm_campaign}' does not start with any allowed prefix "
-                            f"{allowed['utm_campaign_prefixes']}"
+                            f"{compiled.prefix_list}"
                         ),
                         severity="info",
                     )
@@ -127,47 +183,59 @@ class UTMQAAgent:
 
     def build_suggested_params(self, params: Dict[str, str], channel_guess: Optional[str]) -> Dict[str, str]:
         updated = params.copy()
-        if channel_guess and channel_guess in self.taxonomy["channel_defaults"]:
-            defaults = self.taxonomy["channel_defaults"][channel_guess]
+        if channel_guess and channel_guess in self.compiled.channel_defaults:
+            defaults = self.compiled.channel_defaults[channel_guess]
             for key, val in defaults.items():
                 if not updated.get(key):
                     updated[key] = val
         return updated
 
-    def build_explanation(self, issues: List[UTMCheckIssue], suggested_url: Optional[str]) -> str:
+    def build_explanation_prompt(self, issues: List[UTMCheckIssue], suggested_url: Optional[str]) -> str:
         issue_lines = []
         for issue in issues:
             issue_lines.append(f"- [{issue.severity.upper()}] {issue.message}")
 
         issues_text = "\n".join(issue_lines) if issue_lines else "No issues detected."
+        # Batch explanations are shared by many URLs, so they omit the per-URL suggestion.
+        suggestion_text = f"\nSuggested URL: {suggested_url}\n" if suggested_url is not None else ""
 
         prompt = f"""
 You are a marketing operations specialist. Summarize this UTM QA result in simple language.
 
 Issues:
 {issues_text}
-
-Suggested URL: {suggested_url}
-
+{suggestion_text}
 Provide:
 1. A one paragraph summary for a marketer.
 2. A short list of recommended next steps.
 """
-        explanation = call_llm(prompt)
+        return prompt
+
+    def build_explanation(self, issues: List[UTMCheckIssue], suggested_url: Optional[str]) -> str:
+        prompt = self.build_explanation_prompt(issues, suggested_url)
+        with metrics.stage("utm.llm"):
+            explanation = call_llm(prompt)
         return explanation
 
-    def run_check(self, input_str: str) -> UTMCheckResult:
-        normalized_url, params = self.parse_url_or_params(input_str)
-        channel_guess = self.guess_channel(params)
-        issues: List[UTMCheckIssue] = []
-        issues.extend(self.check_required_params(params))
-        issues.extend(self.check_allowed_values(params))
+    async def abuild_explanation(self, issues: List[UTMCheckIssue], suggested_url: Optional[str]) -> str:
+        prompt = self.build_explanation_prompt(issues, suggested_url)
+        with metrics.stage("utm.llm"):
+            return await acall_llm(prompt)
+
+    def check_rules(self, input_str: str) -> UTMCheckResult:
+        """Run the deterministic checks only; ``explanation`` is left empty."""
+        with metrics.stage("utm.parse"):
+            normalized_url, params = self.parse_url_or_params(input_str)
+        with metrics.stage("utm.checks"):
+            channel_guess = self.guess_channel(params)
+            issues: List[UTMCheckIssue] = []
+            issues.extend(self.check_required_params(params))
+            issues.extend(self.check_allowed_values(params))
 
-        suggested_params = self.build_suggested_params(params, channel_guess)
-        suggested_url = normalized_url.split("?")[0] + "?" + urllib.parse.urlencode(suggested_params)
+            suggested_params = self.build_suggested_params(params, channel_guess)
+            suggested_url = normalized_url.split("?")[0] + "?" + urllib.parse.urlencode(suggested_params)
 
         is_pass = all(issue.severity != "error" for issue in issues)
-        explanation = self.build_explanation(issues, suggested_url)
 
         return UTMCheckResult(
             original_url=input_str,
@@ -176,9 +244,108 @@ Provide:
             channel_guess=channel_guess,
             is_pass=is_pass,
             suggested_url=suggested_url,
-            explanation=explanation,
+            explanation="",
         )
 
+    def run_check(self, input_str: str) -> UTMCheckResult:
+        result = self.check_rules(input_str)
+        result.explanation = self.build_explanation(result.issues, result.suggested_url)
+        return result
+
+    async def arun_check(self, input_str: str) -> UTMCheckResult:
+        result = self.check_rules(input_str)
+        result.explanation = await self.abuild_explanation(result.issues, result.suggested_url)
+        return result
+
+    async def arun_checks(self, inputs: Iterable[str], concurrency: int = 100) -> List[UTMCheckResult]:
+        """Check many inputs on one event loop with at most ``concurrency`` LLM calls in flight."""
+        return await gather_bounded((self.arun_check(s) for s in inputs), limit=concurrency)
+
+    @staticmethod
+    def issue_signature(issues: List[UTMCheckIssue]) -> IssueSignature:
+        """Hashable key shared by results whose issue lists are identical."""
+        return tuple((i.type, i.param, i.severity, i.message) for i in issues)
+
+    def group_by_signature(self, results: List[UTMCheckResult]) -> Dict[IssueSignature, List[UTMCheckResult]]:
+        groups: Dict[IssueSignature, List[UTMCheckResult]] = {}
+        for result in results:
+            groups.setdefault(self.issue_signature(result.issues), []).append(result)
+        return groups
+
+    def run_batch(
+        self,
+        inputs: Iterable[str],
+        rules_only: bool = False,
+        explanations: Optional[Dict[IssueSignature, str]] = None,
+    ) -> List[UTMCheckResult]:
+        """
+        Check many inputs with at most one LLM call per distinct issue signature.
+
+        All deterministic checks run first; results with identical issue lists
+        then share a single explanation. With ``rules_only=True`` no LLM call
+        is made and ``explanation`` stays empty. Results keep input order.
+
+        Pass the same ``explanations`` dict across calls to reuse explanations
+        for signatures already seen in earlier batches.
+        """
+        results = [self.check_rules(s) for s in inputs]
+        if not rules_only:
+            self.explain_results(results, explanations)
+        return results
+
+    def explain_results(
+        self,
+        results: List[UTMCheckResult],
+        explanations: Optional[Dict[IssueSignature, str]] = None,
+    ) -> None:
+        """Fill in ``explanation`` on checked results, one LLM call per new issue signature."""
+        if explanations is None:
+            explanations = {}
+        for signature, group in self.group_by_signature(results).items():
+            explanation = explanations.get(signature)
+            if explanation is None:
+                explanation = self.build_explanation(group[0].issues, None)
+                explanations[signature] = explanation
+            for result in group:
+                result.explanation = explanation
+
+    def run_parallel(
+        self,
+        inputs: Iterable[str],
+        rules_only: bool = False,
+        workers: Optional[int] = None,
+        chunk_size: int = 2000,
+    ) -> List[UTMCheckResult]:
+        """
+        :meth:`run_batch` with the deterministic checks sharded across processes.
+
+        Each worker compiles the taxonomy once; results come back in input
+        order. Explanations, if requested, are still built in this process.
+        """
+        from ai_utm_qa_agent.parallel import iter_check_parallel
+
+        results = list(iter_check_parallel(self.taxonomy, inputs, workers=workers, chunk_size=chunk_size))
+        if not rules_only:
+            self.explain_results(results)
+        return results
+
+    async def arun_batch(
+        self, inputs: Iterable[str], rules_only: bool = False, concurrency: int = 100
+    ) -> List[UTMCheckResult]:
+        """Async :meth:`run_batch`; per-signature explanations are requested concurrently."""
+        results = [self.check_rules(s) for s in inputs]
+        if rules_only:
+            return results
+
+        groups = list(self.group_by_signature(results).values())
+        explanations = await gather_bounded(
+            (self.abuild_explanation(group[0].issues, None) for group in groups), limit=concurrency
+        )
+        for group, explanation in zip(groups, explanations):
+            for result in group:
+                result.explanation = explanation
+        return results
+
 
 def demo():
     agent = UTMQAAgent()
@@ -204,5 +371,94 @@ def demo():
         print("=" * 80)
 
 
+def main(argv: Optional[List[str]] = None) -> None:
+    from ai_utm_qa_agent.pipeline import (
+        INPUT_FORMATS,
+        OUTPUT_FORMATS,
+        detect_format,
+        iter_inputs,
+        open_input,
+        open_output,
+        stream_results,
+        write_results,
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Validate UTM-tagged URLs from a file or stdin and stream results out."
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        help="Input file of URLs (txt, csv or jsonl), or '-' for stdin. If omitted, the demo runs.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("auto",) + INPUT_FORMATS,
+        default="auto",
+        help="Input format (default: from file extension, else txt)",
+    )
+    parser.add_argument("--column", default="url", help="CSV column / JSON field holding the URL (default: url)")
+    parser.add_argument("-o", "--output", default="-", help="Output file, or '-' for stdout (default: -)")
+    parser.add_argument(
+        "--output-format",
+        choices=("auto",) + OUTPUT_FORMATS,
+        default="auto",
+        help="Output format (default: from output extension, else jsonl)",
+    )
+    parser.add_argument("--rules-only", action="store_true", help="Skip LLM explanations entirely")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows validated per batch (default: 1000)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes for rule checks; 0 uses every core (default: 1)",
+    )
+    parser.add_argument("--taxonomy", default="utm_taxonomy.json", help="Path to the UTM taxonomy JSON")
+
+    args = parser.parse_args(argv)
+    if args.input is None:
+        demo()
+        return
+
+    in_fmt = args.format if args.format != "auto" else detect_format(args.input, INPUT_FORMATS, "txt")
+    out_fmt = (
+        args.output_format
+        if args.output_format != "auto"
+        else detect_format(args.output, OUTPUT_FORMATS, "jsonl")
+    )
+
+    skipped = []
+
+    def on_skip(line_number: int, reason: str) -> None:
+        skipped.append(line_number)
+        if len(skipped) <= 10:
+            print(f"Skipping input line {line_number}: {reason}", file=sys.stderr)
+
+    agent = UTMQAAgent(args.taxonomy)
+    source = open_input(args.input)
+    sink = open_output(args.output)
+    try:
+        inputs = iter_inputs(source, in_fmt, column=args.column, on_skip=on_skip)
+        results = stream_results(
+            agent,
+            inputs,
+            rules_only=args.rules_only,
+            chunk_size=args.chunk_size,
+            workers=args.workers or os.cpu_count() or 1,
+        )
+        counts = write_results(results, sink, out_fmt)
+    except ValueError as exc:
+        sys.exit(f"error: {exc}")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(f"Checked {counts['total']} inputs, {counts['failed']} failing.", file=sys.stderr)
+    if skipped:
+        print(f"Skipped {len(skipped)} malformed input lines.", file=sys.stderr)
+
+
 if __name__ == "__main__":
-    demo()
+    main()
@@ -9,6 +9,23 @@ from .anomaly_pacing_agent import (
     AnomalyReportingAgent,
     DailyMetrics,
     Anomaly,
+    DetectionStrategy,
+    GuardrailRules,
 )
+from .columnar import MetricsColumns
+from .strategies import RobustZScore, SeasonalBaseline
+from .streaming import RollingStats, StreamingAnomalyDetector
 
-__all__ = ["AnomalyDetector", "AnomalyReportingAgent", "DailyMetrics", "Anomaly"]
+__all__ = [
+    "AnomalyDetector",
+    "AnomalyReportingAgent",
+    "DailyMetrics",
+    "Anomaly",
+    "DetectionStrategy",
+    "GuardrailRules",
+    "RobustZScore",
+    "SeasonalBaseline",
+    "MetricsColumns",
+    "RollingStats",
+    "StreamingAnomalyDetector",
+]
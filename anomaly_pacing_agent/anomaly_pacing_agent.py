@@ -1,43 +1,79 @@
 import random
-import statistics
 import sys
-from dataclasses import dataclass, asdict
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from itertools import repeat
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 # Add parent directory to path for shared imports when running as script
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from shared import call_llm
+from anomaly_pacing_agent.columnar import MetricsColumns, grouped_exact_mean
+from shared import LLMStream, acall_llm, call_llm, stream_llm
+from shared import metrics as instrumentation  # ``metrics`` names the input rows here
+
+class _DerivedMetricsSlots:
+    # Storage for DailyMetrics' cached derived metrics. They live in slots
+    # outside the dataclass fields, so asdict(), fields(), ==, repr and
+    # pickling only see the public fields.
+    __slots__ = ("_cpc", "_ctr", "_cvr", "_cpa")
 
-@dataclass
-class DailyMetrics:
+
+@dataclass(frozen=True, slots=True)
+class DailyMetrics(_DerivedMetricsSlots):
     day: int
     channel: str
     spend: float
     clicks: int
     conversions: int
+    campaign: Optional[str] = None
+
+    # Derived metrics are computed on first access and kept; the record is
+    # frozen, so they can never go stale.
 
     @property
     def cpc(self) -> float:
-        return self.spend / self.clicks if self.clicks > 0 else 0.0
+        try:
+            return self._cpc
+        except AttributeError:
+            value = self.spend / self.clicks if self.clicks > 0 else 0.0
+            object.__setattr__(self, "_cpc", value)
+            return value
 
     @property
     def ctr(self) -> float:
-        # Assume 10 times clicks as impressions for this simple sim
-        impressions = self.clicks * 10
-        return self.clicks / impressions if impressions > 0 else 0.0
+        try:
+            return self._ctr
+        except AttributeError:
+            # Assume 10 times clicks as impressions for this simple sim
+            impressions = self.clicks * 10
+            value = self.clicks / impressions if impressions > 0 else 0.0
+            object.__setattr__(self, "_ctr", value)
+            return value
 
     @property
     def cvr(self) -> float:
-        return self.conversions / self.clicks if self.clicks > 0 else 0.0
+        try:
+            return self._cvr
+        except AttributeError:
+            value = self.conversions / self.clicks if self.clicks > 0 else 0.0
+            object.__setattr__(self, "_cvr", value)
+            return value
 
     @property
     def cpa(self) -> float:
-        return self.spend / self.conversions if self.conversions > 0 else 0.0
+        try:
+            return self._cpa
+        except AttributeError:
+            value = self.spend / self.conversions if self.conversions > 0 else 0.0
+            object.__setattr__(self, "_cpa", value)
+            return value
 
 
-@dataclass
+@dataclass(slots=True)
 class Anomaly:
     day: int
     channel: str
@@ -48,127 +84,213 @@ class Anomaly:
     direction: str  # "up" or "down"
     severity: str   # "info", "warning", "critical"
     reason: str
+    campaign: Optional[str] = None
+
+
+# (metric, row mask, value, baseline, deviation_pct, direction, severity, reason);
+# value is given for the masked rows only, the others may be scalars or
+# arrays over the masked rows.
+Check = Tuple[str, np.ndarray, np.ndarray, Any, Any, str, Any, str]
+
+
+def build_anomalies(columns: MetricsColumns, checks: Sequence[Check]) -> Tuple[np.ndarray, List[Anomaly]]:
+    """
+    Turn vectorized checks into ``Anomaly`` objects.
+
+    Returns ``(rows, anomalies)``: anomalies ordered by row, then by check
+    order within a row, with ``rows`` holding each anomaly's row index.
+    """
+    channel_names = columns.channel_names()
+    campaign_names = columns.campaign_names()
+    found: List[Anomaly] = []
+    found_rows, found_checks = [], []
+    for order, (metric, mask, values, baseline, deviation, direction, severity, reason) in enumerate(checks):
+        rows = np.flatnonzero(mask)
+        count = len(rows)
+        # Positional map() in Anomaly field order avoids a Python-level loop.
+        found.extend(
+            map(
+                Anomaly,
+                columns.day[rows].tolist(),
+                channel_names[rows].tolist(),
+                repeat(metric, count),
+                values.tolist(),
+                np.broadcast_to(baseline, count).tolist(),
+                np.broadcast_to(deviation, count).tolist(),
+                repeat(direction, count),
+                np.broadcast_to(severity, count).tolist(),
+                repeat(reason, count),
+                campaign_names[rows].tolist(),
+            )
+        )
+        found_rows.append(rows)
+        found_checks.append(np.full(count, order))
 
+    rows = np.concatenate(found_rows) if found_rows else np.empty(0, dtype=np.int64)
+    position = np.lexsort((np.concatenate(found_checks), rows)) if found_rows else rows
+    return rows[position], [found[i] for i in position.tolist()]
 
-class AnomalyDetector:
-    def __init__(self, daily_budget: float, max_cpa: float, min_ctr: float, min_cvr: float) -> None:
-        self.daily_budget = daily_budget
-        self.max_cpa = max_cpa
-        self.min_ctr = min_ctr
-        self.min_cvr = min_cvr
 
-    def detect(self, metrics: List[DailyMetrics]) -> List[Anomaly]:
-        anomalies: List[Anomaly] = []
-
-        spend_values = [m.spend for m in metrics]
-        cpa_values = [m.cpa for m in metrics if m.conversions > 0]
-        ctr_values = [m.ctr for m in metrics if m.clicks > 0]
-        cvr_values = [m.cvr for m in metrics if m.clicks > 0]
-
-        spend_avg = statistics.mean(spend_values)
-        cpa_avg = statistics.mean(cpa_values) if cpa_values else 0.0
-        ctr_avg = statistics.mean(ctr_values) if ctr_values else 0.0
-        cvr_avg = statistics.mean(cvr_values) if cvr_values else 0.0
-
-        for m in metrics:
-            # Spend pacing
-            if m.spend > self.daily_budget * 1.25:
-                deviation_pct = (m.spend - self.daily_budget) / self.daily_budget * 100
-                anomalies.append(
-                    Anomaly(
-                        day=m.day,
-                        channel=m.channel,
-                        metric="spend",
-                        value=m.spend,
-                        baseline=self.daily_budget,
-                        deviation_pct=deviation_pct,
-                        direction="up",
-                        severity="warning" if deviation_pct < 50 else "critical",
-                        reason="Spend is above daily budget target.",
-                    )
-                )
-            elif m.spend < self.daily_budget * 0.75:
-                deviation_pct = (self.daily_budget - m.spend) / self.daily_budget * 100
-                anomalies.append(
-                    Anomaly(
-                        day=m.day,
-                        channel=m.channel,
-                        metric="spend",
-                        value=m.spend,
-                        baseline=self.daily_budget,
-                        deviation_pct=deviation_pct,
-                        direction="down",
-                        severity="info",
-                        reason="Spend is below pacing target.",
-                    )
-                )
+class DetectionStrategy(ABC):
+    """One way of turning a block of metric columns into anomalies."""
 
-            # CPA guardrail
-            if m.conversions > 0 and m.cpa > self.max_cpa:
-                deviation_pct = (m.cpa - self.max_cpa) / self.max_cpa * 100
-                anomalies.append(
-                    Anomaly(
-                        day=m.day,
-                        channel=m.channel,
-                        metric="cpa",
-                        value=m.cpa,
-                        baseline=self.max_cpa,
-                        deviation_pct=deviation_pct,
-                        direction="up",
-                        severity="critical",
-                        reason="CPA above guardrail threshold.",
-                    )
-                )
+    @abstractmethod
+    def evaluate(self, detector: "AnomalyDetector", columns: MetricsColumns) -> Tuple[np.ndarray, List[Anomaly]]:
+        """Return ``(rows, anomalies)`` as :func:`build_anomalies` does."""
 
-            # CTR relative anomaly
-            if m.clicks > 0 and m.ctr < ctr_avg * 0.7:
-                deviation_pct = (ctr_avg - m.ctr) / ctr_avg * 100 if ctr_avg > 0 else 0
-                anomalies.append(
-                    Anomaly(
-                        day=m.day,
-                        channel=m.channel,
-                        metric="ctr",
-                        value=m.ctr,
-                        baseline=ctr_avg,
-                        deviation_pct=deviation_pct,
-                        direction="down",
-                        severity="warning",
-                        reason="CTR significantly below rolling average.",
-                    )
-                )
 
-            # CVR guardrail
-            if m.clicks > 0 and m.cvr < self.min_cvr:
-                deviation_pct = (self.min_cvr - m.cvr) / self.min_cvr * 100
-                anomalies.append(
-                    Anomaly(
-                        day=m.day,
-                        channel=m.channel,
-                        metric="cvr",
-                        value=m.cvr,
-                        baseline=self.min_cvr,
-                        deviation_pct=deviation_pct,
-                        direction="down",
-                        severity="warning",
-                        reason="Conversion rate below minimum target.",
-                    )
-                )
+class GuardrailRules(DetectionStrategy):
+    """
+    The detector's fixed rules: budget pacing, max CPA and min CVR guardrails,
+    plus CTR against the mean of the row's ``baseline_by`` group.
+    """
+
+    def evaluate(self, detector: "AnomalyDetector", columns: MetricsColumns) -> Tuple[np.ndarray, List[Anomaly]]:
+        has_clicks = columns.clicks > 0
+        groups, n_groups = columns.group_ids(detector.baseline_by)
+        group_ctr = grouped_exact_mean(columns.ctr[has_clicks], groups[has_clicks], n_groups)
+        # Groups without clicks have no baseline; none of their rows is checked.
+        return detector._check_rules(columns, np.nan_to_num(group_ctr, nan=0.0)[groups])
 
-        return anomalies
+
+class AnomalyDetector:
+    BASELINE_GROUPINGS = ("global", "channel", "campaign")
+
+    def __init__(
+        self,
+        daily_budget: float,
+        max_cpa: float,
+        min_ctr: float,
+        min_cvr: float,
+        baseline_by: str = "channel",
+        strategies: Optional[Sequence[DetectionStrategy]] = None,
+    ) -> None:
+        """
+        ``baseline_by`` sets which rows a relative check is compared against:
+        ``"channel"`` (default), ``"campaign"`` (channel and campaign), or
+        ``"global"`` (all rows together).
+
+        ``strategies`` lists the detection methods to run (default: just
+        :class:`GuardrailRules`); see ``anomaly_pacing_agent.strategies`` for
+        robust z-score and seasonal baselines.
+        """
+        if baseline_by not in self.BASELINE_GROUPINGS:
+            raise ValueError(f"baseline_by must be one of {self.BASELINE_GROUPINGS}, got '{baseline_by}'")
+        self.daily_budget = daily_budget
+        self.max_cpa = max_cpa
+        self.min_ctr = min_ctr
+        self.min_cvr = min_cvr
+        self.baseline_by = baseline_by
+        self.strategies: List[DetectionStrategy] = list(strategies) if strategies is not None else [GuardrailRules()]
+
+    def detect(self, metrics: Union[List[DailyMetrics], MetricsColumns]) -> List[Anomaly]:
+        """
+        Run every strategy over all rows.
+
+        Accepts ``DailyMetrics`` records or a prebuilt :class:`MetricsColumns`.
+        Either way each strategy is evaluated as array operations over all
+        rows at once. Anomalies are returned in row order; within a row, in
+        strategy order and then in each strategy's own check order (for the
+        default rules: spend, cpa, ctr, cvr).
+
+        The default CTR baseline is the mean CTR of the row's own group (see
+        ``baseline_by``). All group means come from one sort over the rows.
+        """
+        with instrumentation.stage("anomaly.detect"):
+            columns = metrics if isinstance(metrics, MetricsColumns) else MetricsColumns.from_records(metrics)
+            return self.evaluate(columns)[1]
+
+    def detect_parallel(
+        self,
+        metrics: Union[List[DailyMetrics], MetricsColumns],
+        workers: Optional[int] = None,
+        n_shards: Optional[int] = None,
+    ) -> List[Anomaly]:
+        """
+        :meth:`detect` with rows hash-partitioned by series across processes.
+
+        Columns reach the workers through shared memory; the merged result
+        equals ``detect(metrics)``. See ``anomaly_pacing_agent.parallel``.
+        """
+        from anomaly_pacing_agent.parallel import detect_parallel
+
+        return detect_parallel(self, metrics, workers=workers, n_shards=n_shards)
+
+    def evaluate(self, columns: MetricsColumns) -> Tuple[np.ndarray, List[Anomaly]]:
+        """Like :meth:`detect`, but also return the row index of each anomaly."""
+        if len(columns) == 0:
+            return np.zeros(0, dtype=np.int64), []
+        if len(self.strategies) == 1:
+            return self.strategies[0].evaluate(self, columns)
+
+        found: List[Anomaly] = []
+        found_rows, found_strategies = [], []
+        for order, strategy in enumerate(self.strategies):
+            rows, anomalies = strategy.evaluate(self, columns)
+            found.extend(anomalies)
+            found_rows.append(rows)
+            found_strategies.append(np.full(len(rows), order))
+        # lexsort is stable, so each strategy's own order survives within a row.
+        rows = np.concatenate(found_rows)
+        position = np.lexsort((np.concatenate(found_strategies), rows))
+        return rows[position], [found[i] for i in position.tolist()]
+
+    def check_rules(self, columns: MetricsColumns, ctr_baseline: np.ndarray) -> List[Anomaly]:
+        """
+        Evaluate the guardrail rules for ``columns`` given a CTR baseline per row.
+
+        Rows whose baseline is 0 are not checked for relative CTR.
+        """
+        return self._check_rules(columns, ctr_baseline)[1]
+
+    def _check_rules(self, columns: MetricsColumns, ctr_baseline: np.ndarray) -> Tuple[np.ndarray, List[Anomaly]]:
+        spend, clicks, conversions = columns.spend, columns.clicks, columns.conversions
+        ctr, cvr, cpa = columns.ctr, columns.cvr, columns.cpa
+        has_clicks = clicks > 0
+        ctr_avg = ctr_baseline
+        budget = self.daily_budget
+
+        over = spend > budget * 1.25
+        under = ~over & (spend < budget * 0.75)
+        over_pct = (spend[over] - budget) / budget * 100
+        under_pct = (budget - spend[under]) / budget * 100
+        cpa_hit = (conversions > 0) & (cpa > self.max_cpa)
+        ctr_hit = has_clicks & (ctr < ctr_avg * 0.7)
+        ctr_base = ctr_avg[ctr_hit]
+        cvr_hit = has_clicks & (cvr < self.min_cvr)
+
+        # (metric, rows, value, baseline, deviation_pct, direction, severity, reason),
+        # in the order the rules are checked for each row.
+        rules = [
+            ("spend", over, spend[over], budget, over_pct, "up",
+             np.where(over_pct < 50, "warning", "critical"), "Spend is above daily budget target."),
+            ("spend", under, spend[under], budget, under_pct, "down", "info", "Spend is below pacing target."),
+            ("cpa", cpa_hit, cpa[cpa_hit], self.max_cpa, (cpa[cpa_hit] - self.max_cpa) / self.max_cpa * 100,
+             "up", "critical", "CPA above guardrail threshold."),
+            ("ctr", ctr_hit, ctr[ctr_hit], ctr_base, (ctr_base - ctr[ctr_hit]) / ctr_base * 100,
+             "down", "warning", "CTR significantly below rolling average."),
+            ("cvr", cvr_hit, cvr[cvr_hit], self.min_cvr, (self.min_cvr - cvr[cvr_hit]) / self.min_cvr * 100,
+             "down", "warning", "Conversion rate below minimum target."),
+        ]
+
+        return build_anomalies(columns, rules)
 
 
 class AnomalyReportingAgent:
+    NO_ANOMALIES_MESSAGE = "No material anomalies detected. Campaign pacing and efficiency are within guardrails."
+
     def __init__(self, detector: AnomalyDetector) -> None:
         self.detector = detector
 
-    def explain_anomalies(self, anomalies: List[Anomaly]) -> str:
-        if not anomalies:
-            return "No material anomalies detected. Campaign pacing and efficiency are within guardrails."
+    @staticmethod
+    def _where(a: Anomaly) -> str:
+        return f"{a.channel} / {a.campaign}" if a.campaign else a.channel
 
+    def build_prompt(self, anomalies: List[Anomaly]) -> str:
         bullets = []
         for a in anomalies:
             bullets.append(
-                f"- Day {a.day}, {a.channel}: {a.metric.upper()} is {a.deviation_pct:.1f}% "
+                f"- Day {a.day}, {self._where(a)}: {a.metric.upper()} is {a.deviation_pct:.1f}% "
                 f"{'above' if a.direction == 'up' else 'below'} baseline. {a.reason}"
             )
 
@@ -186,7 +308,28 @@ Write:
 
 Keep the tone practical and focused on decision making.
 """
-        return call_llm(prompt)
+        return prompt
+
+    def explain_anomalies(self, anomalies: List[Anomaly]) -> str:
+        if not anomalies:
+            return self.NO_ANOMALIES_MESSAGE
+        prompt = self.build_prompt(anomalies)
+        with instrumentation.stage("anomaly.llm"):
+            return call_llm(prompt)
+
+    async def aexplain_anomalies(self, anomalies: List[Anomaly]) -> str:
+        if not anomalies:
+            return self.NO_ANOMALIES_MESSAGE
+        prompt = self.build_prompt(anomalies)
+        with instrumentation.stage("anomaly.llm"):
+            return await acall_llm(prompt)
+
+    def stream_explanation(self, anomalies: List[Anomaly]) -> LLMStream:
+        """:meth:`explain_anomalies`, yielding text chunks as they are generated."""
+        if not anomalies:
+            return LLMStream([self.NO_ANOMALIES_MESSAGE])
+        prompt = self.build_prompt(anomalies)
+        return stream_llm(prompt).timed("anomaly.llm")
 
     def build_slack_message(self, anomalies: List[Anomaly]) -> str:
         if not anomalies:
@@ -195,7 +338,7 @@ Keep the tone practical and focused on decision making.
         lines = [":warning: Daily Pacing and KPI Anomalies"]
         for a in anomalies:
             lines.append(
-                f"- Day {a.day}, {a.channel}: {a.metric.upper()} {a.direction} "
+                f"- Day {a.day}, {self._where(a)}: {a.metric.upper()} {a.direction} "
                 f"{a.deviation_pct:.1f}% vs baseline. {a.reason}"
             )
         return "\n".join(lines)
@@ -251,7 +394,11 @@ def demo():
     print(agent.build_slack_message(anomalies))
 
     print("\nLLM narrative explanation:")
-    print(agent.explain_anomalies(anomalies))
+    stream = agent.stream_explanation(anomalies)
+    for chunk in stream:
+        print(chunk, end="", flush=True)
+    print()
+    print(f"({stream.timing_summary()})", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+"""Column-oriented daily metrics for vectorized anomaly detection.
+
+``MetricsColumns`` holds one NumPy array per field instead of one
+``DailyMetrics`` object per row. Channels are stored as integer codes into
+``channels``. Derived metrics are computed for all rows at once, with the
+same zero-denominator rules as the ``DailyMetrics`` properties.
+"""
+
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class MetricsColumns:
+    day: np.ndarray          # int64
+    channel: np.ndarray      # int32 codes into ``channels``
+    spend: np.ndarray        # float64
+    clicks: np.ndarray       # int64
+    conversions: np.ndarray  # int64
+    channels: List[str]
+    campaign: Optional[np.ndarray] = None  # int32 codes into ``campaigns``
+    campaigns: Optional[List[str]] = None
+
+    @classmethod
+    def from_records(cls, metrics: Iterable) -> "MetricsColumns":
+        """Build columns from ``DailyMetrics`` (or any objects with the same fields)."""
+        metrics = list(metrics)
+        campaign = [getattr(m, "campaign", None) for m in metrics]
+        return cls.from_arrays(
+            day=[m.day for m in metrics],
+            channel=[m.channel for m in metrics],
+            spend=[m.spend for m in metrics],
+            clicks=[m.clicks for m in metrics],
+            conversions=[m.conversions for m in metrics],
+            campaign=campaign if any(c is not None for c in campaign) else None,
+        )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        day: Sequence[int],
+        channel: Sequence[str],
+        spend: Sequence[float],
+        clicks: Sequence[int],
+        conversions: Sequence[int],
+        campaign: Optional[Sequence[Optional[str]]] = None,
+    ) -> "MetricsColumns":
+        """
+        Build columns from parallel sequences; channel and campaign names are encoded.
+
+        A missing (None) campaign is stored as the empty name.
+        """
+        channels, codes = _encode(channel)
+        campaigns, campaign_codes = (None, None) if campaign is None else _encode([c or "" for c in campaign])
+        return cls(
+            day=np.asarray(day, dtype=np.int64),
+            channel=codes,
+            spend=np.asarray(spend, dtype=np.float64),
+            clicks=np.asarray(clicks, dtype=np.int64),
+            conversions=np.asarray(conversions, dtype=np.int64),
+            channels=channels,
+            campaign=campaign_codes,
+            campaigns=campaigns,
+        )
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def take(self, rows: np.ndarray) -> "MetricsColumns":
+        """The given rows, in order; name tables are shared, so codes stay valid."""
+        return MetricsColumns(
+            day=self.day[rows],
+            channel=self.channel[rows],
+            spend=self.spend[rows],
+            clicks=self.clicks[rows],
+            conversions=self.conversions[rows],
+            channels=self.channels,
+            campaign=None if self.campaign is None else self.campaign[rows],
+            campaigns=self.campaigns,
+        )
+
+    def channel_names(self) -> np.ndarray:
+        """Channel name per row."""
+        return np.asarray(self.channels, dtype=object)[self.channel]
+
+    def campaign_names(self) -> np.ndarray:
+        """Campaign name per row (None where unknown)."""
+        if self.campaign is None:
+            return np.full(len(self), None, dtype=object)
+        names = np.asarray([name or None for name in self.campaigns], dtype=object)
+        return names[self.campaign]
+
+    def group_ids(self, by: str) -> Tuple[np.ndarray, int]:
+        """
+        Dense group id per row, and the number of groups.
+
+        ``by`` is ``"global"`` (one group), ``"channel"``, or ``"campaign"``
+        (channel and campaign together; rows without a campaign group by
+        channel alone).
+        """
+        if by == "global":
+            return np.zeros(len(self), dtype=np.int64), 1 if len(self) else 0
+        if by == "channel":
+            return self.channel.astype(np.int64), len(self.channels)
+        if by == "campaign":
+            if self.campaign is None:
+                return self.channel.astype(np.int64), len(self.channels)
+            key = self.channel.astype(np.int64) * len(self.campaigns) + self.campaign
+            keys, ids = np.unique(key, return_inverse=True)
+            return ids.ravel(), len(keys)
+        raise ValueError(f"Unknown baseline grouping '{by}'; expected global, channel or campaign")
+
+    @property
+    def cpc(self) -> np.ndarray:
+        return _safe_divide(self.spend, self.clicks)
+
+    @property
+    def ctr(self) -> np.ndarray:
+        # Assume 10 times clicks as impressions, as DailyMetrics does
+        return _safe_divide(self.clicks, self.clicks * 10)
+
+    @property
+    def cvr(self) -> np.ndarray:
+        return _safe_divide(self.conversions, self.clicks)
+
+    @property
+    def cpa(self) -> np.ndarray:
+        return _safe_divide(self.spend, self.conversions)
+
+
+def _encode(names: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """Sorted distinct names and an int32 code per row."""
+    uniques, codes = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+    return uniques.tolist(), codes.astype(np.int32).ravel()
+
+
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """``numerator / denominator`` where the denominator is positive, else 0.0."""
+    out = np.zeros(len(numerator), dtype=np.float64)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def exact_mean(values: np.ndarray) -> float:
+    """
+    Mean of finite float64 ``values``, bit-for-bit equal to ``statistics.mean``.
+
+    See :func:`grouped_exact_mean`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        raise ValueError("exact_mean requires at least one value")
+    return float(grouped_exact_mean(values, np.zeros(len(values), dtype=np.int64), 1)[0])
+
+
+def grouped_exact_mean(values: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    Mean of ``values`` per group id in ``range(n_groups)``, each equal to ``statistics.mean``.
+
+    ``statistics.mean`` sums exactly and rounds once, which a NumPy sum does
+    not. Each value is split into a 53-bit integer mantissa and an exponent.
+    One sort orders rows by (group, exponent), mantissas are summed exactly
+    in int64 per run, and only one Python int per run is combined. Groups
+    with no values get NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    means = np.full(n_groups, np.nan)
+    if len(values) == 0:
+        return means
+    mantissa, exponent = np.frexp(values)
+    ints = np.ldexp(mantissa, 53).astype(np.int64)
+    order = np.lexsort((exponent, groups))
+    groups, exponent, ints = groups[order], exponent[order], ints[order]
+    starts = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (exponent[1:] != exponent[:-1])])
+    # Split into 27-bit high and 26-bit low halves so the sums cannot overflow.
+    hi = np.add.reduceat(ints >> 26, starts)
+    lo = np.add.reduceat(ints & ((1 << 26) - 1), starts)
+    counts = np.bincount(groups, minlength=n_groups)
+
+    run_groups = groups[starts].tolist()
+    run_exps = exponent[starts].tolist()
+    run_sums = [(h << 26) + l for h, l in zip(hi.tolist(), lo.tolist())]
+    i = 0
+    while i < len(run_groups):
+        group, base = run_groups[i], run_exps[i] - 53
+        total = 0
+        while i < len(run_groups) and run_groups[i] == group:
+            total += run_sums[i] << (run_exps[i] - 53 - base)
+            i += 1
+        n = int(counts[group])
+        means[group] = float(Fraction(total << base, n) if base >= 0 else Fraction(total, n << -base))
+    return means
+
+
+def grouped_median(values: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """Median of ``values`` per group id in ``range(n_groups)`` from one sort; empty groups get NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    medians = np.full(n_groups, np.nan)
+    if len(values) == 0:
+        return medians
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    present = counts > 0
+    lo = starts[present] + (counts[present] - 1) // 2
+    hi = starts[present] + counts[present] // 2
+    medians[present] = (ordered[lo] + ordered[hi]) / 2
+    return medians
@@ -0,0 +1,173 @@
+"""Sharded multi-process anomaly detection.
+
+Every check compares a row only with rows of its own series, so detection
+splits cleanly by series. ``detect_parallel`` hash-partitions rows by series
+key into shards and runs ``AnomalyDetector.evaluate`` on each shard in a
+process pool.
+
+Columns are not pickled per task. The parent copies them once into a single
+``multiprocessing.shared_memory`` block, ordered by shard, and each task only
+receives the block name and its row range. Results are mapped back to the
+original row numbers and merged in row order, so the output is identical to
+``detector.detect`` whatever the worker count or scheduling.
+"""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from itertools import starmap
+from multiprocessing import shared_memory
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .anomaly_pacing_agent import Anomaly, AnomalyDetector, DailyMetrics
+from .columnar import MetricsColumns
+
+# (name, dtype) of each column in the shared block, in layout order.
+_COLUMNS = (
+    ("day", np.int64),
+    ("spend", np.float64),
+    ("clicks", np.int64),
+    ("conversions", np.int64),
+    ("channel", np.int32),
+    ("campaign", np.int32),
+)
+
+# Anomalies cross the process boundary as plain field tuples, which pickle
+# several times faster than dataclass instances.
+_anomaly_fields = attrgetter(*(f.name for f in fields(Anomaly)))
+
+_worker_detector: Optional[AnomalyDetector] = None
+_worker_names: Tuple[List[str], Optional[List[str]]] = ([], None)
+
+
+def _init_worker(detector: AnomalyDetector, channels: List[str], campaigns: Optional[List[str]]) -> None:
+    global _worker_detector, _worker_names
+    _worker_detector = detector
+    _worker_names = (channels, campaigns)
+
+
+def _detect_shard(block: str, n_rows: int, start: int, stop: int) -> Tuple[np.ndarray, List[tuple]]:
+    shm = shared_memory.SharedMemory(name=block)
+    try:
+        arrays = _views(shm, n_rows)
+        # Copy this shard's slice out so no view outlives the mapping.
+        shard = {name: array[start:stop].copy() for name, array in arrays.items()}
+        del arrays
+    finally:
+        shm.close()
+    channels, campaigns = _worker_names
+    columns = MetricsColumns(
+        day=shard["day"],
+        channel=shard["channel"],
+        spend=shard["spend"],
+        clicks=shard["clicks"],
+        conversions=shard["conversions"],
+        channels=channels,
+        campaign=shard["campaign"] if campaigns is not None else None,
+        campaigns=campaigns,
+    )
+    rows, anomalies = _worker_detector.evaluate(columns)
+    return rows, list(map(_anomaly_fields, anomalies))
+
+
+def _views(shm: shared_memory.SharedMemory, n_rows: int) -> Dict[str, np.ndarray]:
+    arrays, offset = {}, 0
+    for name, dtype in _COLUMNS:
+        arrays[name] = np.ndarray((n_rows,), dtype=dtype, buffer=shm.buf, offset=offset)
+        offset += n_rows * np.dtype(dtype).itemsize
+    return arrays
+
+
+def _block_size(n_rows: int) -> int:
+    return max(1, sum(n_rows * np.dtype(dtype).itemsize for _, dtype in _COLUMNS))
+
+
+def series_shards(detector: AnomalyDetector, columns: MetricsColumns, n_shards: int) -> np.ndarray:
+    """
+    Shard number per row, from a stable hash of the row's series key.
+
+    Rows are keyed by channel, or by channel and campaign when every
+    strategy of ``detector`` groups by campaign. A series never spans two
+    shards. Raises ValueError when any strategy uses the global baseline,
+    which needs every row at once.
+    """
+    groupings = {getattr(s, "group_by", None) or detector.baseline_by for s in detector.strategies}
+    if "global" in groupings:
+        raise ValueError("A global baseline needs every row at once and cannot be sharded")
+    channel_hash = np.array([zlib.crc32(name.encode()) for name in columns.channels], dtype=np.int64)
+    if groupings == {"campaign"} and columns.campaign is not None:
+        campaign_hash = np.array([zlib.crc32(name.encode()) for name in columns.campaigns], dtype=np.int64)
+        key_hash = channel_hash[columns.channel] * 31 + campaign_hash[columns.campaign]
+    else:
+        key_hash = channel_hash[columns.channel]
+    return key_hash % n_shards
+
+
+def detect_parallel(
+    detector: AnomalyDetector,
+    metrics: Union[List[DailyMetrics], MetricsColumns],
+    workers: Optional[int] = None,
+    n_shards: Optional[int] = None,
+) -> List[Anomaly]:
+    """
+    Run ``detector.detect`` over shards of ``metrics`` in a process pool.
+
+    Returns exactly what ``detector.detect(metrics)`` would, in the same
+    order.
+
+    Args:
+        detector: Detector (with its strategies) sent to each worker once.
+        metrics: ``DailyMetrics`` records or :class:`MetricsColumns`.
+        workers: Process count (default: ``os.cpu_count()``).
+        n_shards: Hash partitions (default: ``4 * workers``). More shards than
+            workers balance uneven series sizes.
+    """
+    columns = metrics if isinstance(metrics, MetricsColumns) else MetricsColumns.from_records(metrics)
+    workers = workers or os.cpu_count() or 1
+    n_shards = n_shards or 4 * workers
+    if n_shards < 1:
+        raise ValueError("n_shards must be at least 1")
+    n_rows = len(columns)
+    if n_rows == 0:
+        return []
+
+    shards = series_shards(detector, columns, n_shards)
+    order = np.argsort(shards, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(shards, minlength=n_shards))])
+    ranges = [(int(bounds[i]), int(bounds[i + 1])) for i in range(n_shards) if bounds[i + 1] > bounds[i]]
+
+    shm = shared_memory.SharedMemory(create=True, size=_block_size(n_rows))
+    try:
+        arrays = _views(shm, n_rows)
+        for name, _ in _COLUMNS:
+            source = getattr(columns, name)
+            if source is None:
+                arrays[name][:] = 0
+            else:
+                np.take(source, order, out=arrays[name])
+        del arrays
+
+        initargs = (detector, columns.channels, columns.campaigns)
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            futures = [pool.submit(_detect_shard, shm.name, n_rows, start, stop) for start, stop in ranges]
+            results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    found: List[tuple] = []
+    found_rows = []
+    for (start, _), (rows, anomalies) in zip(ranges, results):
+        found_rows.append(order[start + rows])
+        found.extend(anomalies)
+    if not found:
+        return []
+    # Each row lives in one shard, so a stable sort by original row keeps
+    # the per-row strategy and check order from that shard.
+    position = np.argsort(np.concatenate(found_rows), kind="stable")
+    return list(starmap(Anomaly, (found[i] for i in position.tolist())))
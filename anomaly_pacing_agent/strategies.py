@@ -0,0 +1,192 @@
+"""Statistical detection strategies for ``AnomalyDetector``.
+
+The default :class:`GuardrailRules` compare against fixed percentages. The
+strategies here judge each value against its own series instead, which
+alerts less often on series that are simply noisy:
+
+- :class:`RobustZScore`: distance from the series median in units of the
+  median absolute deviation (MAD), which a few outliers cannot inflate.
+- :class:`SeasonalBaseline`: deviation from the same weekday over the
+  previous N weeks.
+
+Both run over every series at once, with sorts and searches over whole
+columns rather than a loop per series.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from anomaly_pacing_agent.anomaly_pacing_agent import (
+    Anomaly,
+    AnomalyDetector,
+    Check,
+    DetectionStrategy,
+    build_anomalies,
+)
+from anomaly_pacing_agent.columnar import MetricsColumns, grouped_median
+
+# The direction that counts as bad for each metric.
+METRIC_DIRECTIONS: Dict[str, Tuple[str, ...]] = {
+    "spend": ("up", "down"),
+    "cpa": ("up",),
+    "ctr": ("down",),
+    "cvr": ("down",),
+}
+
+
+def metric_values(columns: MetricsColumns, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+    """``(values, valid)`` for one metric; ratios are only valid with a non-zero denominator."""
+    if metric == "spend":
+        return columns.spend, np.ones(len(columns), dtype=bool)
+    if metric in ("ctr", "cvr"):
+        return getattr(columns, metric), columns.clicks > 0
+    if metric == "cpa":
+        return columns.cpa, columns.conversions > 0
+    raise ValueError(f"Unknown metric '{metric}'; expected one of {tuple(METRIC_DIRECTIONS)}")
+
+
+def _directional_checks(
+    metric: str,
+    flagged: np.ndarray,
+    values: np.ndarray,
+    baseline: np.ndarray,
+    deviation_pct: np.ndarray,
+    severity: np.ndarray,
+    reasons: Dict[str, str],
+) -> List[Check]:
+    checks: List[Check] = []
+    for direction in METRIC_DIRECTIONS[metric]:
+        mask = flagged & ((values > baseline) if direction == "up" else (values < baseline))
+        checks.append(
+            (metric, mask, values[mask], baseline[mask], np.abs(deviation_pct[mask]), direction,
+             severity[mask], reasons[direction])
+        )
+    return checks
+
+
+class RobustZScore(DetectionStrategy):
+    """
+    Flag values more than ``threshold`` robust standard deviations from the series median.
+
+    The robust z-score is ``0.6745 * (x - median) / MAD``. Series with fewer
+    than ``min_points`` values, or a MAD of 0, are not checked. Anomalies
+    above ``2 * threshold`` are critical, the rest warnings.
+
+    Args:
+        metrics: Metrics to check (spend, ctr, cvr, cpa).
+        threshold: Robust z-score needed to flag a value (3.5 is conventional).
+        min_points: Minimum values in a series before it is checked.
+        group_by: Series grouping; defaults to the detector's ``baseline_by``.
+    """
+
+    def __init__(
+        self,
+        metrics: Sequence[str] = ("spend", "cpa", "cvr"),
+        threshold: float = 3.5,
+        min_points: int = 5,
+        group_by: Optional[str] = None,
+    ) -> None:
+        self.metrics = tuple(metrics)
+        self.threshold = threshold
+        self.min_points = min_points
+        self.group_by = group_by
+
+    def evaluate(self, detector: AnomalyDetector, columns: MetricsColumns) -> Tuple[np.ndarray, List[Anomaly]]:
+        groups, n_groups = columns.group_ids(self.group_by or detector.baseline_by)
+        checks: List[Check] = []
+        for metric in self.metrics:
+            values, valid = metric_values(columns, metric)
+            g, v = groups[valid], values[valid]
+            median = grouped_median(v, g, n_groups)
+            mad = grouped_median(np.abs(v - median[g]), g, n_groups)
+            counts = np.bincount(g, minlength=n_groups)
+
+            row_median, row_mad = median[groups], mad[groups]
+            checked = valid & (counts[groups] >= self.min_points) & (row_mad > 0)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                z = np.where(checked, 0.6745 * (values - row_median) / row_mad, 0.0)
+                deviation = np.where(row_median != 0, (values - row_median) / row_median * 100, 0.0)
+            flagged = np.abs(z) > self.threshold
+            severity = np.where(np.abs(z) > 2 * self.threshold, "critical", "warning")
+            checks.extend(_directional_checks(metric, flagged, values, row_median, deviation, severity, {
+                "up": f"{metric.upper()} far above its series median (robust z-score).",
+                "down": f"{metric.upper()} far below its series median (robust z-score).",
+            }))
+        return build_anomalies(columns, checks)
+
+
+class SeasonalBaseline(DetectionStrategy):
+    """
+    Compare each value with the same weekday over the previous ``weeks`` weeks.
+
+    The baseline is the mean of the series' values ``period``, ``2 * period``,
+    ... ``weeks * period`` days earlier (rows of a series on the same day are
+    averaged first). A row needs at least ``min_weeks`` of those before it is
+    checked. Deviations beyond ``threshold_pct`` are flagged, and beyond
+    twice that are critical.
+
+    Args:
+        metrics: Metrics to check (spend, ctr, cvr, cpa).
+        weeks: Past weeks to average.
+        min_weeks: Minimum past weeks present for a row to be checked.
+        threshold_pct: Percent deviation from the baseline needed to flag.
+        period: Season length in days.
+        group_by: Series grouping; defaults to the detector's ``baseline_by``.
+    """
+
+    def __init__(
+        self,
+        metrics: Sequence[str] = ("spend", "cpa", "cvr"),
+        weeks: int = 4,
+        min_weeks: int = 2,
+        threshold_pct: float = 30.0,
+        period: int = 7,
+        group_by: Optional[str] = None,
+    ) -> None:
+        self.metrics = tuple(metrics)
+        self.weeks = weeks
+        self.min_weeks = min_weeks
+        self.threshold_pct = threshold_pct
+        self.period = period
+        self.group_by = group_by
+
+    def evaluate(self, detector: AnomalyDetector, columns: MetricsColumns) -> Tuple[np.ndarray, List[Anomaly]]:
+        groups, _ = columns.group_ids(self.group_by or detector.baseline_by)
+        day = columns.day - columns.day.min() if len(columns) else columns.day
+        span = int(day.max()) + 1 if len(columns) else 1
+        # One integer key per (series, day); the key of the same weekday k
+        # weeks earlier is key - k * period.
+        keys = groups * span + day
+
+        checks: List[Check] = []
+        for metric in self.metrics:
+            values, valid = metric_values(columns, metric)
+            unique_keys, inverse = np.unique(keys[valid], return_inverse=True)
+            inverse = inverse.ravel()
+            daily = np.bincount(inverse, weights=values[valid]) / np.bincount(inverse)
+
+            total = np.zeros(len(columns))
+            present = np.zeros(len(columns), dtype=np.int64)
+            for k in range(1, self.weeks + 1):
+                lag = k * self.period
+                target = keys - lag
+                idx = np.searchsorted(unique_keys, target)
+                idx_safe = np.minimum(idx, max(len(unique_keys) - 1, 0))
+                found = (day >= lag) & (idx < len(unique_keys))
+                if len(unique_keys):
+                    found &= unique_keys[idx_safe] == target
+                total += np.where(found, daily[idx_safe] if len(unique_keys) else 0.0, 0.0)
+                present += found
+
+            checked = valid & (present >= max(self.min_weeks, 1))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                baseline = np.where(checked, total / np.maximum(present, 1), np.nan)
+                deviation = np.where(checked & (baseline != 0), (values - baseline) / baseline * 100, 0.0)
+            flagged = checked & (np.abs(deviation) > self.threshold_pct)
+            severity = np.where(np.abs(deviation) > 2 * self.threshold_pct, "critical", "warning")
+            checks.extend(_directional_checks(metric, flagged, values, baseline, deviation, severity, {
+                "up": f"{metric.upper()} above the same weekday over the past {self.weeks} weeks.",
+                "down": f"{metric.upper()} below the same weekday over the past {self.weeks} weeks.",
+            }))
+        return build_anomalies(columns, checks)
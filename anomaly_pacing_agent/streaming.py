@@ -0,0 +1,303 @@
+"""Incremental anomaly detection over rolling windows.
+
+``AnomalyDetector.detect`` sees a whole history at once. For hourly or daily
+feeds, ``StreamingAnomalyDetector`` keeps a bounded window of recent values
+per (group, metric) series. Each batch is checked against that window and
+then added to it, so memory stays flat no matter how long the feed runs.
+
+Detector state can be checkpointed to a single ``.npz`` file and restored
+without replaying history.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from anomaly_pacing_agent.anomaly_pacing_agent import Anomaly, AnomalyDetector, DailyMetrics
+from anomaly_pacing_agent.columnar import MetricsColumns
+
+
+class RollingStats:
+    """
+    Mean and variance of the last ``window`` values for many keyed series.
+
+    Each series owns a fixed ring buffer. Statistics are updated with the
+    sliding-window form of Welford's algorithm, so adding a value costs O(1)
+    and never rescans the window. State lives in flat NumPy arrays (one row
+    per series) so that batches update many series at once.
+    """
+
+    def __init__(self, window: int) -> None:
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.keys: List[Hashable] = []
+        self._slot: Dict[Hashable, int] = {}
+        self.buffer = np.zeros((0, window))
+        self.count = np.zeros(0, dtype=np.int64)
+        self.pos = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def slots(self, keys: Iterable[Hashable], create: bool = True) -> np.ndarray:
+        """Row index per key; unknown keys get a new row, or -1 with ``create=False``."""
+        out = []
+        for key in keys:
+            slot = self._slot.get(key)
+            if slot is None:
+                if not create:
+                    out.append(-1)
+                    continue
+                slot = self._slot[key] = len(self.keys)
+                self.keys.append(key)
+            out.append(slot)
+        if len(self.keys) > len(self.count):
+            self._grow(len(self.keys))
+        return np.asarray(out, dtype=np.int64)
+
+    def _grow(self, needed: int) -> None:
+        capacity = max(needed, 2 * len(self.count), 16)
+        extra = capacity - len(self.count)
+        self.buffer = np.vstack([self.buffer, np.zeros((extra, self.window))])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.pos = np.concatenate([self.pos, np.zeros(extra, dtype=np.int64)])
+        self.mean = np.concatenate([self.mean, np.zeros(extra)])
+        self.m2 = np.concatenate([self.m2, np.zeros(extra)])
+
+    def push(self, slots: np.ndarray, values: np.ndarray) -> None:
+        """Append ``values`` to their series, in order, evicting the oldest when full."""
+        slots = np.asarray(slots, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(slots) == 0:
+            return
+        # A series may appear several times in one batch. Its n-th occurrence
+        # goes in round n, so within a round every slot is distinct.
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        first = np.r_[True, sorted_slots[1:] != sorted_slots[:-1]]
+        run_start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - run_start
+        for r in range(int(rank.max()) + 1):
+            chosen = rank == r
+            self._push_unique(slots[chosen], values[chosen])
+
+    def _push_unique(self, s: np.ndarray, x: np.ndarray) -> None:
+        n = self.count[s]
+        pos = self.pos[s]
+        old_mean = self.mean[s]
+        full = n == self.window
+        evicted = self.buffer[s, pos]
+
+        grow_n = np.where(full, self.window, n + 1)
+        # Growing: mean += (x - mean) / (n + 1). Full: the evicted value y
+        # leaves, so mean += (x - y) / window.
+        delta = np.where(full, x - evicted, x - old_mean)
+        new_mean = old_mean + delta / grow_n
+        self.m2[s] += np.where(
+            full,
+            (x - evicted) * (x - new_mean + evicted - old_mean),
+            (x - old_mean) * (x - new_mean),
+        )
+        self.mean[s] = new_mean
+        self.count[s] = grow_n
+        self.buffer[s, pos] = x
+        self.pos[s] = (pos + 1) % self.window
+
+    def state_arrays(self) -> Dict[str, np.ndarray]:
+        """The live state as plain arrays, for checkpointing; keys are saved separately."""
+        n = len(self.keys)
+        return {
+            "buffer": self.buffer[:n],
+            "count": self.count[:n],
+            "pos": self.pos[:n],
+            "mean": self.mean[:n],
+            "m2": self.m2[:n],
+        }
+
+    @classmethod
+    def from_state_arrays(cls, window: int, keys: List[Hashable], arrays: Dict[str, np.ndarray]) -> "RollingStats":
+        """Rebuild from ``keys`` (in slot order) and :meth:`state_arrays` output."""
+        stats = cls(window)
+        stats.keys = list(keys)
+        stats._slot = {key: i for i, key in enumerate(stats.keys)}
+        stats.buffer = np.array(arrays["buffer"], dtype=np.float64).reshape(len(stats.keys), window)
+        stats.count = np.array(arrays["count"], dtype=np.int64)
+        stats.pos = np.array(arrays["pos"], dtype=np.int64)
+        stats.mean = np.array(arrays["mean"], dtype=np.float64)
+        stats.m2 = np.array(arrays["m2"], dtype=np.float64)
+        return stats
+
+    def stats(self, slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(mean, sample std, count)`` per slot; missing slots (-1) and empty series give NaN/0."""
+        slots = np.asarray(slots, dtype=np.int64)
+        count = np.zeros(len(slots), dtype=np.int64)
+        mean = np.full(len(slots), np.nan)
+        var = np.full(len(slots), np.nan)
+        known = np.flatnonzero(slots >= 0)
+        s = slots[known]
+        n = self.count[s]
+        count[known] = n
+        mean[known] = np.where(n > 0, self.mean[s], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            var[known] = np.where(n > 1, np.maximum(self.m2[s], 0.0) / (n - 1), np.nan)
+        return mean, np.sqrt(var), count
+
+
+class StreamingAnomalyDetector(AnomalyDetector):
+    """
+    Anomaly detection that ingests one record or one day at a time.
+
+    Absolute rules (spend pacing, CPA, CVR) are applied as in
+    :class:`AnomalyDetector`. The relative CTR rule compares each row with
+    the rolling mean of the last ``window`` CTR values of its group, taken
+    *before* the row's batch is added. A group needs ``min_periods`` prior
+    values before it is checked.
+
+    Rolling statistics are kept per (group, metric) for spend, CTR, CVR and
+    CPA; see :meth:`baseline`.
+    """
+
+    METRICS = ("spend", "ctr", "cvr", "cpa")
+    STATE_VERSION = 1
+
+    def __init__(
+        self,
+        daily_budget: float,
+        max_cpa: float,
+        min_ctr: float,
+        min_cvr: float,
+        baseline_by: str = "channel",
+        window: int = 14,
+        min_periods: int = 3,
+    ) -> None:
+        super().__init__(daily_budget, max_cpa, min_ctr, min_cvr, baseline_by=baseline_by)
+        self.window = window
+        self.min_periods = min_periods
+        self.stats: Dict[str, RollingStats] = {metric: RollingStats(window) for metric in self.METRICS}
+
+    def group_key(self, channel: str, campaign) -> Hashable:
+        if self.baseline_by == "global":
+            return "*"
+        if self.baseline_by == "campaign":
+            return (channel, campaign)
+        return channel
+
+    def update(self, record: DailyMetrics) -> List[Anomaly]:
+        """Check one record against the current window, then add it."""
+        return self.update_batch([record])
+
+    def update_batch(self, metrics) -> List[Anomaly]:
+        """
+        Check a batch (e.g. one day or one hourly feed), then add it to the windows.
+
+        Rows in the same batch do not affect each other's baselines.
+        Accepts ``DailyMetrics`` records or :class:`MetricsColumns`.
+        """
+        columns = metrics if isinstance(metrics, MetricsColumns) else MetricsColumns.from_records(metrics)
+        if len(columns) == 0:
+            return []
+        keys = [
+            self.group_key(channel, campaign)
+            for channel, campaign in zip(columns.channel_names().tolist(), columns.campaign_names().tolist())
+        ]
+
+        ctr_mean, _, ctr_count = self.stats["ctr"].stats(self.stats["ctr"].slots(keys, create=False))
+        baseline = np.where(ctr_count >= max(self.min_periods, 1), ctr_mean, 0.0)
+        anomalies = self.check_rules(columns, baseline)
+
+        has_clicks = columns.clicks > 0
+        has_conversions = columns.conversions > 0
+        key_array = np.empty(len(keys), dtype=object)
+        key_array[:] = keys
+        for metric, mask, values in (
+            ("spend", np.ones(len(columns), dtype=bool), columns.spend),
+            ("ctr", has_clicks, columns.ctr),
+            ("cvr", has_clicks, columns.cvr),
+            ("cpa", has_conversions, columns.cpa),
+        ):
+            stats = self.stats[metric]
+            stats.push(stats.slots(key_array[mask].tolist()), values[mask])
+        return anomalies
+
+    def baseline(self, metric: str, channel: str, campaign=None) -> Tuple[float, float, int]:
+        """Rolling ``(mean, std, count)`` for one series; NaN when there is not enough data."""
+        stats = self.stats[metric]
+        mean, std, count = stats.stats(stats.slots([self.group_key(channel, campaign)], create=False))
+        return float(mean[0]), float(std[0]), int(count[0])
+
+    def save_state(self, path: Path) -> None:
+        """
+        Checkpoint thresholds and rolling statistics to one ``.npz`` file.
+
+        The file is written next to ``path`` and renamed into place, so a
+        crash mid-write never leaves a truncated checkpoint behind.
+        """
+        path = Path(path)
+        config = {
+            "version": self.STATE_VERSION,
+            "daily_budget": self.daily_budget,
+            "max_cpa": self.max_cpa,
+            "min_ctr": self.min_ctr,
+            "min_cvr": self.min_cvr,
+            "baseline_by": self.baseline_by,
+            "window": self.window,
+            "min_periods": self.min_periods,
+        }
+        # Series keys are shared across metrics: store one JSON key table and,
+        # per metric, each slot's index into it.
+        table: Dict[Hashable, int] = {}
+        for stats in self.stats.values():
+            for key in stats.keys:
+                table.setdefault(key, len(table))
+        arrays = {"config": np.asarray(json.dumps(config)), "keys": np.asarray(json.dumps(list(table)))}
+        for metric, stats in self.stats.items():
+            arrays[f"{metric}.key_index"] = np.fromiter((table[k] for k in stats.keys), dtype=np.int64)
+            for name, array in stats.state_arrays().items():
+                arrays[f"{metric}.{name}"] = array
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_state(cls, path: Path) -> Optional["StreamingAnomalyDetector"]:
+        """
+        Restore a detector saved by :meth:`save_state`.
+
+        Returns None if the file is missing or was written by another state
+        format version, in which case the caller starts from an empty window.
+        """
+        path = Path(path)
+        if not path.is_file():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            config = json.loads(data["config"].item())
+            if config.get("version") != cls.STATE_VERSION:
+                return None
+            detector = cls(
+                config["daily_budget"],
+                config["max_cpa"],
+                config["min_ctr"],
+                config["min_cvr"],
+                baseline_by=config["baseline_by"],
+                window=config["window"],
+                min_periods=config["min_periods"],
+            )
+            # JSON turns tuple keys into lists; restore them as hashable tuples.
+            table = [tuple(key) if isinstance(key, list) else key for key in json.loads(data["keys"].item())]
+            for metric in cls.METRICS:
+                arrays = {
+                    name.split(".", 1)[1]: data[name] for name in data.files if name.startswith(f"{metric}.")
+                }
+                keys = [table[i] for i in arrays.pop("key_index").tolist()]
+                detector.stats[metric] = RollingStats.from_state_arrays(detector.window, keys, arrays)
+        return detector
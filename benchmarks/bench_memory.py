@@ -0,0 +1,97 @@
+"""Bytes per record for 1M daily metrics: plain dataclass vs slotted vs columnar.
+
+Run from the repository root:
+
+    python benchmarks/bench_memory.py --records 1000000
+"""
+
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from anomaly_pacing_agent import Anomaly, DailyMetrics, MetricsColumns
+
+
+@dataclass
+class PlainDailyMetrics:
+    """The previous, ``__dict__``-backed layout, for comparison."""
+
+    day: int
+    channel: str
+    spend: float
+    clicks: int
+    conversions: int
+    campaign: Optional[str] = None
+
+
+@dataclass
+class PlainAnomaly:
+    day: int
+    channel: str
+    metric: str
+    value: float
+    baseline: float
+    deviation_pct: float
+    direction: str
+    severity: str
+    reason: str
+    campaign: Optional[str] = None
+
+
+def measure(build: Callable[[], object]) -> int:
+    """Bytes still allocated after ``build()`` returns (the object is kept alive)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Memory per record for metric containers.")
+    parser.add_argument("--records", type=int, default=1_000_000, help="Records to build (default: 1000000)")
+    args = parser.parse_args()
+    n = args.records
+
+    rng = random.Random(0)
+    channels = ["email", "paid_search", "paid_social", "display"]
+    rows = [
+        (rng.randint(1, 90), rng.choice(channels), rng.uniform(100, 2000), rng.randint(0, 5000), rng.randint(0, 100))
+        for _ in range(n)
+    ]
+
+    def records(cls) -> Callable[[], List]:
+        # Copy the numbers so every record owns its values, as parsed input would.
+        return lambda: [cls(d, c, s + 0.0, k + 0, v + 0) for d, c, s, k, v in rows]
+
+    def anomalies(cls) -> Callable[[], List]:
+        return lambda: [
+            cls(d, c, "spend", s + 0.0, 1000.0, s / 10, "up", "warning", "Spend is above daily budget target.")
+            for d, c, s, _, _ in rows
+        ]
+
+    cases = [
+        ("DailyMetrics (plain dataclass)", records(PlainDailyMetrics)),
+        ("DailyMetrics (slots, frozen)", records(DailyMetrics)),
+        ("MetricsColumns", lambda: MetricsColumns.from_arrays(*zip(*rows))),
+        ("Anomaly (plain dataclass)", anomalies(PlainAnomaly)),
+        ("Anomaly (slots)", anomalies(Anomaly)),
+    ]
+    print(f"{'container':<32} {'bytes/record':>12} {'total MB':>10}")
+    for name, build in cases:
+        size = measure(build)
+        print(f"{name:<32} {size / n:>12.1f} {size / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
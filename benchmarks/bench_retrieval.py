@@ -0,0 +1,37 @@
+"""Recall vs. latency of IVFBackend against exact search on a synthetic corpus.
+
+Run from the repository root:
+
+    python benchmarks/bench_retrieval.py --campaigns 100000 --probes 1 4 8
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.workloads import synthetic_corpus
+from rag_campaign_insight_agent.retrieval import IVFBackend, benchmark_recall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall vs. latency of IVFBackend against exact search.")
+    parser.add_argument("--campaigns", type=int, default=50000, help="Synthetic corpus size (default: 50000)")
+    parser.add_argument("--top-n", type=int, default=10, help="Results per query (default: 10)")
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16], help="n_probe values to try")
+    parser.add_argument("--rerank-factor", type=int, default=32, help="Candidates re-scored per result (default: 32)")
+    args = parser.parse_args()
+
+    corpus, briefs = synthetic_corpus(args.campaigns)
+    for n_probe in args.probes:
+        backend = IVFBackend(n_probe=n_probe, rerank_factor=args.rerank_factor)
+        stats = benchmark_recall(corpus, backend, briefs, top_n=args.top_n)
+        print(
+            f"n_probe={n_probe:<3} recall@{args.top_n}={stats['recall']:.3f} "
+            f"exact={stats['exact_ms']:.2f}ms ann={stats['ann_ms']:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Benchmark suite for the three agents, with JSON baselines and regression checks.
+
+Workloads (all synthetic, no LLM calls):
+
+- ``utm.check_rules[N]``: rules-only UTM checks (``run_check`` without the LLM)
+  over N URLs.
+- ``rag.corpus_build[N]`` and ``rag.most_similar[N]``: building a
+  ``CampaignCorpus`` and querying it at N campaigns.
+- ``anomaly.detect[N]``: ``AnomalyDetector.detect`` over N metric rows.
+
+Each workload reports its best wall time over ``--repeat`` runs, throughput,
+and peak traced memory from one extra run under ``tracemalloc``.
+
+Run from the repository root:
+
+    python benchmarks/run_benchmarks.py --preset default --save benchmarks/baselines/default.json
+    python benchmarks/run_benchmarks.py --preset default --baseline benchmarks/baselines/default.json
+
+With ``--baseline``, the exit status is 1 if any workload is slower than
+the baseline by more than ``--threshold``, or uses more peak memory than
+``--memory-threshold`` allows. Baselines are only comparable on the same
+machine.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ai_utm_qa_agent import UTMQAAgent
+from anomaly_pacing_agent import AnomalyDetector
+from benchmarks.workloads import synthetic_campaigns, synthetic_metrics, synthetic_urls
+from rag_campaign_insight_agent.rag_campaign_insight_agent import CampaignCorpus
+
+TAXONOMY_PATH = Path(__file__).resolve().parent.parent / "ai_utm_qa_agent" / "utm_taxonomy.json"
+
+PRESETS: Dict[str, Dict[str, List[int]]] = {
+    "smoke": {"utm": [2_000], "corpus": [1_000], "detect": [10_000]},
+    "default": {"utm": [50_000], "corpus": [1_000, 100_000], "detect": [10_000, 100_000, 1_000_000]},
+    "full": {
+        "utm": [1_000_000],
+        "corpus": [1_000, 100_000, 1_000_000],
+        "detect": [10_000, 100_000, 1_000_000, 10_000_000],
+    },
+}
+
+
+@dataclass
+class Workload:
+    """``setup`` prepares inputs (untimed) and returns the callable to time."""
+
+    name: str
+    items: int
+    setup: Callable[[], Callable[[], object]]
+
+
+def _label(n: int) -> str:
+    for size, suffix in ((1_000_000, "M"), (1_000, "k")):
+        if n >= size and n % size == 0:
+            return f"{n // size}{suffix}"
+    return str(n)
+
+
+def build_workloads(sizes: Dict[str, List[int]]) -> List[Workload]:
+    workloads = []
+
+    for n in sizes.get("utm", []):
+        def utm_setup(n=n):
+            agent = UTMQAAgent(str(TAXONOMY_PATH))
+            urls = synthetic_urls(n)
+            return lambda: agent.run_batch(urls, rules_only=True)
+
+        workloads.append(Workload(f"utm.check_rules[{_label(n)}]", n, utm_setup))
+
+    for n in sizes.get("corpus", []):
+        def build_setup(n=n):
+            campaigns, _ = synthetic_campaigns(n)
+            return lambda: CampaignCorpus(campaigns)
+
+        def search_setup(n=n):
+            campaigns, briefs = synthetic_campaigns(n)
+            corpus = CampaignCorpus(campaigns)
+            corpus.most_similar(briefs[0])  # warm up lazy state
+            return lambda: [corpus.most_similar(brief, top_n=10) for brief in briefs]
+
+        workloads.append(Workload(f"rag.corpus_build[{_label(n)}]", n, build_setup))
+        workloads.append(Workload(f"rag.most_similar[{_label(n)}]", 50, search_setup))
+
+    for n in sizes.get("detect", []):
+        def detect_setup(n=n):
+            detector = AnomalyDetector(daily_budget=1_000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03)
+            columns = synthetic_metrics(n)
+            return lambda: detector.detect(columns)
+
+        workloads.append(Workload(f"anomaly.detect[{_label(n)}]", n, detect_setup))
+
+    return workloads
+
+
+def measure(workload: Workload, repeat: int = 3, memory: bool = True) -> Dict[str, float]:
+    """Best-of-``repeat`` seconds, throughput and (optionally) peak traced MB for one workload."""
+    run = workload.setup()
+    times = []
+    for _ in range(max(1, repeat)):
+        gc.collect()
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+        del result
+    best = min(times)
+    stats = {"seconds": best, "items": workload.items, "items_per_sec": workload.items / best if best else 0.0}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        result = run()
+        stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        del result
+    return stats
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float = 0.2,
+    memory_threshold: float = 0.2,
+    min_delta_seconds: float = 0.005,
+) -> List[str]:
+    """
+    Describe every regression of ``results`` against ``baseline``.
+
+    A workload regresses when it is more than ``threshold`` (a fraction)
+    slower and more than ``min_delta_seconds`` slower in absolute terms,
+    which keeps timer noise on tiny workloads from failing the run. Peak
+    memory regresses past ``memory_threshold``. Workloads missing from
+    either side are ignored.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = current["seconds"] - base["seconds"]
+        if current["seconds"] > base["seconds"] * (1 + threshold) and slower > min_delta_seconds:
+            regressions.append(
+                f"{name}: {current['seconds']:.4f}s vs baseline {base['seconds']:.4f}s "
+                f"(+{slower / base['seconds']:.0%})"
+            )
+        if "peak_mb" in current and "peak_mb" in base and base["peak_mb"] > 0:
+            if current["peak_mb"] > base["peak_mb"] * (1 + memory_threshold):
+                regressions.append(
+                    f"{name}: peak {current['peak_mb']:.1f}MB vs baseline {base['peak_mb']:.1f}MB "
+                    f"(+{current['peak_mb'] / base['peak_mb'] - 1:.0%})"
+                )
+    return regressions
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+    }
+
+
+def save_results(path: Path, results: Dict[str, Dict[str, float]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"environment": environment(), "results": results}, indent=2) + "\n")
+
+
+def load_results(path: Path) -> Dict[str, Dict[str, float]]:
+    return json.loads(path.read_text())["results"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agents and check for regressions.")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="default", help="Workload sizes")
+    parser.add_argument("--utm-urls", type=int, nargs="+", help="Override UTM input counts")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", help="Override campaign corpus sizes")
+    parser.add_argument("--detect-rows", type=int, nargs="+", help="Override anomaly row counts")
+    parser.add_argument("--only", help="Run only workloads whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per workload; the best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak-memory run")
+    parser.add_argument("--save", type=Path, help="Write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="Compare against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown fraction (default: 0.2)")
+    parser.add_argument(
+        "--memory-threshold", type=float, default=0.2, help="Allowed peak memory growth fraction (default: 0.2)"
+    )
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this (default: 5)"
+    )
+    args = parser.parse_args(argv)
+
+    sizes = dict(PRESETS[args.preset])
+    for key, override in (("utm", args.utm_urls), ("corpus", args.corpus_sizes), ("detect", args.detect_rows)):
+        if override:
+            sizes[key] = override
+    workloads = [w for w in build_workloads(sizes) if not args.only or args.only in w.name]
+
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'workload':<28} {'seconds':>10} {'items/s':>14} {'peak MB':>10}")
+    for workload in workloads:
+        stats = measure(workload, repeat=args.repeat, memory=not args.no_memory)
+        results[workload.name] = stats
+        peak = f"{stats['peak_mb']:>10.1f}" if "peak_mb" in stats else f"{'-':>10}"
+        print(f"{workload.name:<28} {stats['seconds']:>10.4f} {stats['items_per_sec']:>14,.0f} {peak}")
+
+    if args.save:
+        save_results(args.save, results)
+        print(f"Saved results to {args.save}")
+
+    if args.baseline:
+        regressions = compare(
+            results, load_results(args.baseline), args.threshold, args.memory_threshold, args.min_delta_ms / 1000
+        )
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Synthetic inputs shared by the benchmark scripts and the tests.
+
+Every generator is seeded, so the same ``n`` and ``seed`` always produce the
+same data.
+"""
+
+import random
+from typing import List, Tuple
+
+import numpy as np
+
+from anomaly_pacing_agent import MetricsColumns
+from rag_campaign_insight_agent.rag_campaign_insight_agent import Campaign, CampaignCorpus
+
+
+def synthetic_urls(n: int, seed: int = 0) -> List[str]:
+    """URLs mixing compliant, missing and off-taxonomy UTM parameters."""
+    rng = random.Random(seed)
+    sources = ["email", "paid_search", "paid_social", "display", "organic", "Email", "facebook"]
+    mediums = ["email", "cpc", "social", "display", "referral", "paid", ""]
+    urls = []
+    for i in range(n):
+        params = [f"utm_source={rng.choice(sources)}", f"utm_medium={rng.choice(mediums)}"]
+        if rng.random() < 0.9:
+            params.append(f"utm_campaign={rng.choice(['fy25_', 'fy26_', 'q3_'])}campaign_{i % 500}")
+        rng.shuffle(params)
+        urls.append(f"https://example.com/page/{i % 1000}?" + "&".join(params))
+    return urls
+
+
+def synthetic_campaigns(n: int, seed: int = 0) -> Tuple[List[Campaign], List[str]]:
+    """``n`` topical synthetic campaigns and 50 briefs drawn from the same topics."""
+    rng = random.Random(seed)
+    topics = [[f"t{t}w{i}" for i in range(40)] for t in range(200)]
+    campaigns = []
+    for i in range(n):
+        topic = rng.choice(topics)
+        words = rng.choices(topic, k=12) + rng.choices(rng.choice(topics), k=4)
+        campaigns.append(
+            Campaign(
+                id=f"S{i}",
+                name=f"synthetic_{i}",
+                channel=rng.choice(["email", "paid_search", "paid_social", "display"]),
+                audience=rng.choice(["smb", "mid_market", "enterprise"]),
+                objective=rng.choice(["awareness", "acquisition", "activation"]),
+                kpis={},
+                summary=" ".join(words),
+            )
+        )
+    briefs = [" ".join(rng.choices(rng.choice(topics), k=10)) for _ in range(50)]
+    return campaigns, briefs
+
+
+def synthetic_corpus(n: int, seed: int = 0) -> Tuple[CampaignCorpus, List[str]]:
+    """A fitted ``CampaignCorpus`` over :func:`synthetic_campaigns`, and its briefs."""
+    campaigns, briefs = synthetic_campaigns(n, seed)
+    return CampaignCorpus(campaigns), briefs
+
+
+def synthetic_metrics(n: int, seed: int = 0) -> MetricsColumns:
+    """Two years of daily rows over 40 channels; a few percent of rows break a guardrail."""
+    rng = np.random.default_rng(seed)
+    clicks = rng.integers(1_000, 5_000, n)
+    return MetricsColumns.from_arrays(
+        day=rng.integers(0, 730, n),
+        channel=np.array([f"channel_{i}" for i in range(40)])[rng.integers(0, 40, n)],
+        spend=rng.normal(1_000, 120, n).clip(0),
+        clicks=clicks,
+        conversions=(clicks * rng.uniform(0.03, 0.06, n)).astype(np.int64),
+        campaign=np.array([f"campaign_{i}" for i in range(10)])[rng.integers(0, 10, n)],
+    )
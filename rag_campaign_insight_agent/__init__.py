@@ -9,5 +9,13 @@ from .rag_campaign_insight_agent import (
     CampaignCorpus,
     Campaign,
 )
+from .retrieval import ExactBackend, IVFBackend, RetrievalBackend
 
-__all__ = ["RAGCampaignInsightAgent", "CampaignCorpus", "Campaign"]
+__all__ = [
+    "RAGCampaignInsightAgent",
+    "CampaignCorpus",
+    "Campaign",
+    "RetrievalBackend",
+    "ExactBackend",
+    "IVFBackend",
+]
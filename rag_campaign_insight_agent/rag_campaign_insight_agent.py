@@ -1,21 +1,25 @@
 import argparse
+import hashlib
 import json
+import os
 import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple, Union
 
+import numpy as np
 import yaml
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
 # Add parent directory to path for shared imports when running as script
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from shared import call_llm
+from rag_campaign_insight_agent.retrieval import RetrievalBackend
+from shared import LLMStream, acall_llm, call_llm, metrics, stream_llm
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Campaign:
     id: str
     name: str
@@ -26,12 +30,268 @@ class Campaign:
     summary: str
 
 
+def fingerprint_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, used to detect a stale saved index."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: Path, payload) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+# Field -> allowed value(s), e.g. {"channel": {"paid_search", "email"}}.
+Filters = Mapping[str, Union[str, Iterable[str]]]
+
+
 class CampaignCorpus:
-    def __init__(self, campaigns: List[Campaign]) -> None:
-        self.campaigns = campaigns
+    INDEX_VERSION = 1
+    FILTER_FIELDS = ("channel", "audience", "objective")
+
+    def __init__(
+        self,
+        campaigns: List[Campaign],
+        vectorizer: Optional[TfidfVectorizer] = None,
+        matrix: Optional[sparse.csr_matrix] = None,
+        compact_threshold: int = 1024,
+        backend: Optional[RetrievalBackend] = None,
+    ) -> None:
+        """Fit TF-IDF over ``campaigns``, or reuse a prebuilt ``vectorizer`` and ``matrix``."""
+        self.campaigns = list(campaigns)
+        if vectorizer is None or matrix is None:
+            self.vectorizer = TfidfVectorizer()
+            texts = [self._campaign_text(c) for c in self.campaigns]
+            self.matrix = self.vectorizer.fit_transform(texts)
+        else:
+            self.vectorizer = vectorizer
+            self.matrix = matrix
+
+        # Incremental updates: new rows go to append-only delta segments and
+        # removals are tombstoned; compact() folds both into self.matrix.
+        self.compact_threshold = compact_threshold
+        self._delta: List[sparse.csr_matrix] = []
+        self._delta_rows = 0
+        self._removed: Set[int] = set()
+        self._row_of: Dict[str, int] = {c.id: i for i, c in enumerate(self.campaigns)}
+
+        # Inverted index over structured fields: field -> value -> row ids, in
+        # row order. Tombstoned rows stay listed and are dropped at query time.
+        self._field_index: Dict[str, Dict[str, List[int]]] = {}
+        self._field_arrays: Dict[Tuple[str, str], np.ndarray] = {}
+        self._index_fields(0)
+
+        self.backend: Optional[RetrievalBackend] = None
+        if backend is not None:
+            self.set_backend(backend)
+
+    def __len__(self) -> int:
+        return len(self.campaigns) - len(self._removed)
+
+    def _index_fields(self, start: int) -> None:
+        """Add rows ``start:`` of ``campaigns`` to the field index."""
+        self._field_arrays = {}
+        for field in self.FILTER_FIELDS:
+            by_value = self._field_index.setdefault(field, {})
+            for row in range(start, len(self.campaigns)):
+                by_value.setdefault(getattr(self.campaigns[row], field), []).append(row)
+
+    def _value_rows(self, field: str, value: str) -> np.ndarray:
+        key = (field, value)
+        rows = self._field_arrays.get(key)
+        if rows is None:
+            rows = np.asarray(self._field_index[field].get(value, []), dtype=np.int64)
+            self._field_arrays[key] = rows
+        return rows
+
+    def filter_rows(self, filters: Filters) -> np.ndarray:
+        """
+        Sorted row ids of live campaigns matching every field in ``filters``.
+
+        Each field accepts one value or a collection of values (any of which
+        may match). Raises ValueError for fields that are not indexed.
+        """
+        rows: Optional[np.ndarray] = None
+        for field, wanted in filters.items():
+            if field not in self._field_index:
+                raise ValueError(f"Cannot filter on '{field}'; expected one of {self.FILTER_FIELDS}")
+            values = [wanted] if isinstance(wanted, str) else sorted(set(wanted))
+            arrays = [self._value_rows(field, v) for v in values]
+            # A row has one value per field, so the per-value lists are disjoint.
+            if len(arrays) == 1:
+                matched = arrays[0]
+            else:
+                matched = np.sort(np.concatenate(arrays or [np.empty(0, dtype=np.int64)]))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        if rows is None:
+            rows = np.arange(len(self.campaigns), dtype=np.int64)
+        if self._removed:
+            rows = rows[~np.isin(rows, list(self._removed))]
+        return rows
+
+    def add_campaigns(self, campaigns: List[Campaign]) -> None:
+        """
+        Add (or replace, by id) campaigns without refitting.
+
+        New rows are vectorized with the current vocabulary and idf weights,
+        so terms never seen before are ignored and idf drifts slowly out of
+        date until :meth:`reweight` is called.
+        """
+        if not campaigns:
+            return
+        rows = self.vectorizer.transform([self._campaign_text(c) for c in campaigns]).tocsr()
+        start = len(self.campaigns)
+        for c in campaigns:
+            previous = self._row_of.get(c.id)
+            if previous is not None:
+                self._removed.add(previous)
+            self._row_of[c.id] = len(self.campaigns)
+            self.campaigns.append(c)
+        self._index_fields(start)
+        self._delta.append(rows)
+        self._delta_rows += rows.shape[0]
+        self._maybe_compact()
+
+    def remove_campaign(self, campaign_id: str) -> bool:
+        """Remove a campaign by id; returns False if it was not in the corpus."""
+        row = self._row_of.pop(campaign_id, None)
+        if row is None:
+            return False
+        self._removed.add(row)
+        self._maybe_compact()
+        return True
+
+    def _maybe_compact(self) -> None:
+        if self._delta_rows + len(self._removed) >= self.compact_threshold:
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge delta segments into ``matrix`` and drop removed rows."""
+        if not self._delta and not self._removed:
+            return
+        n_main = self.matrix.shape[0]
+        added = sparse.vstack(self._delta, format="csr") if self._delta else None
+        if added is not None:
+            self.matrix = sparse.vstack([self.matrix, added], format="csr")
+            self._delta = []
+            self._delta_rows = 0
+
+        keep = np.arange(len(self.campaigns), dtype=np.int64)
+        if self._removed:
+            keep = np.array([i for i in range(len(self.campaigns)) if i not in self._removed], dtype=np.int64)
+            self.matrix = self.matrix[keep]
+            self.campaigns = [self.campaigns[i] for i in keep]
+            self._row_of = {c.id: i for i, c in enumerate(self.campaigns)}
+            self._removed = set()
+            self._field_index = {}
+            self._index_fields(0)
+
+        if self.backend is not None:
+            kept_added = added[keep[keep >= n_main] - n_main] if added is not None else None
+            self.backend.update(self.matrix, keep[keep < n_main], kept_added)
+
+    def reweight(self) -> None:
+        """Refit vocabulary and idf over the current campaigns (picks up new terms)."""
+        self.compact()
         self.vectorizer = TfidfVectorizer()
-        texts = [self._campaign_text(c) for c in campaigns]
-        self.matrix = self.vectorizer.fit_transform(texts)
+        self.matrix = self.vectorizer.fit_transform([self._campaign_text(c) for c in self.campaigns])
+        if self.backend is not None:
+            self.backend.fit(self.matrix)
+
+    def set_backend(self, backend: Optional[RetrievalBackend]) -> None:
+        """Use ``backend`` for candidate search (None restores exact scoring)."""
+        self.compact()
+        if backend is not None:
+            backend.fit(self.matrix)
+        self.backend = backend
+
+    def save_index(self, index_dir: Path, fingerprint: str) -> None:
+        """
+        Persist the fitted vocabulary, idf weights and CSR matrix to ``index_dir``.
+
+        Matrix arrays are written as ``.npy`` so :meth:`load_index` can
+        memory-map them. Each file is written next to its target and renamed
+        into place, so saving over the directory a memory-mapped index was
+        loaded from leaves that index's arrays intact. ``meta.json`` is
+        written last and marks the index complete; ``fingerprint`` identifies
+        the source data it was built from.
+        """
+        self.compact()
+        index_dir.mkdir(parents=True, exist_ok=True)
+        matrix = self.matrix.tocsr()
+        terms = [""] * len(self.vectorizer.vocabulary_)
+        for term, idx in self.vectorizer.vocabulary_.items():
+            terms[idx] = term
+
+        (index_dir / "meta.json").unlink(missing_ok=True)
+        arrays = {
+            "data.npy": matrix.data,
+            "indices.npy": matrix.indices,
+            "indptr.npy": matrix.indptr,
+            "idf.npy": self.vectorizer.idf_,
+        }
+        for name, array in arrays.items():
+            tmp = index_dir / (name + ".tmp")
+            with tmp.open("wb") as f:
+                np.save(f, array)
+            os.replace(tmp, index_dir / name)
+        _write_json(index_dir / "vocabulary.json", terms)
+        _write_json(
+            index_dir / "meta.json",
+            {
+                "version": self.INDEX_VERSION,
+                "fingerprint": fingerprint,
+                "shape": list(matrix.shape),
+            },
+        )
+
+    @classmethod
+    def load_index(
+        cls,
+        index_dir: Path,
+        campaigns: List[Campaign],
+        fingerprint: str,
+        mmap: bool = True,
+    ) -> Optional["CampaignCorpus"]:
+        """
+        Load an index saved by :meth:`save_index` without refitting.
+
+        Returns None if the index is missing, from another format version, or
+        was built from data with a different ``fingerprint``.
+        """
+        meta_path = index_dir / "meta.json"
+        if not meta_path.is_file():
+            return None
+        with meta_path.open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (
+            meta.get("version") != cls.INDEX_VERSION
+            or meta.get("fingerprint") != fingerprint
+            or meta.get("shape", [None])[0] != len(campaigns)
+        ):
+            return None
+
+        mmap_mode = "r" if mmap else None
+        matrix = sparse.csr_matrix(
+            (
+                np.load(index_dir / "data.npy", mmap_mode=mmap_mode),
+                np.load(index_dir / "indices.npy", mmap_mode=mmap_mode),
+                np.load(index_dir / "indptr.npy", mmap_mode=mmap_mode),
+            ),
+            shape=tuple(meta["shape"]),
+            copy=False,
+        )
+        with (index_dir / "vocabulary.json").open("r", encoding="utf-8") as f:
+            terms = json.load(f)
+        vectorizer = TfidfVectorizer()
+        vectorizer.vocabulary_ = {term: idx for idx, term in enumerate(terms)}
+        vectorizer.idf_ = np.load(index_dir / "idf.npy")
+        return cls(campaigns, vectorizer=vectorizer, matrix=matrix)
 
     @staticmethod
     def _campaign_text(c: Campaign) -> str:
@@ -40,31 +300,178 @@ class CampaignCorpus:
             f"{json.dumps(c.kpis)} {c.summary}"
         )
 
-    def most_similar(self, brief_text: str, top_n: int = 3) -> List[Tuple[Campaign, float]]:
-        query_vec = self.vectorizer.transform([brief_text])
-        sims = cosine_similarity(query_vec, self.matrix).flatten()
-        ranked_indices = sims.argsort()[::-1][:top_n]
-        return [(self.campaigns[i], float(sims[i])) for i in ranked_indices]
+    @staticmethod
+    def _dot(matrix: sparse.csr_matrix, query_vecs: sparse.csr_matrix) -> np.ndarray:
+        # Keep the corpus on the left so the CSR matrix is never transposed.
+        # For a handful of queries a dense right-hand side is several times faster.
+        if query_vecs.shape[0] <= 16:
+            return np.asarray(matrix @ query_vecs.T.toarray()).T
+        return (matrix @ query_vecs.T).T.toarray()
+
+    def _scores(self, query_vecs: sparse.csr_matrix) -> np.ndarray:
+        """Dense (n_queries, n_rows) similarity scores; removed rows score -inf."""
+        # TF-IDF rows are already L2-normalized, so a dot product is the cosine
+        # similarity; it also avoids copying a memory-mapped matrix per query.
+        sims = self._dot(self.matrix, query_vecs)
+        if self._delta:
+            sims = np.hstack([sims] + [self._dot(d, query_vecs) for d in self._delta])
+        if self._removed:
+            sims[:, list(self._removed)] = -np.inf
+        return sims
+
+    @staticmethod
+    def _top_k(sims: np.ndarray, k: int) -> np.ndarray:
+        """Column indices of the ``k`` best scores per row, best first.
+
+        ``partition`` finds each row's ``k``-th best score in linear time;
+        only the scores at or above it are then sorted, instead of sorting
+        every score. Equal scores come out in descending index order, as
+        they did with a full ``argsort()[::-1]``.
+        """
+        n_rows, n = sims.shape
+        k = min(k, n)
+        if k <= 0:
+            return np.empty((n_rows, 0), dtype=np.int64)
+        kth = np.partition(sims, n - k, axis=1)[:, n - k:n - k + 1]
+        # At least k entries per row; more only when the k-th score is tied.
+        rows, cols = np.nonzero(sims >= kth)
+        order = np.lexsort((-cols, -sims[rows, cols], rows))
+        rows, cols = rows[order], cols[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        return cols[rank < k].reshape(n_rows, k)
+
+    def _ranked(self, sims: np.ndarray, indices: np.ndarray) -> List[Tuple[Campaign, float]]:
+        return [(self.campaigns[i], float(sims[i])) for i in indices if sims[i] != -np.inf]
+
+    def _search_rows(
+        self,
+        query_vecs: sparse.csr_matrix,
+        top_n: int,
+        rows: np.ndarray,
+    ) -> List[List[Tuple[Campaign, float]]]:
+        """Score only ``rows`` (live row ids, sorted) exactly."""
+        n_main = self.matrix.shape[0]
+        split = np.searchsorted(rows, n_main)
+        sims = self._dot(self.matrix[rows[:split]], query_vecs)
+        if split < len(rows):
+            delta = sparse.vstack(self._delta, format="csr")[rows[split:] - n_main]
+            sims = np.hstack([sims, self._dot(delta, query_vecs)])
+        return [
+            [(self.campaigns[rows[j]], float(row[j])) for j in order]
+            for row, order in zip(sims, self._top_k(sims, top_n))
+        ]
+
+    def _search_block(
+        self,
+        query_vecs: sparse.csr_matrix,
+        top_n: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[Campaign, float]]]:
+        if rows is not None:
+            # A filtered subset is scored exactly, bypassing any backend.
+            return self._search_rows(query_vecs, top_n, rows)
+        if self.backend is None:
+            sims = self._scores(query_vecs)
+            return [self._ranked(row, idx) for row, idx in zip(sims, self._top_k(sims, top_n))]
+
+        # The backend covers the main matrix; pending delta rows are few and
+        # scored exactly. Over-fetch so tombstoned rows can be dropped.
+        indices, scores = self.backend.search(query_vecs, top_n + len(self._removed))
+        if self._delta:
+            delta = np.hstack([self._dot(d, query_vecs) for d in self._delta])
+            delta_ids = self.matrix.shape[0] + np.arange(delta.shape[1])
+            indices = np.hstack([indices, np.tile(delta_ids, (indices.shape[0], 1))])
+            scores = np.hstack([scores, delta])
+        if self._removed:
+            scores[np.isin(indices, list(self._removed))] = -np.inf
+        # Put candidates in row order so ties break by row, as without a backend.
+        by_row = np.argsort(indices, axis=1, kind="stable")
+        indices = np.take_along_axis(indices, by_row, axis=1)
+        scores = np.take_along_axis(scores, by_row, axis=1)
+        top = self._top_k(scores, top_n)
+        return [
+            [(self.campaigns[idx[j]], float(row[j])) for j in order if row[j] != -np.inf]
+            for idx, row, order in zip(indices, scores, top)
+        ]
+
+    def most_similar(
+        self,
+        brief_text: str,
+        top_n: int = 3,
+        filters: Optional[Filters] = None,
+    ) -> List[Tuple[Campaign, float]]:
+        """
+        The ``top_n`` campaigns most similar to ``brief_text``.
+
+        ``filters`` restricts the search to campaigns whose channel, audience
+        or objective match, e.g. ``{"channel": {"paid_search", "email"}}``;
+        only the matching rows are scored.
+        """
+        rows = self.filter_rows(filters) if filters else None
+        with metrics.stage("rag.vectorize"):
+            query_vec = self.vectorizer.transform([brief_text])
+        with metrics.stage("rag.similarity"):
+            return self._search_block(query_vec, top_n, rows)[0]
+
+    def most_similar_batch(
+        self,
+        briefs: List[str],
+        top_n: int = 3,
+        block_size: int = 64,
+        filters: Optional[Filters] = None,
+    ) -> List[List[Tuple[Campaign, float]]]:
+        """
+        :meth:`most_similar` for many briefs, scored with one sparse product per block.
+
+        Briefs are processed ``block_size`` at a time so the dense score block
+        stays bounded (``block_size`` x corpus size floats).
+        """
+        results: List[List[Tuple[Campaign, float]]] = []
+        if not briefs:
+            return results
+        rows = self.filter_rows(filters) if filters else None
+        query_vecs = self.vectorizer.transform(briefs)
+        for start in range(0, len(briefs), block_size):
+            results.extend(self._search_block(query_vecs[start:start + block_size], top_n, rows))
+        return results
 
 
 class RAGCampaignInsightAgent:
-    def __init__(self, campaign_history_path: Path, kpi_dict_path: Path) -> None:
+    def __init__(
+        self,
+        campaign_history_path: Path,
+        kpi_dict_path: Path,
+        index_dir: Optional[Path] = None,
+    ) -> None:
+        """
+        Load campaign history and the KPI dictionary.
+
+        With ``index_dir``, a saved TF-IDF index is reused when it matches the
+        history file's fingerprint, and rebuilt and saved otherwise.
+        """
         with campaign_history_path.open("r", encoding="utf-8") as f:
             raw = json.load(f)
-        self.corpus = CampaignCorpus(
-            campaigns=[
-                Campaign(
-                    id=item["id"],
-                    name=item["name"],
-                    channel=item["channel"],
-                    audience=item["audience"],
-                    objective=item["objective"],
-                    kpis=item["kpis"],
-                    summary=item["summary"],
-                )
-                for item in raw
-            ]
-        )
+        campaigns = [
+            Campaign(
+                id=item["id"],
+                name=item["name"],
+                channel=item["channel"],
+                audience=item["audience"],
+                objective=item["objective"],
+                kpis=item["kpis"],
+                summary=item["summary"],
+            )
+            for item in raw
+        ]
+
+        corpus = None
+        if index_dir is not None:
+            fingerprint = fingerprint_file(campaign_history_path)
+            corpus = CampaignCorpus.load_index(index_dir, campaigns, fingerprint)
+            if corpus is None:
+                corpus = CampaignCorpus(campaigns)
+                corpus.save_index(index_dir, fingerprint)
+        self.corpus = corpus if corpus is not None else CampaignCorpus(campaigns)
 
         with kpi_dict_path.open("r", encoding="utf-8") as f:
             self.kpi_dict = yaml.safe_load(f)
@@ -102,22 +509,48 @@ class RAGCampaignInsightAgent:
         lines.append("Return a concise answer suitable for an internal GTM update.")
         return "\n".join(lines)
 
-    def generate_insight(self, brief: str) -> str:
-        similar_campaigns = self.corpus.most_similar(brief, top_n=3)
-        prompt = self.build_prompt(brief, similar_campaigns)
-        return call_llm(prompt)
+    def generate_insight(self, brief: str, filters: Optional[Filters] = None) -> str:
+        similar_campaigns = self.corpus.most_similar(brief, top_n=3, filters=filters)
+        with metrics.stage("rag.prompt"):
+            prompt = self.build_prompt(brief, similar_campaigns)
+        with metrics.stage("rag.llm"):
+            return call_llm(prompt)
+
+    async def agenerate_insight(self, brief: str, filters: Optional[Filters] = None) -> str:
+        similar_campaigns = self.corpus.most_similar(brief, top_n=3, filters=filters)
+        with metrics.stage("rag.prompt"):
+            prompt = self.build_prompt(brief, similar_campaigns)
+        with metrics.stage("rag.llm"):
+            return await acall_llm(prompt)
+
+    def stream_insight(self, brief: str, filters: Optional[Filters] = None) -> LLMStream:
+        """:meth:`generate_insight`, yielding text chunks as they are generated."""
+        similar_campaigns = self.corpus.most_similar(brief, top_n=3, filters=filters)
+        with metrics.stage("rag.prompt"):
+            prompt = self.build_prompt(brief, similar_campaigns)
+        return stream_llm(prompt).timed("rag.llm")
+
+    @staticmethod
+    def print_stream(stream: LLMStream) -> None:
+        """Echo ``stream`` to stdout as it arrives, then its timings to stderr."""
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print()
+        print(f"({stream.timing_summary()})", file=sys.stderr)
 
-    def demo(self) -> None:
+    def demo(self, stream: bool = False) -> None:
         brief = (
             "Plan a mid market free trial acquisition campaign using paid search and email nurture. "
             "Primary objective is trial sign ups and secondary objective is activation into paid plans. "
             "Budget is constrained so we care a lot about CPL and conversion rate."
         )
-        insight = self.generate_insight(brief)
         print("New brief:")
         print(brief)
         print("\nInsight:")
-        print(insight)
+        if stream:
+            self.print_stream(self.stream_insight(brief))
+        else:
+            print(self.generate_insight(brief))
 
 
 if __name__ == "__main__":
@@ -144,11 +577,33 @@ if __name__ == "__main__":
         default=default_kpis,
         help=f"Path to KPI dictionary YAML (default: {default_kpis.name})",
     )
+    parser.add_argument(
+        "--index-dir",
+        type=Path,
+        default=None,
+        help="Directory for a saved TF-IDF index; reused when the history is unchanged",
+    )
+    for field in CampaignCorpus.FILTER_FIELDS:
+        parser.add_argument(
+            f"--{field}",
+            action="append",
+            metavar="VALUE",
+            help=f"Only retrieve past campaigns with this {field} (repeatable)",
+        )
+
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="Wait for the full insight instead of printing it as it is generated",
+    )
 
     args = parser.parse_args()
-    agent = RAGCampaignInsightAgent(args.history, args.kpis)
+    agent = RAGCampaignInsightAgent(args.history, args.kpis, index_dir=args.index_dir)
+    filters = {f: getattr(args, f) for f in CampaignCorpus.FILTER_FIELDS if getattr(args, f)}
 
-    if args.brief:
-        print(agent.generate_insight(args.brief))
+    if not args.brief:
+        agent.demo(stream=not args.no_stream)
+    elif args.no_stream:
+        print(agent.generate_insight(args.brief, filters=filters or None))
     else:
-        agent.demo()
+        agent.print_stream(agent.stream_insight(args.brief, filters=filters or None))
@@ -0,0 +1,230 @@
+"""Pluggable retrieval backends for CampaignCorpus.
+
+``CampaignCorpus`` scores every campaign exactly by default. For very large
+histories a backend can narrow the search to a candidate set first. The
+interface is small: ``fit`` on the corpus matrix, ``search`` for the top rows
+of a block of query vectors, and ``update`` after the corpus compacts.
+
+``IVFBackend`` is an inverted-file index: TF-IDF rows are reduced with
+TruncatedSVD, clustered with MiniBatchKMeans, and each query only scores the
+rows in its ``n_probe`` nearest clusters. Candidates are re-scored with the
+exact TF-IDF cosine, so returned scores match the exact path.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+
+class RetrievalBackend(ABC):
+    """Finds the best-scoring rows of a TF-IDF matrix for a block of queries."""
+
+    @abstractmethod
+    def fit(self, matrix: sparse.csr_matrix) -> None:
+        """Index ``matrix`` (rows are L2-normalized TF-IDF vectors)."""
+
+    @abstractmethod
+    def search(self, query_vecs: sparse.csr_matrix, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return ``(indices, scores)``, each shaped ``(n_queries, k)``, best first.
+
+        Rows with fewer than ``k`` candidates are padded with index -1 and
+        score -inf.
+        """
+
+    def update(self, matrix: sparse.csr_matrix, keep: np.ndarray, added: Optional[sparse.csr_matrix]) -> None:
+        """
+        Re-index after the corpus compacts.
+
+        ``keep`` lists the previously indexed row ids that survive, in order;
+        ``added`` holds the new rows appended after them. The default simply
+        refits on the new ``matrix``.
+        """
+        self.fit(matrix)
+
+
+def _pad(indices: List[np.ndarray], scores: List[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    out_idx = np.full((len(indices), k), -1, dtype=np.int64)
+    out_scores = np.full((len(indices), k), -np.inf)
+    for row, (idx, sc) in enumerate(zip(indices, scores)):
+        out_idx[row, : len(idx)] = idx
+        out_scores[row, : len(sc)] = sc
+    return out_idx, out_scores
+
+
+def _top_k_1d(scores: np.ndarray, k: int) -> np.ndarray:
+    # Same order as CampaignCorpus._top_k: ties by descending index.
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= kth)
+    return candidates[np.lexsort((-candidates, -scores[candidates]))][:k]
+
+
+class ExactBackend(RetrievalBackend):
+    """Brute-force cosine over every row; the reference for recall measurements."""
+
+    def fit(self, matrix: sparse.csr_matrix) -> None:
+        self.matrix = matrix
+
+    def search(self, query_vecs: sparse.csr_matrix, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        sims = (self.matrix @ query_vecs.T).T.toarray()
+        indices = [_top_k_1d(row, k) for row in sims]
+        return _pad(indices, [row[idx] for row, idx in zip(sims, indices)], k)
+
+
+class IVFBackend(RetrievalBackend):
+    """
+    Approximate search over SVD-reduced vectors clustered into inverted lists.
+
+    Args:
+        n_components: SVD dimensions (capped below the corpus's row and
+            feature counts).
+        n_lists: Number of clusters (default: about ``sqrt(n_rows)``; at
+            most one per row).
+        n_probe: Clusters scanned per query. Higher means better recall, slower.
+        rerank_factor: Approximate candidates kept per result for exact
+            re-scoring. Higher means better recall, slower.
+        random_state: Seed for SVD and k-means.
+
+    A corpus with a single row or a single feature cannot be reduced, so it
+    is searched exactly instead.
+    """
+
+    def __init__(
+        self,
+        n_components: int = 128,
+        n_lists: Optional[int] = None,
+        n_probe: int = 4,
+        rerank_factor: int = 32,
+        random_state: int = 0,
+    ) -> None:
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rerank_factor = rerank_factor
+        self.random_state = random_state
+
+    def fit(self, matrix: sparse.csr_matrix) -> None:
+        self.matrix = matrix
+        n_rows, n_features = matrix.shape
+        self._exact: Optional[ExactBackend] = None
+        if min(n_rows, n_features) < 2:
+            self._exact = ExactBackend()
+            self._exact.fit(matrix)
+            return
+        n_components = min(self.n_components, n_rows - 1, n_features - 1)
+        self.svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        reduced = self._normalize(self.svd.fit_transform(matrix))
+        # Contiguous (n_features, n_components) projection; svd.transform would
+        # re-layout components_ on every call.
+        self.projection = np.ascontiguousarray(self.svd.components_.T, dtype=np.float32)
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(n_rows)))
+        n_lists = min(n_lists, n_rows)
+        self.kmeans = MiniBatchKMeans(
+            n_clusters=n_lists,
+            random_state=self.random_state,
+            batch_size=max(1024, n_lists * 4),
+            n_init=3,
+        )
+        labels = self.kmeans.fit_predict(reduced)
+        self.centroids = self._normalize(self.kmeans.cluster_centers_)
+        self._build_lists(reduced, labels)
+
+    def _project(self, vecs: sparse.csr_matrix) -> np.ndarray:
+        # Match dtypes so scipy does not upcast the whole projection per call.
+        return self._normalize(np.asarray(vecs.astype(np.float32) @ self.projection))
+
+    @staticmethod
+    def _normalize(x: np.ndarray) -> np.ndarray:
+        return normalize(x).astype(np.float32, copy=False)
+
+    def _build_lists(self, reduced: np.ndarray, labels: np.ndarray) -> None:
+        # Rows sorted by cluster, with offsets, like CSR: list c is
+        # row_ids[offsets[c]:offsets[c + 1]].
+        self.labels = labels
+        order = np.argsort(labels, kind="stable")
+        self.row_ids = order
+        self.vectors = reduced[order]
+        counts = np.bincount(labels, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._reduced = reduced
+
+    def update(self, matrix: sparse.csr_matrix, keep: np.ndarray, added: Optional[sparse.csr_matrix]) -> None:
+        """Drop removed rows and assign new rows to their nearest cluster, without refitting."""
+        if self._exact is not None:
+            self.fit(matrix)
+            return
+        reduced = self._reduced[keep]
+        labels = self.labels[keep]
+        if added is not None and added.shape[0]:
+            new = self._project(added)
+            reduced = np.vstack([reduced, new])
+            labels = np.concatenate([labels, np.argmax(new @ self.centroids.T, axis=1)])
+        self.matrix = matrix
+        self._build_lists(reduced, labels)
+
+    def search(self, query_vecs: sparse.csr_matrix, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._exact is not None:
+            return self._exact.search(query_vecs, k)
+        reduced = self._project(query_vecs)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(reduced @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+
+        all_idx: List[np.ndarray] = []
+        all_scores: List[np.ndarray] = []
+        for q, lists in enumerate(probes):
+            spans = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists]
+            positions = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+            if positions.size == 0:
+                all_idx.append(positions)
+                all_scores.append(np.empty(0))
+                continue
+            approx = self.vectors[positions] @ reduced[q]
+            # Rerank in row order so exact ties break by row, as in ExactBackend.
+            shortlist = np.sort(self.row_ids[positions[_top_k_1d(approx, k * self.rerank_factor)]])
+            exact = (self.matrix[shortlist] @ query_vecs[q].T).toarray().ravel()
+            best = _top_k_1d(exact, k)
+            all_idx.append(shortlist[best])
+            all_scores.append(exact[best])
+        return _pad(all_idx, all_scores, k)
+
+
+def benchmark_recall(
+    corpus,
+    backend: RetrievalBackend,
+    briefs: List[str],
+    top_n: int = 10,
+) -> Dict[str, float]:
+    """
+    Compare ``backend`` against exact search on ``corpus``.
+
+    Returns mean recall@top_n and mean per-query latency (ms) for both. The
+    corpus is compacted first; its own backend setting is left unchanged.
+    """
+    corpus.compact()
+    query_vecs = corpus.vectorizer.transform(briefs)
+    exact = ExactBackend()
+    exact.fit(corpus.matrix)
+    backend.fit(corpus.matrix)
+
+    def timed(b: RetrievalBackend) -> Tuple[np.ndarray, float]:
+        start = time.perf_counter()
+        indices = [b.search(query_vecs[i], top_n)[0][0] for i in range(len(briefs))]
+        return np.array(indices), (time.perf_counter() - start) * 1000 / max(1, len(briefs))
+
+    truth, exact_ms = timed(exact)
+    approx, ann_ms = timed(backend)
+    recalls = [
+        len(set(t[t >= 0]) & set(a[a >= 0])) / max(1, int((t >= 0).sum()))
+        for t, a in zip(truth, approx)
+    ]
+    return {"recall": float(np.mean(recalls)), "exact_ms": exact_ms, "ann_ms": ann_ms}
@@ -1,5 +1,56 @@
 """Shared utilities for AI Ops LLM Agents."""
 
-from .llm import call_llm
+from .cache import CacheStats, LLMResponseCache
+from .instrumentation import Instrumentation, metrics
+from .llm import (
+    LLMClientConfig,
+    LLMStream,
+    acall_llm,
+    aclose_clients,
+    call_llm,
+    close_clients,
+    configure_cache,
+    configure_provider,
+    configure_rate_limiter,
+    gather_bounded,
+    get_async_client,
+    get_cache,
+    get_client,
+    get_provider,
+    get_rate_limiter,
+    stream_llm,
+)
+from .providers import Completion, LLMProvider, OpenAIProvider, register_provider
+from .ratelimit import RateLimiter, RateLimitStats
+from .singleflight import SingleFlight, SingleFlightStats
 
-__all__ = ["call_llm"]
+__all__ = [
+    "call_llm",
+    "acall_llm",
+    "stream_llm",
+    "LLMStream",
+    "gather_bounded",
+    "get_client",
+    "get_async_client",
+    "close_clients",
+    "aclose_clients",
+    "LLMClientConfig",
+    "configure_cache",
+    "get_cache",
+    "LLMResponseCache",
+    "CacheStats",
+    "configure_rate_limiter",
+    "get_rate_limiter",
+    "RateLimiter",
+    "RateLimitStats",
+    "SingleFlight",
+    "SingleFlightStats",
+    "configure_provider",
+    "get_provider",
+    "register_provider",
+    "LLMProvider",
+    "OpenAIProvider",
+    "Completion",
+    "metrics",
+    "Instrumentation",
+]
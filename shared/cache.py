@@ -0,0 +1,226 @@
+"""Content-addressed cache for LLM responses.
+
+Responses are keyed by a hash of everything that determines the completion
+(model, temperature, max_tokens, prompt). A small in-memory LRU sits in front
+of an optional SQLite file so repeated runs can reuse earlier answers.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    # LRU drops from the memory tier; the entry may still be on disk.
+    memory_evictions: int = 0
+    # Rows deleted to stay under max_disk_bytes; these answers are lost.
+    disk_evictions: int = 0
+    # Keys found past their TTL, counted once per key whichever tiers held it.
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) response cache with TTL and size limits.
+
+    Safe to share across threads. Pass ``path=None`` for a memory-only cache.
+    Memory hits refresh the SQLite ``accessed_at`` in batches (before any
+    disk eviction, and every ``TOUCH_BATCH`` hits), so disk eviction stays
+    least-recently-used across both tiers.
+    """
+
+    TOUCH_BATCH = 256
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        max_memory_entries: int = 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        self.path = Path(path) if path else None
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        # Memory hits whose accessed_at has not been written to SQLite yet.
+        self._touched: Dict[str, float] = {}
+
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+        payload = json.dumps([model, temperature, max_tokens, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, value: str, created_at: float) -> None:
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._stats.memory_evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for ``key``, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            expired = False
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self._stats.hits += 1
+                    self._stats.memory_hits += 1
+                    if self._db is not None:
+                        self._touched[key] = now
+                        if len(self._touched) >= self.TOUCH_BATCH:
+                            self._flush_touched()
+                    return entry[0]
+                del self._memory[key]
+                expired = True
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, size, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, size, created_at = row
+                    if not self._expired(created_at, now):
+                        self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, value, created_at)
+                        self._stats.hits += 1
+                        self._stats.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._disk_bytes -= size
+                    expired = True
+
+            if expired:
+                self._stats.expirations += 1
+            self._stats.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store ``value`` under ``key`` in both tiers, evicting as needed."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is None:
+                return
+            self._touched.pop(key, None)
+
+            size = len(value.encode("utf-8"))
+            previous = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._disk_bytes += size - (previous[0] if previous else 0)
+            self._evict_disk()
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict_disk(self) -> None:
+        # Drop least recently used rows in batches until back under budget.
+        if self._disk_bytes > self.max_disk_bytes:
+            self._flush_touched()
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._touched.pop(key, None)
+                self._disk_bytes -= size
+                self._stats.disk_evictions += 1
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+
+    def purge_expired(self) -> int:
+        """Delete every entry older than the TTL; returns the number removed."""
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            stale = {k for k, (_, created_at) in self._memory.items() if created_at < cutoff}
+            for key in stale:
+                del self._memory[key]
+                self._touched.pop(key, None)
+            if self._db is not None:
+                rows = self._db.execute("SELECT key, size FROM responses WHERE created_at < ?", (cutoff,)).fetchall()
+                self._db.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+                self._disk_bytes -= sum(size for _, size in rows)
+                # Count each key once, whichever tiers held it.
+                stale.update(key for key, _ in rows)
+            removed = len(stale)
+            self._stats.expirations += removed
+            return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._disk_bytes = 0
+
+    def stats(self) -> CacheStats:
+        """Return a snapshot of hit/miss counters."""
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._flush_touched()
+                self._db.close()
+                self._db = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._db is not None:
+                return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return len(self._memory)
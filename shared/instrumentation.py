@@ -0,0 +1,239 @@
+"""Lightweight, opt-in instrumentation for the agents' hot paths.
+
+``metrics`` is the process-wide registry. While it is disabled (the default)
+``metrics.stage(...)`` returns a shared no-op context manager and the other
+recording methods return at once, so instrumented code pays one attribute
+check per call.
+
+Enable it with ``metrics.enable()`` or by setting ``AGENT_METRICS=1``.
+Setting ``AGENT_METRICS_PATH`` also enables it, and writes the metrics to
+that file at exit (Prometheus text for ``.prom``/``.txt``, otherwise JSON).
+
+Recorded series:
+
+- ``agent_stage_seconds{stage}``: histogram per pipeline stage, e.g.
+  ``utm.parse``, ``rag.similarity``, ``anomaly.detect``. Streamed LLM
+  stages are timed with ``LLMStream.timed`` until the stream ends.
+- ``llm_request_seconds{model}``: histogram of provider requests, including
+  rate-limit waits and retries; for streams, until the last chunk.
+- ``llm_calls_total{model,source}``: calls answered from ``cache``, by an
+  ``api`` request, or ``coalesced`` onto another caller's request.
+- ``llm_tokens_total{model,kind}``: prompt and completion tokens from the
+  response's ``usage`` (the final chunk, for streams).
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as in Prometheus."""
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[int]:
+        out, running = [], 0
+        for n in self.counts:
+            running += n
+            out.append(running)
+        return out
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the ``q`` quantile by linear interpolation within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, seen = 0.0, 0
+        for upper, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return self.buckets[-1]
+
+
+class Instrumentation:
+    """
+    Thread-safe registry of counters and latency histograms.
+
+    Args:
+        enabled: Start recording immediately.
+        buckets: Histogram bucket upper bounds, in seconds.
+    """
+
+    def __init__(self, enabled: bool = False, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        """Add ``value`` to the counter ``name`` with ``labels``."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """Record one latency sample in the histogram ``name`` with ``labels``."""
+        if not self.enabled:
+            return
+        self._observe(name, tuple(sorted(labels.items())), seconds)
+
+    def _observe(self, name: str, key: LabelKey, seconds: float) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def value(self, name: str, **labels: str) -> float:
+        """Current value of the counter ``name`` with exactly ``labels`` (0 if never counted)."""
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        """The histogram ``name`` with exactly ``labels``, if anything was observed."""
+        with self._lock:
+            return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def stage(self, stage: str):
+        """Context manager timing one pipeline stage into ``agent_stage_seconds``."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _StageTimer(self, (("stage", stage),))
+
+    def to_json(self) -> dict:
+        """Counters and histograms (with p50/p95/p99 estimates) as plain data."""
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in sorted(series.items())]
+                for name, series in sorted(self._counters.items())
+            }
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": h.count,
+                        "sum": h.sum,
+                        "p50": h.quantile(0.5),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                        "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.cumulative())),
+                    }
+                    for key, h in sorted(series.items())
+                ]
+                for name, series in sorted(self._histograms.items())
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {_number(value)}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in sorted(series.items()):
+                    bounds = [_number(b) for b in h.buckets] + ["+Inf"]
+                    for bound, total in zip(bounds, h.cumulative()):
+                        lines.append(f"{name}_bucket{_labels(key + (('le', bound),))} {total}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(h.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write Prometheus text (``.prom``/``.txt``) or JSON (anything else) to ``path``."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix in (".prom", ".txt"):
+            path.write_text(self.to_prometheus())
+        else:
+            path.write_text(json.dumps(self.to_json(), indent=2) + "\n")
+
+
+class _StageTimer:
+    """Times one ``with`` block into ``agent_stage_seconds``."""
+
+    __slots__ = ("registry", "key", "start")
+
+    def __init__(self, registry: Instrumentation, key: LabelKey) -> None:
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.registry._observe("agent_stage_seconds", self.key, time.perf_counter() - self.start)
+
+
+def _labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+metrics = Instrumentation(
+    enabled=os.getenv("AGENT_METRICS", "").lower() not in ("", "0", "false") or bool(os.getenv("AGENT_METRICS_PATH"))
+)
+
+
+def _write_at_exit() -> None:
+    path = os.getenv("AGENT_METRICS_PATH")
+    if path and metrics.enabled:
+        metrics.write(path)
+
+
+atexit.register(_write_at_exit)
@@ -1,20 +1,394 @@
 """Common LLM integration utilities.
 
 This module provides a unified interface for LLM calls across all agents.
-The implementation can be easily swapped to use different providers.
+Requests go through a pluggable provider (see ``shared.providers``), selected
+with ``configure_provider`` or ``LLM_PROVIDER``.
 """
 
+import asyncio
+import atexit
 import os
-from typing import Optional
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+from dataclasses import dataclass, replace
+from typing import Awaitable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 from dotenv import load_dotenv
 
+from .cache import LLMResponseCache
+from .instrumentation import metrics
+from .providers import Completion, LLMProvider, create_provider
+from .ratelimit import RateLimiter, estimate_tokens
+from .singleflight import SingleFlight
+
 load_dotenv()
 
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI, OpenAI
 except ImportError:
     OpenAI = None  # type: ignore[assignment]
+    AsyncOpenAI = None  # type: ignore[assignment]
+
+try:
+    # Newer OpenAI SDK releases ship their transport as ``httpx2``; the
+    # pooled client must come from the same package the SDK was built on.
+    import httpx2 as httpx
+except ImportError:
+    try:
+        import httpx
+    except ImportError:
+        httpx = None  # type: ignore[assignment]
+
+
+@dataclass(frozen=True)
+class LLMClientConfig:
+    """Connection pool and timeout settings for the shared OpenAI client."""
+
+    timeout: float = 60.0
+    connect_timeout: float = 10.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    # SDK-level retries; forced to 0 while a rate limiter is active.
+    max_retries: int = 2
+
+    @classmethod
+    def from_env(cls) -> "LLMClientConfig":
+        """Build a config from ``LLM_*`` environment variables, falling back to defaults."""
+        defaults = cls()
+        return cls(
+            timeout=float(os.getenv("LLM_TIMEOUT", defaults.timeout)),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", defaults.connect_timeout)),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", defaults.max_connections)),
+            max_keepalive_connections=int(
+                os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", defaults.max_keepalive_connections)
+            ),
+            keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", defaults.keepalive_expiry)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", defaults.max_retries)),
+        )
+
+
+# One client per (api_key, base_url, config) so every agent in the process
+# shares the same keep-alive connection pool instead of re-handshaking.
+_clients: Dict[Tuple[str, Optional[str], LLMClientConfig], "OpenAI"] = {}
+_clients_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+T = TypeVar("T")
+
+
+def _require_sdk() -> None:
+    if OpenAI is None:
+        raise SystemExit(
+            "Missing dependency: install OpenAI SDK with `pip install openai` or "
+            "select another provider with LLM_PROVIDER."
+        )
+
+
+def _resolve_settings(
+    api_key: Optional[str],
+    base_url: Optional[str],
+    config: Optional[LLMClientConfig],
+) -> Tuple[str, Optional[str], LLMClientConfig]:
+    _require_sdk()
+
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise SystemExit("Set OPENAI_API_KEY before running this script.")
+    base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+    config = config or LLMClientConfig.from_env()
+    if config.max_retries and get_rate_limiter() is not None:
+        # The limiter owns retries; SDK retries would bypass its pause and pacing.
+        config = replace(config, max_retries=0)
+    return api_key, base_url, config
+
+
+def _client_kwargs(api_key: str, base_url: Optional[str], config: LLMClientConfig, is_async: bool) -> dict:
+    kwargs = {"api_key": api_key, "max_retries": config.max_retries}
+    if base_url:
+        kwargs["base_url"] = base_url
+    if httpx is not None:
+        http_client_cls = httpx.AsyncClient if is_async else httpx.Client
+        kwargs["http_client"] = http_client_cls(
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            follow_redirects=True,
+        )
+    else:
+        kwargs["timeout"] = config.timeout
+    return kwargs
+
+
+def get_client(
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    config: Optional[LLMClientConfig] = None,
+) -> "OpenAI":
+    """
+    Return the process-wide OpenAI client for the given credentials.
+
+    Clients are created lazily and reused across calls and threads, so the
+    underlying HTTP connection pool (and its TLS sessions) stays warm.
+
+    Args:
+        api_key: API key to use (default: ``OPENAI_API_KEY``).
+        base_url: API base URL (default: ``OPENAI_BASE_URL`` or the SDK default).
+        config: Pool and timeout settings (default: ``LLMClientConfig.from_env()``).
+
+    Returns:
+        A shared, thread-safe OpenAI client.
+
+    Raises:
+        SystemExit: If OpenAI SDK is not installed or API key is missing.
+    """
+    key = _resolve_settings(api_key, base_url, config)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = OpenAI(**_client_kwargs(*key, is_async=False))
+                _clients[key] = client
+    return client
+
+
+def get_async_client(
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    config: Optional[LLMClientConfig] = None,
+) -> "AsyncOpenAI":
+    """
+    Return the shared AsyncOpenAI client for the running event loop.
+
+    Async connection pools are bound to the loop that opened them, so clients
+    are cached per loop. Call :func:`aclose_clients` before the loop ends to
+    close them; otherwise they are dropped with the loop and their
+    connections are released when it is garbage-collected.
+
+    Args:
+        api_key: API key to use (default: ``OPENAI_API_KEY``).
+        base_url: API base URL (default: ``OPENAI_BASE_URL`` or the SDK default).
+        config: Pool and timeout settings (default: ``LLMClientConfig.from_env()``).
+
+    Returns:
+        An AsyncOpenAI client shared by all coroutines on the current loop.
+
+    Raises:
+        SystemExit: If OpenAI SDK is not installed or API key is missing.
+    """
+    key = _resolve_settings(api_key, base_url, config)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(**_client_kwargs(*key, is_async=True))
+            loop_clients[key] = client
+    return client
+
+
+async def _close_async(clients: List["AsyncOpenAI"]) -> None:
+    for client in clients:
+        await client.close()
+
+
+async def aclose_clients() -> None:
+    """Close and forget the async clients of the running event loop."""
+    with _clients_lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    await _close_async(clients)
+
+
+def close_clients() -> None:
+    """
+    Close and forget every pooled client (registered to run at exit).
+
+    Async clients are closed on their own loop: scheduled there if it is
+    running, run to completion if it is idle. Clients of a loop that is
+    already closed can no longer be awaited; they are just forgotten (see
+    :func:`get_async_client`).
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        async_clients = [(loop, list(c.values())) for loop, c in _async_clients.items()]
+        _async_clients.clear()
+    for client in clients:
+        client.close()
+    for loop, loop_clients in async_clients:
+        if loop.is_closed() or not loop_clients:
+            continue
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(_close_async(loop_clients), loop)
+        else:
+            loop.run_until_complete(_close_async(loop_clients))
+
+
+atexit.register(close_clients)
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_loaded = False
+_cache_lock = threading.Lock()
+
+
+def configure_cache(cache: Optional[LLMResponseCache]) -> None:
+    """Install ``cache`` as the process-wide response cache (None disables caching)."""
+    global _cache, _cache_loaded
+    with _cache_lock:
+        _cache = cache
+        _cache_loaded = True
+
+
+def get_cache() -> Optional[LLMResponseCache]:
+    """
+    Return the process-wide response cache, if any.
+
+    Unless :func:`configure_cache` was called, the cache is built on first use
+    from ``LLM_CACHE_PATH`` (SQLite file), ``LLM_CACHE_TTL`` (seconds) and
+    ``LLM_CACHE_MAX_MB``. With no ``LLM_CACHE_PATH`` set, caching is off.
+    """
+    global _cache, _cache_loaded
+    if not _cache_loaded:
+        with _cache_lock:
+            if not _cache_loaded:
+                path = os.getenv("LLM_CACHE_PATH")
+                if path:
+                    ttl = os.getenv("LLM_CACHE_TTL")
+                    _cache = LLMResponseCache(
+                        path=path,
+                        max_disk_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                        ttl_seconds=float(ttl) if ttl else None,
+                    )
+                _cache_loaded = True
+    return _cache
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_loaded = False
+_rate_limiter_lock = threading.Lock()
+
+
+def configure_rate_limiter(limiter: Optional[RateLimiter]) -> None:
+    """Install ``limiter`` as the process-wide rate limiter (None disables pacing and retries)."""
+    global _rate_limiter, _rate_limiter_loaded
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
+        _rate_limiter_loaded = True
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """
+    Return the process-wide rate limiter, if any.
+
+    Unless :func:`configure_rate_limiter` was called, the limiter is built on
+    first use from ``LLM_RPM`` and ``LLM_TPM`` (quotas per minute) and
+    ``LLM_RATE_MAX_RETRIES``. With neither quota set, requests are not paced.
+    """
+    global _rate_limiter, _rate_limiter_loaded
+    if not _rate_limiter_loaded:
+        with _rate_limiter_lock:
+            if not _rate_limiter_loaded:
+                rpm, tpm = os.getenv("LLM_RPM"), os.getenv("LLM_TPM")
+                if rpm or tpm:
+                    _rate_limiter = RateLimiter(
+                        requests_per_minute=float(rpm) if rpm else None,
+                        tokens_per_minute=float(tpm) if tpm else None,
+                        max_retries=int(os.getenv("LLM_RATE_MAX_RETRIES", "5")),
+                    )
+                _rate_limiter_loaded = True
+    return _rate_limiter
+
+
+_provider: Optional[LLMProvider] = None
+_provider_lock = threading.Lock()
+
+
+def configure_provider(provider: Optional[LLMProvider]) -> None:
+    """Install ``provider`` for all LLM calls (None goes back to ``LLM_PROVIDER``)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+
+def get_provider() -> LLMProvider:
+    """
+    Return the process-wide LLM provider.
+
+    Unless :func:`configure_provider` was called, it is built on first use
+    from ``LLM_PROVIDER`` (``openai`` by default, or ``local`` for a
+    :mod:`shared.standin` server); see :mod:`shared.providers`.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_provider(os.getenv("LLM_PROVIDER") or "openai")
+    return _provider
+
+
+def _complete(prompt: str, model: str, temperature: float, max_tokens: int) -> Completion:
+    """One completion from the provider, paced and retried by the rate limiter if one is configured."""
+    provider = get_provider()
+    limiter = get_rate_limiter()
+    start = time.perf_counter()
+    if limiter is None:
+        completion = provider.complete(prompt, model, temperature, max_tokens)
+    else:
+        tokens = estimate_tokens(prompt, max_tokens)
+        completion = limiter.call(lambda: provider.complete(prompt, model, temperature, max_tokens), tokens)
+        limiter.settle(tokens, completion.total_tokens)
+    _record_completion(model, time.perf_counter() - start, completion)
+    return completion
+
+
+async def _acomplete(prompt: str, model: str, temperature: float, max_tokens: int) -> Completion:
+    """Async :func:`_complete`."""
+    provider = get_provider()
+    limiter = get_rate_limiter()
+    start = time.perf_counter()
+    if limiter is None:
+        completion = await provider.acomplete(prompt, model, temperature, max_tokens)
+    else:
+        tokens = estimate_tokens(prompt, max_tokens)
+        completion = await limiter.acall(lambda: provider.acomplete(prompt, model, temperature, max_tokens), tokens)
+        limiter.settle(tokens, completion.total_tokens)
+    _record_completion(model, time.perf_counter() - start, completion)
+    return completion
+
+
+def _record_completion(model: str, seconds: float, completion: Completion) -> None:
+    """Request latency (including rate-limit waits) and token usage, when instrumentation is on."""
+    if not metrics.enabled:
+        return
+    metrics.observe("llm_request_seconds", seconds, model=model)
+    if completion.prompt_tokens is not None:
+        metrics.count("llm_tokens_total", completion.prompt_tokens, model=model, kind="prompt")
+    if completion.completion_tokens is not None:
+        metrics.count("llm_tokens_total", completion.completion_tokens, model=model, kind="completion")
+
+
+def _stream(prompt: str, model: str, temperature: float, max_tokens: int) -> Iterator[str]:
+    """Start a streamed completion, paced and retried like :func:`_complete`."""
+    provider = get_provider()
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return provider.stream(prompt, model, temperature, max_tokens)
+    return limiter.call(
+        lambda: provider.stream(prompt, model, temperature, max_tokens), estimate_tokens(prompt, max_tokens)
+    )
+
+
+# Concurrent calls with the same cache key share one request (see use_cache).
+_inflight = SingleFlight()
 
 
 def call_llm(
@@ -22,6 +396,7 @@ def call_llm(
     model: str = "gpt-4o-mini",
     temperature: float = 0.3,
     max_tokens: int = 400,
+    use_cache: bool = True,
 ) -> str:
     """
     Call the LLM with the given prompt.
@@ -31,28 +406,234 @@ def call_llm(
         model: The model to use (default: gpt-4o-mini).
         temperature: Sampling temperature (default: 0.3 for deterministic outputs).
         max_tokens: Maximum tokens in response (default: 400).
+        use_cache: Serve and store the response via the response cache, if one is
+            configured, and share one request among identical concurrent calls.
 
     Returns:
         The LLM's response text.
 
     Raises:
-        SystemExit: If OpenAI SDK is not installed or API key is missing.
+        SystemExit: With the OpenAI provider, if the SDK is not installed or the API key is missing.
     """
-    if OpenAI is None:
-        raise SystemExit(
-            "Missing dependency: install OpenAI SDK with `pip install openai` or "
-            "remove the OpenAI call in `call_llm`."
-        )
+    cache = get_cache() if use_cache else None
+    key = LLMResponseCache.make_key(model, temperature, max_tokens, prompt) if use_cache else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.count("llm_calls_total", model=model, source="cache")
+            return cached
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise SystemExit("Set OPENAI_API_KEY before running this script.")
+    fetched = []
 
-    client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
-    return response.choices[0].message.content.strip()
+    def _fetch() -> str:
+        fetched.append(True)
+        text = _complete(prompt, model, temperature, max_tokens).text.strip()
+        if cache is not None:
+            cache.set(key, text)
+        return text
+
+    text = _inflight.do(key, _fetch) if use_cache else _fetch()
+    metrics.count("llm_calls_total", model=model, source="api" if fetched else "coalesced")
+    return text
+
+
+class LLMStream:
+    """
+    An LLM response delivered as text chunks while it is generated.
+
+    Iterate once to receive the chunks; the request is sent when iteration
+    starts. Timings are measured from then and are filled in as iteration
+    proceeds: ``time_to_first_token`` once the first non-empty chunk arrives,
+    ``total_seconds`` once the stream is exhausted. ``text`` accumulates the
+    full response. Call :meth:`close` to abandon a stream part way through.
+    """
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self._chunks = chunks
+        self._iterator: Optional[Iterator[str]] = None
+        self._stage: Optional[str] = None
+        self._started: Optional[float] = None
+        self.text = ""
+        self.time_to_first_token: Optional[float] = None
+        self.total_seconds: Optional[float] = None
+
+    def timed(self, stage: str) -> "LLMStream":
+        """Record iteration, until the stream is exhausted or closed, as ``stage`` in ``agent_stage_seconds``."""
+        self._stage = stage
+        return self
+
+    def __iter__(self) -> Iterator[str]:
+        if self._iterator is None:
+            self._iterator = self._iterate()
+        return self._iterator
+
+    def _iterate(self) -> Iterator[str]:
+        with metrics.stage(self._stage) if self._stage else nullcontext():
+            self._started = time.perf_counter()
+            try:
+                for chunk in self._chunks:
+                    if not chunk:
+                        continue
+                    if self.time_to_first_token is None:
+                        self.time_to_first_token = time.perf_counter() - self._started
+                    self.text += chunk
+                    yield chunk
+                self.total_seconds = time.perf_counter() - self._started
+            finally:
+                close = getattr(self._chunks, "close", None)
+                if close is not None:
+                    close()
+
+    def close(self) -> None:
+        """Stop receiving chunks and release the connection."""
+        if self._iterator is not None:
+            self._iterator.close()
+        else:
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                close()
+
+    def timing_summary(self) -> str:
+        """One line with time-to-first-token and total latency, for logs."""
+        ttft = "n/a" if self.time_to_first_token is None else f"{self.time_to_first_token:.2f}s"
+        total = "n/a" if self.total_seconds is None else f"{self.total_seconds:.2f}s"
+        return f"time to first token: {ttft}, total: {total}"
+
+
+def stream_llm(
+    prompt: str,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.3,
+    max_tokens: int = 400,
+    use_cache: bool = True,
+) -> LLMStream:
+    """
+    Streaming version of :func:`call_llm`.
+
+    The request is sent when iteration starts. Chunks are yielded as they
+    arrive, with leading whitespace dropped so the joined text matches what
+    :func:`call_llm` returns. A cached response is yielded as one chunk, and
+    a completed stream is stored in the cache.
+
+    Args:
+        prompt: The prompt to send to the LLM.
+        model: The model to use (default: gpt-4o-mini).
+        temperature: Sampling temperature (default: 0.3 for deterministic outputs).
+        max_tokens: Maximum tokens in response (default: 400).
+        use_cache: Serve and store the response via the response cache, if one is configured.
+
+    Returns:
+        An :class:`LLMStream` over the response text.
+
+    Raises:
+        SystemExit: With the OpenAI provider, if the SDK is not installed or the API key is missing.
+    """
+
+    def _chunks() -> Iterator[str]:
+        cache = get_cache() if use_cache else None
+        if cache is not None:
+            key = cache.make_key(model, temperature, max_tokens, prompt)
+            cached = cache.get(key)
+            if cached is not None:
+                metrics.count("llm_calls_total", model=model, source="cache")
+                yield cached
+                return
+
+        metrics.count("llm_calls_total", model=model, source="api")
+        start = time.perf_counter()
+        chunks = _stream(prompt, model, temperature, max_tokens)
+        parts: List[str] = []
+        try:
+            for delta in chunks:
+                if not parts:
+                    delta = delta.lstrip()
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            completion = Completion(
+                "".join(parts),
+                getattr(chunks, "prompt_tokens", None),
+                getattr(chunks, "completion_tokens", None),
+            )
+            limiter = get_rate_limiter()
+            if limiter is not None:
+                limiter.settle(estimate_tokens(prompt, max_tokens), completion.total_tokens)
+            _record_completion(model, time.perf_counter() - start, completion)
+        if cache is not None:
+            cache.set(key, "".join(parts).strip())
+
+    return LLMStream(_chunks())
+
+
+async def acall_llm(
+    prompt: str,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.3,
+    max_tokens: int = 400,
+    use_cache: bool = True,
+) -> str:
+    """
+    Async version of :func:`call_llm`.
+
+    Args:
+        prompt: The prompt to send to the LLM.
+        model: The model to use (default: gpt-4o-mini).
+        temperature: Sampling temperature (default: 0.3 for deterministic outputs).
+        max_tokens: Maximum tokens in response (default: 400).
+        use_cache: Serve and store the response via the response cache, if one is
+            configured, and share one request among identical concurrent calls.
+
+    Returns:
+        The LLM's response text.
+
+    Raises:
+        SystemExit: With the OpenAI provider, if the SDK is not installed or the API key is missing.
+    """
+    cache = get_cache() if use_cache else None
+    key = LLMResponseCache.make_key(model, temperature, max_tokens, prompt) if use_cache else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            metrics.count("llm_calls_total", model=model, source="cache")
+            return cached
+
+    fetched = []
+
+    async def _fetch() -> str:
+        fetched.append(True)
+        text = (await _acomplete(prompt, model, temperature, max_tokens)).text.strip()
+        if cache is not None:
+            cache.set(key, text)
+        return text
+
+    text = await (_inflight.ado(key, _fetch) if use_cache else _fetch())
+    metrics.count("llm_calls_total", model=model, source="api" if fetched else "coalesced")
+    return text
+
+
+async def gather_bounded(aws: Iterable[Awaitable[T]], limit: int = 100) -> List[T]:
+    """
+    Await many coroutines with at most ``limit`` running at once.
+
+    Results are returned in input order, like ``asyncio.gather``.
+
+    Args:
+        aws: Coroutines or other awaitables to run.
+        limit: Maximum number in flight (default: 100).
+
+    Returns:
+        The awaited results, in the same order as ``aws``.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(aw: Awaitable[T]) -> T:
+        async with semaphore:
+            return await aw
+
+    return list(await asyncio.gather(*(_run(aw) for aw in aws)))
@@ -0,0 +1,188 @@
+"""LLM provider interface.
+
+``call_llm`` and friends talk to a :class:`LLMProvider` rather than to an SDK
+directly. The provider is chosen with ``configure_provider`` or the
+``LLM_PROVIDER`` environment variable:
+
+- ``openai`` (default): the OpenAI API via the pooled SDK clients.
+- ``local``: the same client pointed at a :mod:`shared.standin` server at
+  ``LLM_LOCAL_URL`` (default ``http://127.0.0.1:8787/v1``); no API key needed.
+
+Other providers register a factory with :func:`register_provider`.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+DEFAULT_LOCAL_URL = "http://127.0.0.1:8787/v1"
+
+
+@dataclass(frozen=True)
+class Completion:
+    """Text of one completion and the token usage reported for it, if any."""
+
+    text: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        if self.prompt_tokens is None or self.completion_tokens is None:
+            return None
+        return self.prompt_tokens + self.completion_tokens
+
+
+class CompletionStream:
+    """
+    Text chunks of a streamed completion.
+
+    ``prompt_tokens`` and ``completion_tokens`` stay None until the provider
+    reports usage, which OpenAI-compatible APIs do after the last chunk.
+    """
+
+    def __init__(self, chunks: Iterable[str]) -> None:
+        self._chunks = iter(chunks)
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+
+    def report_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    def __iter__(self) -> "CompletionStream":
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class LLMProvider(ABC):
+    """
+    Sends single-prompt chat completions to a model backend.
+
+    Errors should carry the HTTP status as ``status_code`` (and the response
+    as ``response``) so that rate-limit retries can recognise them.
+    """
+
+    @abstractmethod
+    def complete(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Completion:
+        """Return the full completion for ``prompt``."""
+
+    @abstractmethod
+    async def acomplete(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Completion:
+        """Async :meth:`complete`."""
+
+    @abstractmethod
+    def stream(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        """
+        Send the request and return an iterator over text chunks.
+
+        The request is sent before this returns, so connection and rate-limit
+        errors are raised here rather than during iteration. Return a
+        :class:`CompletionStream` to report token usage.
+        """
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    OpenAI (or any OpenAI-compatible endpoint) through the shared pooled clients.
+
+    Args:
+        api_key: API key (default: ``OPENAI_API_KEY``).
+        base_url: API base URL (default: ``OPENAI_BASE_URL`` or the SDK default).
+        config: Pool and timeout settings (default: ``LLMClientConfig.from_env()``).
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, config=None) -> None:
+        self.api_key = api_key
+        self.base_url = base_url
+        self.config = config
+
+    @staticmethod
+    def _messages(prompt: str) -> list:
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _completion(response) -> Completion:
+        usage = getattr(response, "usage", None)
+        return Completion(
+            text=response.choices[0].message.content or "",
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+
+    def complete(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Completion:
+        from .llm import get_client
+
+        client = get_client(self.api_key, self.base_url, self.config)
+        response = client.chat.completions.create(
+            model=model, messages=self._messages(prompt), temperature=temperature, max_tokens=max_tokens
+        )
+        return self._completion(response)
+
+    async def acomplete(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Completion:
+        from .llm import get_async_client
+
+        client = get_async_client(self.api_key, self.base_url, self.config)
+        response = await client.chat.completions.create(
+            model=model, messages=self._messages(prompt), temperature=temperature, max_tokens=max_tokens
+        )
+        return self._completion(response)
+
+    def stream(self, prompt: str, model: str, temperature: float, max_tokens: int) -> Iterator[str]:
+        from .llm import get_client
+
+        client = get_client(self.api_key, self.base_url, self.config)
+        response = client.chat.completions.create(
+            model=model,
+            messages=self._messages(prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        def _chunks() -> Iterator[str]:
+            try:
+                for event in response:
+                    usage = getattr(event, "usage", None)
+                    if usage is not None:
+                        stream.report_usage(usage.prompt_tokens, usage.completion_tokens)
+                    if event.choices:
+                        yield event.choices[0].delta.content or ""
+            finally:
+                response.close()
+
+        stream = CompletionStream(_chunks())
+        return stream
+
+
+def _local_provider() -> LLMProvider:
+    return OpenAIProvider(api_key="local", base_url=os.getenv("LLM_LOCAL_URL") or DEFAULT_LOCAL_URL)
+
+
+_factories: Dict[str, Callable[[], LLMProvider]] = {
+    "openai": OpenAIProvider,
+    "local": _local_provider,
+}
+
+
+def register_provider(name: str, factory: Callable[[], LLMProvider]) -> None:
+    """Make ``factory`` selectable as ``LLM_PROVIDER=name``."""
+    _factories[name] = factory
+
+
+def create_provider(name: str) -> LLMProvider:
+    """Build the provider registered as ``name``."""
+    try:
+        factory = _factories[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider '{name}'; expected one of {sorted(_factories)}") from None
+    return factory()
@@ -0,0 +1,282 @@
+"""Client-side pacing and retry for LLM requests.
+
+Providers enforce quotas in requests per minute (RPM) and tokens per minute
+(TPM). ``RateLimiter`` keeps one token bucket per quota, shared by every
+thread and coroutine in the process, so concurrent agents space their
+requests out instead of all hitting the limit at once. Requests that are
+still rejected (HTTP 429) are retried with jittered exponential backoff, or
+after the server's ``Retry-After``. During that pause every caller holds
+off, which prevents a retry storm.
+
+While a limiter is active the SDK clients are built with ``max_retries=0``,
+so every retry goes through the limiter. Transient failures the SDK would
+otherwise have retried (timeouts, dropped connections, 408/409 and other
+5xx responses) are retried too, with the same jittered backoff but without
+pausing other callers.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = (429, 503)
+TRANSIENT_STATUS = (408, 409)
+
+
+class TokenBucket:
+    """
+    A bucket of ``capacity`` units refilled at ``rate`` units per second.
+
+    :meth:`reserve` takes units immediately and returns how long the caller
+    must wait for them. The level may go negative, so a request larger than
+    the bucket waits in proportion to its size instead of blocking forever,
+    and waiters are served in arrival order.
+    """
+
+    def __init__(self, capacity: float, rate: float, clock: Callable[[], float] = time.monotonic) -> None:
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("capacity and rate must be positive")
+        self.capacity = capacity
+        self.rate = rate
+        self._clock = clock
+        self._level = capacity
+        self._updated = clock()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` units; return the seconds until they are available."""
+        self._refill(self._clock())
+        self._level -= amount
+        return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Return ``amount`` units (negative to charge more), e.g. after measuring actual usage."""
+        self._refill(self._clock())
+        self._level = min(self.capacity, self._level + amount)
+
+    def drain(self) -> None:
+        """Empty the bucket so traffic resumes at the refill rate rather than in a burst."""
+        self._refill(self._clock())
+        self._level = min(self._level, 0.0)
+
+
+@dataclass
+class RateLimitStats:
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    waited_seconds: float = 0.0
+
+
+class RateLimiter:
+    """
+    Process-wide RPM/TPM pacing with retry on rate-limit errors.
+
+    Thread-safe, and usable from async code: the lock is only held for the
+    bucket arithmetic, and waiting happens outside it.
+
+    Args:
+        requests_per_minute: Request quota (None for no request pacing).
+        tokens_per_minute: Token quota (None for no token pacing).
+        headroom: Fraction of each quota to target, so measured throughput
+            stays just under the limit.
+        burst_seconds: Bucket size as seconds of quota. Small buckets spread
+            requests evenly; large ones allow bursts after idle time.
+        max_retries: Retries after a rate-limit error before re-raising.
+        base_delay: First backoff delay in seconds (doubled per retry).
+        max_delay: Upper bound for one backoff delay.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        headroom: float = 0.9,
+        burst_seconds: float = 10.0,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not 0 < headroom <= 1:
+            raise ValueError("headroom must be in (0, 1]")
+        self.requests = self._bucket(requests_per_minute, headroom, burst_seconds, clock)
+        self.tokens = self._bucket(tokens_per_minute, headroom, burst_seconds, clock)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = RateLimitStats()
+
+    @staticmethod
+    def _bucket(per_minute: Optional[float], headroom: float, burst_seconds: float, clock) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        rate = per_minute * headroom / 60.0
+        return TokenBucket(capacity=max(1.0, rate * burst_seconds), rate=rate, clock=clock)
+
+    @property
+    def stats(self) -> RateLimitStats:
+        with self._lock:
+            return RateLimitStats(**vars(self._stats))
+
+    def reserve(self, tokens: int) -> float:
+        """Claim one request and ``tokens`` tokens; return the seconds to wait before sending."""
+        with self._lock:
+            wait = max(0.0, self._blocked_until - self._clock())
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(tokens))
+            self._stats.requests += 1
+            if wait > 0:
+                self._stats.throttled += 1
+                self._stats.waited_seconds += wait
+            return wait
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket once the response reports actual usage."""
+        if self.tokens is None or actual is None:
+            return
+        with self._lock:
+            self.tokens.refund(estimated - actual)
+
+    def _delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay / 10)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """
+        Delay before retry ``attempt`` (0-based), and pause every caller for it.
+
+        ``Retry-After`` is used when the server sent one. Otherwise the delay
+        is drawn uniformly from ``[0, min(max_delay, base_delay * 2**attempt)]``
+        ("full jitter"), so retries from many callers spread out.
+        """
+        delay = self._delay(attempt, retry_after)
+        with self._lock:
+            self._stats.retries += 1
+            self._blocked_until = max(self._blocked_until, self._clock() + delay)
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.drain()
+        return delay
+
+    def _failed(self, exc: Exception, attempt: int, tokens: int) -> Optional[float]:
+        """
+        Handle a failed attempt: refund its token reservation and return the
+        delay before retrying, or None to re-raise.
+        """
+        # A rejected request is not billed, so its estimate is returned
+        # before any backoff drains the bucket.
+        self.settle(tokens, 0)
+        if attempt >= self.max_retries:
+            return None
+        if is_rate_limited(exc):
+            return self.backoff(attempt, retry_after_seconds(exc))
+        if is_transient(exc):
+            with self._lock:
+                self._stats.retries += 1
+            return self._delay(attempt, retry_after_seconds(exc))
+        return None
+
+    def call(self, fn: Callable[[], T], tokens: int = 0) -> T:
+        """Run ``fn`` once its quota is available, retrying rate-limit and transient errors."""
+        attempt = 0
+        while True:
+            wait = self.reserve(tokens)
+            if wait:
+                time.sleep(wait)
+            try:
+                return fn()
+            except Exception as exc:
+                delay = self._failed(exc, attempt, tokens)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Async :meth:`call`; ``fn`` returns a fresh awaitable per attempt."""
+        attempt = 0
+        while True:
+            wait = self.reserve(tokens)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                return await fn()
+            except Exception as exc:
+                delay = self._failed(exc, attempt, tokens)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Rough token cost of a request: about four characters per prompt token, plus the completion budget."""
+    return len(prompt) // 4 + 1 + max_tokens
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """Whether ``exc`` is an HTTP 429 (or 503 overload) response from the provider."""
+    return _status(exc) in RETRYABLE_STATUS
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Whether ``exc`` is a failure worth retrying that is not a rate limit:
+    a timeout or dropped connection, or a 408, 409 or 5xx response.
+    """
+    status = _status(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS or (status >= 500 and status not in RETRYABLE_STATUS)
+    # The SDK's connection and timeout errors (APIConnectionError and its
+    # subclasses) carry no status; match them by name to avoid importing it.
+    if any(cls.__name__ == "APIConnectionError" for cls in type(exc).__mro__):
+        return True
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Seconds from the ``Retry-After`` (or ``retry-after-ms``) header of an error response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
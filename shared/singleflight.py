@@ -0,0 +1,104 @@
+"""Coalescing of identical in-flight calls.
+
+A response cache only helps once the first call has returned. When many
+workers build the same prompt at the same moment, they would all miss the
+cache and each pay for a request. ``SingleFlight`` lets the first caller for
+a key run the call while later callers with the same key wait and receive
+its result (or its exception).
+
+Threads and coroutines are tracked separately: thread callers share a
+``threading.Event``, and coroutines on one event loop share an
+``asyncio.Task``.
+"""
+
+import asyncio
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0
+    coalesced: int = 0
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Share one execution of a call among concurrent callers with the same key.
+
+    Only calls that overlap in time are merged; once a call finishes, the
+    next caller for its key starts a new one. Safe to share across threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._stats = SingleFlightStats()
+
+    @property
+    def stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(**vars(self._stats))
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Run ``fn`` unless a call for ``key`` is already running; either way return its result."""
+        with self._lock:
+            self._stats.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._stats.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Async :meth:`do`; ``fn`` is only called by the first caller for ``key``.
+
+        The shared call runs as its own task, so cancelling one waiting
+        caller does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats.calls += 1
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            if task is None:
+                task = tasks[key] = loop.create_task(fn())
+                task.add_done_callback(lambda _: tasks.pop(key, None))
+            else:
+                self._stats.coalesced += 1
+        return await asyncio.shield(task)
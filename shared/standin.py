@@ -0,0 +1,285 @@
+"""Local OpenAI-compatible stand-in server for offline and load testing.
+
+``StandInServer`` answers ``POST /v1/chat/completions`` the way the OpenAI
+API does, including streamed (server-sent event) responses and ``usage``
+counts. Latency, streaming speed and error rate are configurable, so
+throughput, concurrency, rate limiting and caching can be measured on a
+machine with no network access.
+
+Run it from the command line and point the agents at it::
+
+    python -m shared.standin --port 8787 --latency-ms 400 --jitter 0.5 --error-rate 0.02
+    LLM_PROVIDER=local python3 anomaly_pacing_agent/anomaly_pacing_agent.py
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple, Union
+
+# Seconds to wait before a response: a fixed number, or a function of the
+# server's random generator.
+Latency = Union[float, Callable[[random.Random], float]]
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> Callable[[random.Random], float]:
+    """Latency with a long right tail, like real model endpoints; ``median`` in seconds."""
+    mu = math.log(median) if median > 0 else 0.0
+    return lambda rng: rng.lognormvariate(mu, sigma) if median > 0 else 0.0
+
+
+def uniform_latency(low: float, high: float) -> Callable[[random.Random], float]:
+    """Latency drawn uniformly from ``[low, high]`` seconds."""
+    return lambda rng: rng.uniform(low, high)
+
+
+class _ChatCompletionsHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible ``/chat/completions`` endpoint."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.standin.lock:
+            self.server.standin.connections += 1
+
+    def do_POST(self) -> None:
+        standin: StandInServer = self.server.standin
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        error, delay = standin._next_response(body)
+        if delay > 0:
+            time.sleep(delay)
+        if error is not None:
+            self._error(*error)
+        elif body.get("stream"):
+            self._stream(body)
+        else:
+            self._complete(body)
+
+    def _complete(self, body) -> None:
+        standin: StandInServer = self.server.standin
+        prompt_tokens, completion_tokens = standin.count_tokens(body)
+        payload = json.dumps(
+            {
+                "id": "chatcmpl-standin",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "standin"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": f" {standin.reply} "},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: int, headers: dict) -> None:
+        payload = json.dumps({"error": {"message": "stand-in error", "type": "standin", "code": status}}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, body) -> None:
+        """Send the reply word by word as server-sent events, then usage if requested."""
+        standin: StandInServer = self.server.standin
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = f" {standin.reply} ".split(" ")
+        deltas = [w + " " for w in words[:-1]] + [words[-1]]
+        for i, delta in enumerate(deltas):
+            if i and standin.token_interval:
+                time.sleep(standin.token_interval)
+            event = {
+                "id": "chatcmpl-standin",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "standin"),
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            prompt_tokens, completion_tokens = standin.count_tokens(body)
+            event = {
+                "id": "chatcmpl-standin",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "standin"),
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args) -> None:  # noqa: A002
+        pass
+
+
+class StandInServer:
+    """
+    A local OpenAI-compatible chat completions server.
+
+    Settings are plain attributes and may be changed while it runs.
+
+    Args:
+        host: Interface to bind.
+        port: Port to bind (0 picks a free one; see :attr:`url`).
+        reply: Text every completion returns.
+        latency: Delay before each response (seconds, or a sampler such as
+            :func:`lognormal_latency`).
+        token_interval: Delay between streamed chunks, in seconds.
+        error_rate: Fraction of requests answered with ``error_status``.
+        error_status: HTTP status of random errors (429 by default).
+        retry_after: ``Retry-After`` seconds sent with random 429s (None to omit).
+        seed: Seed for latency and error sampling.
+
+    ``requests`` records each request body, and ``connections`` counts TCP
+    connections. ``errors`` is a queue of ``(status, headers)`` responses
+    sent, in order, before any normal reply.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        reply: str = "stub reply",
+        latency: Latency = 0.0,
+        token_interval: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        retry_after: Optional[float] = 1.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.reply = reply
+        self.latency = latency
+        self.token_interval = token_interval
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.requests: List[dict] = []
+        self.connections = 0
+        self.errors: List[Tuple[int, dict]] = []
+        self._rng = random.Random(seed)
+        self._httpd = ThreadingHTTPServer((host, port), _ChatCompletionsHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as ``OPENAI_BASE_URL``."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _next_response(self, body: dict) -> Tuple[Optional[Tuple[int, dict]], float]:
+        """Record ``body``; return the error to send (if any) and the delay before responding."""
+        with self.lock:
+            self.requests.append(body)
+            delay = self.latency(self._rng) if callable(self.latency) else self.latency
+            if self.errors:
+                return self.errors.pop(0), delay
+            if self.error_rate and self._rng.random() < self.error_rate:
+                headers = {}
+                if self.error_status == 429 and self.retry_after is not None:
+                    headers["Retry-After"] = f"{self.retry_after:g}"
+                return (self.error_status, headers), delay
+            return None, delay
+
+    def count_tokens(self, body: dict) -> Tuple[int, int]:
+        """``(prompt_tokens, completion_tokens)``, estimated at four characters per token."""
+        prompt = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+        return len(prompt) // 4 + 1, len(self.reply) // 4 + 1
+
+    def start(self) -> "StandInServer":
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve from the calling thread until interrupted."""
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--reply", default="This is a stand-in reply from the local test server.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Median response latency")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Log-normal sigma of the latency (0 = fixed)")
+    parser.add_argument("--token-interval-ms", type=float, default=0.0, help="Delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    median = args.latency_ms / 1000
+    server = StandInServer(
+        host=args.host,
+        port=args.port,
+        reply=args.reply,
+        latency=lognormal_latency(median, args.jitter) if args.jitter else median,
+        token_interval=args.token_interval_ms / 1000,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f"Stand-in LLM server on {server.url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
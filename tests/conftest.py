@@ -3,5 +3,43 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 # Ensure project root is in path for all tests
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shared import close_clients, metrics
+from shared.standin import StandInServer
+
+
+@pytest.fixture
+def llm_server(monkeypatch):
+    """Run a local stand-in LLM server and point the shared client at it."""
+    server = StandInServer().start()
+
+    monkeypatch.setattr("shared.llm._cache", None)
+    monkeypatch.setattr("shared.llm._cache_loaded", True)
+    monkeypatch.setattr("shared.llm._rate_limiter", None)
+    monkeypatch.setattr("shared.llm._rate_limiter_loaded", True)
+    monkeypatch.setattr("shared.llm._provider", None)
+    monkeypatch.delenv("LLM_PROVIDER", raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    close_clients()
+    try:
+        yield server
+    finally:
+        close_clients()
+        server.stop()
+
+
+@pytest.fixture
+def recording_metrics():
+    """Enable the shared instrumentation registry for one test, starting empty."""
+    metrics.reset()
+    metrics.enable()
+    try:
+        yield metrics
+    finally:
+        metrics.enable(False)
+        metrics.reset()
@@ -1,15 +1,80 @@
 """Tests for the Anomaly and Pacing Monitoring Agent."""
 
+import asyncio
+import pickle
+import random
+import statistics
 import sys
+from dataclasses import FrozenInstanceError, asdict, dataclass, fields
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
+import numpy as np
 import pytest
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from anomaly_pacing_agent import AnomalyDetector, DailyMetrics, Anomaly
+from anomaly_pacing_agent import (
+    Anomaly,
+    AnomalyDetector,
+    AnomalyReportingAgent,
+    DailyMetrics,
+    GuardrailRules,
+    MetricsColumns,
+    RobustZScore,
+    RollingStats,
+    SeasonalBaseline,
+    StreamingAnomalyDetector,
+)
+from anomaly_pacing_agent.columnar import exact_mean, grouped_exact_mean, grouped_median
+
+
+@dataclass(frozen=True, slots=True)
+class MetricsWithImpressions(DailyMetrics):
+    """DailyMetrics with real impressions, so CTR varies from row to row."""
+
+    impressions: int = 0
+
+    @property
+    def ctr(self) -> float:
+        return self.clicks / self.impressions if self.impressions > 0 else 0.0
+
+
+class ColumnsWithCTR(MetricsColumns):
+    """MetricsColumns whose ``ctr`` is assigned instead of derived from clicks."""
+
+    ctr = None
+
+
+def reference_detect(detector, metrics):
+    """The original per-record detector, kept to check the columnar engine against."""
+    anomalies = []
+    ctr_values = [m.ctr for m in metrics if m.clicks > 0]
+    ctr_avg = statistics.mean(ctr_values) if ctr_values else 0.0
+    budget = detector.daily_budget
+    for m in metrics:
+        if m.spend > budget * 1.25:
+            pct = (m.spend - budget) / budget * 100
+            anomalies.append(Anomaly(m.day, m.channel, "spend", m.spend, budget, pct, "up",
+                                     "warning" if pct < 50 else "critical", "Spend is above daily budget target."))
+        elif m.spend < budget * 0.75:
+            pct = (budget - m.spend) / budget * 100
+            anomalies.append(Anomaly(m.day, m.channel, "spend", m.spend, budget, pct, "down", "info",
+                                     "Spend is below pacing target."))
+        if m.conversions > 0 and m.cpa > detector.max_cpa:
+            pct = (m.cpa - detector.max_cpa) / detector.max_cpa * 100
+            anomalies.append(Anomaly(m.day, m.channel, "cpa", m.cpa, detector.max_cpa, pct, "up", "critical",
+                                     "CPA above guardrail threshold."))
+        if m.clicks > 0 and m.ctr < ctr_avg * 0.7:
+            pct = (ctr_avg - m.ctr) / ctr_avg * 100 if ctr_avg > 0 else 0
+            anomalies.append(Anomaly(m.day, m.channel, "ctr", m.ctr, ctr_avg, pct, "down", "warning",
+                                     "CTR significantly below rolling average."))
+        if m.clicks > 0 and m.cvr < detector.min_cvr:
+            pct = (detector.min_cvr - m.cvr) / detector.min_cvr * 100
+            anomalies.append(Anomaly(m.day, m.channel, "cvr", m.cvr, detector.min_cvr, pct, "down", "warning",
+                                     "Conversion rate below minimum target."))
+    return anomalies
 
 
 class TestDailyMetrics:
@@ -41,6 +106,35 @@ class TestDailyMetrics:
         metrics = DailyMetrics(day=1, channel="email", spend=100.0, clicks=50, conversions=5)
         assert metrics.cpa == 20.0
 
+    def test_is_frozen(self):
+        """Test that fields cannot be reassigned, so cached metrics cannot go stale."""
+        metrics = DailyMetrics(day=1, channel="email", spend=100.0, clicks=50, conversions=5)
+        with pytest.raises(FrozenInstanceError):
+            metrics.spend = 200.0
+
+    def test_cached_metrics_are_stable(self):
+        """Test that repeated access returns the same derived values as a fresh record."""
+        metrics = DailyMetrics(day=1, channel="email", spend=120.0, clicks=40, conversions=3)
+        first = (metrics.cpc, metrics.ctr, metrics.cvr, metrics.cpa)
+        fresh = DailyMetrics(day=1, channel="email", spend=120.0, clicks=40, conversions=3)
+
+        assert (metrics.cpc, metrics.ctr, metrics.cvr, metrics.cpa) == first
+        assert (fresh.cpa, fresh.cvr, fresh.ctr, fresh.cpc) == first[::-1]
+        assert first == (3.0, 0.1, 0.075, 40.0)
+        assert metrics == fresh
+
+    def test_asdict_has_only_public_fields(self):
+        """Test that cached metrics stay out of asdict(), fields() and repr."""
+        metrics = DailyMetrics(day=1, channel="email", spend=100.0, clicks=50, conversions=5, campaign="c1")
+        metrics.cpa  # populate a cache slot
+
+        data = asdict(metrics)
+        assert list(data) == ["day", "channel", "spend", "clicks", "conversions", "campaign"]
+        assert [f.name for f in fields(DailyMetrics)] == list(data)
+        assert DailyMetrics(**data) == metrics
+        assert "_cpa" not in repr(metrics)
+        assert pickle.loads(pickle.dumps(metrics)).cpa == 20.0
+
 
 class TestAnomalyDetector:
     """Tests for AnomalyDetector class."""
@@ -96,6 +190,427 @@ class TestAnomalyDetector:
         assert len(spend_anomalies) == 0
 
 
+class TestColumnarDetector:
+    """Tests for the vectorized detector and its column container."""
+
+    @pytest.fixture
+    def detector(self):
+        """Create an AnomalyDetector with standard thresholds."""
+        return AnomalyDetector(daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03)
+
+    @pytest.fixture
+    def random_metrics(self):
+        """Mixed rows covering every rule, zero clicks and zero conversions."""
+        rng = random.Random(7)
+        return [
+            DailyMetrics(
+                day=rng.randint(1, 30),
+                channel=rng.choice(["email", "paid_search", "paid_social", "display"]),
+                spend=round(rng.uniform(0, 2200), 2),
+                clicks=rng.choice([0, rng.randint(1, 5000)]),
+                conversions=rng.choice([0, rng.randint(0, 60)]),
+            )
+            for _ in range(3000)
+        ]
+
+    @pytest.fixture
+    def varied_ctr_metrics(self, random_metrics):
+        """The random rows with 1-20% CTR (some far below the mean), as records and as columns."""
+        rng = random.Random(13)
+        records = [
+            MetricsWithImpressions(**asdict(m), impressions=m.clicks * rng.randint(5, 100))
+            for m in random_metrics
+        ]
+        columns = ColumnsWithCTR(**vars(MetricsColumns.from_records(records)))
+        columns.ctr = np.array([m.ctr for m in records])
+        return records, columns
+
+    def test_matches_per_record_detector(self, detector, random_metrics, varied_ctr_metrics):
+        """Test that the columnar engine reproduces the original anomalies exactly."""
+        detector.baseline_by = "global"
+        expected = reference_detect(detector, random_metrics)
+
+        assert detector.detect(random_metrics) == expected
+        assert detector.detect(MetricsColumns.from_records(random_metrics)) == expected
+        assert {a.metric for a in expected} == {"spend", "cpa", "cvr"}
+
+        # DailyMetrics fixes CTR at 0.1; explicit impressions exercise the CTR rule.
+        records, columns = varied_ctr_metrics
+        expected = reference_detect(detector, records)
+        actual = detector.detect(columns)
+
+        assert actual == expected
+        assert {a.metric for a in expected} == {"spend", "cpa", "ctr", "cvr"}
+        assert any(a.metric == "ctr" for a in actual)
+
+    def test_exact_mean(self):
+        """Test that exact_mean rounds like statistics.mean (a NumPy mean of 0.1s is not 0.1)."""
+        rng = random.Random(3)
+        values = [rng.lognormvariate(0, 8) for _ in range(1000)] + [0.1] * 1000
+        assert exact_mean(values) == statistics.mean(values)
+
+    def test_grouped_exact_mean(self):
+        """Test one-pass group means against statistics.mean per group."""
+        rng = random.Random(5)
+        values = [rng.lognormvariate(0, 4) for _ in range(2000)]
+        groups = [rng.randrange(6) for _ in values]
+
+        means = grouped_exact_mean(values, groups, 7)
+
+        for g in range(6):
+            assert means[g] == statistics.mean([v for v, k in zip(values, groups) if k == g])
+        assert np.isnan(means[6])
+
+    def test_ctr_compares_against_own_channel(self, detector):
+        """Test that a low-CTR channel does not drag down another channel's baseline."""
+
+        class FixedCTR(MetricsColumns):
+            ctr = None
+
+        rows = [("email", 0.30), ("email", 0.32), ("email", 0.15), ("paid_social", 0.02), ("paid_social", 0.021)]
+        columns = FixedCTR(**vars(MetricsColumns.from_arrays(
+            day=[1] * 5,
+            channel=[c for c, _ in rows],
+            spend=[1000.0] * 5,
+            clicks=[100] * 5,
+            conversions=[5] * 5,
+            campaign=["a", "b", "a", None, None],
+        )))
+        columns.ctr = np.array([r for _, r in rows])
+
+        flagged = [(a.channel, a.value, a.baseline) for a in detector.detect(columns) if a.metric == "ctr"]
+        assert flagged == [("email", 0.15, statistics.mean([0.30, 0.32, 0.15]))]
+
+        detector.baseline_by = "global"
+        assert {a.channel for a in detector.detect(columns) if a.metric == "ctr"} == {"paid_social"}
+
+        detector.baseline_by = "campaign"
+        by_campaign = [a for a in detector.detect(columns) if a.metric == "ctr"]
+        assert [(a.campaign, a.baseline) for a in by_campaign] == [("a", statistics.mean([0.30, 0.15]))]
+
+    def test_unknown_baseline_grouping(self):
+        """Test that an unsupported grouping is rejected up front."""
+        with pytest.raises(ValueError):
+            AnomalyDetector(1000.0, 100.0, 0.02, 0.03, baseline_by="region")
+
+    def test_columns_round_trip(self, random_metrics):
+        """Test channel encoding and derived metrics against the dataclass."""
+        columns = MetricsColumns.from_records(random_metrics)
+
+        assert len(columns) == len(random_metrics)
+        assert columns.channel_names().tolist() == [m.channel for m in random_metrics]
+        assert columns.cpa.tolist() == [m.cpa for m in random_metrics]
+        assert columns.ctr.tolist() == [m.ctr for m in random_metrics]
+        assert columns.cpc.tolist() == [m.cpc for m in random_metrics]
+
+    def test_empty_input(self, detector):
+        """Test that no rows means no anomalies."""
+        assert detector.detect([]) == []
+
+
+class TestDetectionStrategies:
+    """Tests for the robust z-score and seasonal strategies."""
+
+    @pytest.fixture
+    def detector(self):
+        """Create an AnomalyDetector with standard thresholds."""
+        return AnomalyDetector(daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03)
+
+    def test_grouped_median(self):
+        """Test one-sort group medians against statistics.median per group."""
+        rng = random.Random(11)
+        groups = [rng.randrange(6) for _ in range(2001)]
+        values = [rng.uniform(-50, 50) for _ in groups]
+        medians = grouped_median(np.array(values), np.array(groups), 7)
+        for g in range(6):
+            assert medians[g] == statistics.median(v for v, gg in zip(values, groups) if gg == g)
+        assert np.isnan(medians[6])
+
+    def test_robust_zscore_flags_outlier(self, detector):
+        """Test that one spend spike is flagged and its channel's noise is not."""
+        rng = random.Random(2)
+        metrics = [
+            DailyMetrics(day=d, channel=channel, spend=1000 + rng.uniform(-50, 50), clicks=1000, conversions=40)
+            for d in range(1, 29)
+            for channel in ("email", "display")
+        ]
+        metrics.append(DailyMetrics(day=29, channel="email", spend=1200, clicks=1000, conversions=40))
+
+        anomalies = RobustZScore(metrics=("spend",)).evaluate(detector, MetricsColumns.from_records(metrics))[1]
+
+        assert [(a.day, a.channel, a.direction) for a in anomalies] == [(29, "email", "up")]
+        spend = [m.spend for m in metrics if m.channel == "email"]
+        assert anomalies[0].baseline == statistics.median(spend)
+        # The default guardrails see 1200 as within 25% of budget.
+        assert detector.detect(metrics) == []
+
+    def test_robust_zscore_direction(self, detector):
+        """Test that CPA is only flagged upward (a cheap day is not an anomaly)."""
+        metrics = [DailyMetrics(day=d, channel="email", spend=1000, clicks=1000, conversions=20 + d % 3)
+                   for d in range(1, 20)]
+        metrics.append(DailyMetrics(day=20, channel="email", spend=1000, clicks=1000, conversions=200))
+        metrics.append(DailyMetrics(day=21, channel="email", spend=1000, clicks=1000, conversions=5))
+
+        anomalies = RobustZScore(metrics=("cpa",)).evaluate(detector, MetricsColumns.from_records(metrics))[1]
+
+        assert [(a.day, a.direction) for a in anomalies] == [(21, "up")]
+
+    def test_seasonal_weekday_spike(self, detector):
+        """Test that a weekday is compared with the same weekday in earlier weeks."""
+        # Weekends (days 6 and 7 of each week) spend half as much.
+        metrics = [
+            DailyMetrics(day=d, channel="email", spend=500.0 if d % 7 in (6, 0) else 1000.0,
+                         clicks=1000, conversions=40)
+            for d in range(1, 36)
+        ]
+        strategy = SeasonalBaseline(metrics=("spend",))
+        assert strategy.evaluate(detector, MetricsColumns.from_records(metrics))[1] == []
+
+        # A weekend day spending a weekday amount is unusual for that weekday.
+        metrics[33] = DailyMetrics(day=34, channel="email", spend=1000.0, clicks=1000, conversions=40)
+        anomalies = strategy.evaluate(detector, MetricsColumns.from_records(metrics))[1]
+
+        assert [(a.day, a.baseline, a.deviation_pct, a.severity) for a in anomalies] == [
+            (34, 500.0, 100.0, "critical")
+        ]
+
+    def test_seasonal_needs_min_weeks(self, detector):
+        """Test that rows without enough history are skipped."""
+        metrics = [DailyMetrics(day=d, channel="email", spend=1000.0 * d, clicks=1000, conversions=40)
+                   for d in range(1, 15)]
+        anomalies = SeasonalBaseline(metrics=("spend",), min_weeks=2).evaluate(
+            detector, MetricsColumns.from_records(metrics))[1]
+        assert anomalies == []
+
+    def test_strategies_merge_in_row_order(self):
+        """Test that anomalies from several strategies come back by row, then strategy."""
+        detector = AnomalyDetector(
+            daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03,
+            strategies=[GuardrailRules(), RobustZScore(metrics=("spend",))],
+        )
+        metrics = [DailyMetrics(day=d, channel="email", spend=1000.0 + d % 3, clicks=1000, conversions=40)
+                   for d in range(1, 11)]
+        metrics[4] = DailyMetrics(day=5, channel="email", spend=2000.0, clicks=1000, conversions=40)
+
+        anomalies = detector.detect(metrics)
+
+        assert [(a.day, a.reason.startswith("Spend")) for a in anomalies] == [(5, True), (5, False)]
+
+    def test_default_strategy_unchanged(self, detector):
+        """Test that the default detector only runs the guardrail rules."""
+        assert [type(s) for s in detector.strategies] == [GuardrailRules]
+
+
+class TestDetectParallel:
+    """Tests for sharded multi-process detection."""
+
+    @pytest.fixture
+    def metrics(self):
+        """Rows over many channels and campaigns, in shuffled order."""
+        rng = random.Random(13)
+        return [
+            DailyMetrics(
+                day=rng.randint(1, 60),
+                channel=f"channel_{rng.randrange(12)}",
+                spend=round(rng.uniform(0, 2200), 2),
+                clicks=rng.choice([0, rng.randint(1, 5000)]),
+                conversions=rng.choice([0, rng.randint(0, 60)]),
+                campaign=f"campaign_{rng.randrange(5)}",
+            )
+            for _ in range(4000)
+        ]
+
+    @pytest.mark.parametrize("baseline_by", ["channel", "campaign"])
+    def test_matches_detect(self, metrics, baseline_by):
+        """Test that sharded output equals single-process detect, in order."""
+        detector = AnomalyDetector(
+            daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03, baseline_by=baseline_by,
+            strategies=[GuardrailRules(), RobustZScore(), SeasonalBaseline()],
+        )
+        expected = detector.detect(metrics)
+
+        assert detector.detect_parallel(metrics, workers=2, n_shards=5) == expected
+        assert len(expected) > 100
+
+    def test_series_stay_in_one_shard(self, metrics):
+        """Test that the shard depends only on the series key."""
+        from anomaly_pacing_agent.parallel import series_shards
+
+        detector = AnomalyDetector(daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03)
+        columns = MetricsColumns.from_records(metrics)
+        shards = series_shards(detector, columns, 7)
+        for code in range(len(columns.channels)):
+            assert len(set(shards[columns.channel == code].tolist())) == 1
+
+    def test_global_baseline_rejected(self, metrics):
+        """Test that a global baseline, which needs every row, cannot be sharded."""
+        detector = AnomalyDetector(
+            daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03, baseline_by="global"
+        )
+        with pytest.raises(ValueError, match="global"):
+            detector.detect_parallel(metrics, workers=2)
+
+    def test_empty(self):
+        """Test that no rows gives no anomalies without starting a pool."""
+        detector = AnomalyDetector(daily_budget=1000.0, max_cpa=100.0, min_ctr=0.02, min_cvr=0.03)
+        assert detector.detect_parallel([]) == []
+
+
+class TestStreamingDetector:
+    """Tests for rolling-window statistics and the incremental detector."""
+
+    def test_rolling_stats_match_window(self):
+        """Test windowed mean/std against a recomputation, with repeated keys per batch."""
+        rng = random.Random(11)
+        stats = RollingStats(window=5)
+        history = {}
+        for _ in range(100):
+            keys = [rng.choice("abc") for _ in range(rng.randint(1, 6))]
+            values = [rng.gauss(100, 10) for _ in keys]
+            stats.push(stats.slots(keys), values)
+            for key, value in zip(keys, values):
+                history.setdefault(key, []).append(value)
+
+        mean, std, count = stats.stats(stats.slots(["a", "b", "c", "missing"], create=False))
+        for i, key in enumerate("abc"):
+            window = history[key][-5:]
+            assert mean[i] == pytest.approx(statistics.mean(window))
+            assert std[i] == pytest.approx(statistics.stdev(window))
+            assert count[i] == 5
+        assert np.isnan(mean[3]) and count[3] == 0
+        assert len(stats) == 3
+
+    def test_absolute_rules_fire_immediately(self):
+        """Test that a single record is checked as soon as it arrives."""
+        detector = StreamingAnomalyDetector(1000.0, 100.0, 0.02, 0.03)
+        anomalies = detector.update(DailyMetrics(day=1, channel="paid_search", spend=1300.0, clicks=50, conversions=5))
+        assert [a.metric for a in anomalies] == ["spend", "cpa"]
+
+    def test_ctr_uses_prior_window(self):
+        """Test the relative CTR rule against the rolling mean of earlier batches only."""
+
+        class FixedCTR(MetricsColumns):
+            ctr = None
+
+        def day(ctr):
+            columns = FixedCTR(**vars(MetricsColumns.from_arrays([1], ["email"], [1000.0], [100], [50])))
+            columns.ctr = np.array([ctr])
+            return columns
+
+        detector = StreamingAnomalyDetector(1000.0, 100.0, 0.02, 0.03, window=3, min_periods=2)
+        assert detector.update_batch(day(0.10)) == []
+        assert detector.update_batch(day(0.01)) == []  # not enough history yet
+        for ctr in (0.10, 0.10, 0.10):
+            detector.update_batch(day(ctr))
+
+        flagged = detector.update_batch(day(0.05))
+        assert [(a.metric, a.baseline) for a in flagged] == [("ctr", pytest.approx(0.10))]
+        mean, std, count = detector.baseline("ctr", "email")
+        assert count == 3 and mean == pytest.approx((0.10 + 0.10 + 0.05) / 3)
+        assert detector.stats["ctr"].buffer.shape[1] == 3
+
+    def test_batch_rows_do_not_see_each_other(self):
+        """Test that one day's rows share the same pre-batch baselines."""
+        detector = StreamingAnomalyDetector(1000.0, 100.0, 0.02, 0.03, min_periods=1)
+        metrics = [DailyMetrics(day=1, channel="email", spend=900.0 + i, clicks=100, conversions=10) for i in range(4)]
+
+        assert detector.update_batch(metrics) == []
+        assert detector.baseline("spend", "email")[2] == 4
+
+    def test_checkpoint_round_trip(self, tmp_path):
+        """Test that a restored detector continues exactly where the saved one stopped."""
+        rng = random.Random(2)
+
+        def batch(day):
+            return [
+                DailyMetrics(day, rng.choice(["email", "paid_search"]), rng.uniform(600, 1400),
+                             rng.randint(0, 500), rng.randint(0, 20), campaign=rng.choice(["a", "b", None]))
+                for _ in range(40)
+            ]
+
+        detector = StreamingAnomalyDetector(1000.0, 100.0, 0.02, 0.03, baseline_by="campaign", window=5)
+        for day in range(1, 8):
+            detector.update_batch(batch(day))
+        path = tmp_path / "state" / "detector.npz"
+        detector.save_state(path)
+
+        restored = StreamingAnomalyDetector.load_state(path)
+
+        assert restored.baseline_by == "campaign" and restored.window == 5
+        assert restored.stats["spend"].keys == detector.stats["spend"].keys
+        assert ("email", None) in restored.stats["spend"].keys
+        upcoming = batch(8)
+        assert restored.update_batch(upcoming) == detector.update_batch(upcoming)
+        for metric in StreamingAnomalyDetector.METRICS:
+            assert restored.baseline(metric, "email", "a") == detector.baseline(metric, "email", "a")
+
+    def test_checkpoint_missing_or_other_version(self, tmp_path, monkeypatch):
+        """Test that an absent or incompatible checkpoint means a fresh start."""
+        path = tmp_path / "detector.npz"
+        assert StreamingAnomalyDetector.load_state(path) is None
+
+        StreamingAnomalyDetector(1000.0, 100.0, 0.02, 0.03).save_state(path)
+        assert StreamingAnomalyDetector.load_state(path) is not None
+        monkeypatch.setattr(StreamingAnomalyDetector, "STATE_VERSION", 2)
+        assert StreamingAnomalyDetector.load_state(path) is None
+
+
+class TestAnomalyReportingAgent:
+    """Tests for AnomalyReportingAgent class."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create a reporting agent with standard thresholds."""
+        return AnomalyReportingAgent(AnomalyDetector(1000.0, 100.0, 0.02, 0.03))
+
+    @patch("anomaly_pacing_agent.anomaly_pacing_agent.call_llm")
+    def test_detect_and_explain_record_stages(self, mock_llm, agent, recording_metrics):
+        """Test that detection and the LLM explanation are timed as separate stages."""
+        mock_llm.return_value = "Narrative."
+        anomalies = agent.detector.detect(
+            [DailyMetrics(day=1, channel="paid_search", spend=1300.0, clicks=100, conversions=10)]
+        )
+        agent.explain_anomalies(anomalies)
+
+        for stage in ("anomaly.detect", "anomaly.llm"):
+            assert recording_metrics.histogram("agent_stage_seconds", stage=stage).count == 1
+
+    @patch("anomaly_pacing_agent.anomaly_pacing_agent.acall_llm", new_callable=AsyncMock)
+    def test_aexplain_anomalies_awaits_llm(self, mock_llm, agent):
+        """Test that the async narrative uses the same prompt as the sync one."""
+        mock_llm.return_value = "Async narrative."
+        anomalies = agent.detector.detect(
+            [DailyMetrics(day=1, channel="paid_search", spend=1300.0, clicks=100, conversions=10)]
+        )
+
+        narrative = asyncio.run(agent.aexplain_anomalies(anomalies))
+
+        assert narrative == "Async narrative."
+        mock_llm.assert_awaited_once_with(agent.build_prompt(anomalies))
+
+    @patch("anomaly_pacing_agent.anomaly_pacing_agent.acall_llm", new_callable=AsyncMock)
+    def test_aexplain_no_anomalies_skips_llm(self, mock_llm, agent):
+        """Test that an empty anomaly list never reaches the LLM."""
+        narrative = asyncio.run(agent.aexplain_anomalies([]))
+
+        assert narrative == AnomalyReportingAgent.NO_ANOMALIES_MESSAGE
+        mock_llm.assert_not_awaited()
+
+    @patch("anomaly_pacing_agent.anomaly_pacing_agent.stream_llm")
+    def test_stream_explanation(self, mock_stream, agent):
+        """Test that streaming sends the same prompt and short-circuits empty input."""
+        anomalies = agent.detector.detect(
+            [DailyMetrics(day=1, channel="paid_search", spend=1300.0, clicks=100, conversions=10)]
+        )
+        agent.stream_explanation(anomalies)
+        mock_stream.assert_called_once_with(agent.build_prompt(anomalies))
+
+        stream = agent.stream_explanation([])
+        assert list(stream) == [AnomalyReportingAgent.NO_ANOMALIES_MESSAGE]
+        assert stream.total_seconds is not None
+        mock_stream.assert_called_once()
+
+
 class TestAnomaly:
     """Tests for Anomaly dataclass."""
 
@@ -0,0 +1,75 @@
+"""Tests for the benchmark suite runner."""
+
+import json
+import sys
+from pathlib import Path
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.run_benchmarks import compare, main
+
+
+class TestCompare:
+    """Tests for regression detection against a baseline."""
+
+    def test_slowdown_past_threshold_is_a_regression(self):
+        """Test that only slowdowns beyond the threshold are reported."""
+        baseline = {"a": {"seconds": 1.0}, "b": {"seconds": 1.0}}
+        results = {"a": {"seconds": 1.15}, "b": {"seconds": 1.5}}
+
+        regressions = compare(results, baseline, threshold=0.2)
+
+        assert len(regressions) == 1
+        assert regressions[0].startswith("b:")
+
+    def test_tiny_workloads_ignore_timer_noise(self):
+        """Test that a large relative but tiny absolute slowdown passes."""
+        assert compare({"a": {"seconds": 0.002}}, {"a": {"seconds": 0.001}}) == []
+
+    def test_peak_memory_regression(self):
+        """Test that peak memory growth beyond its own threshold is reported."""
+        baseline = {"a": {"seconds": 1.0, "peak_mb": 100.0}}
+        results = {"a": {"seconds": 1.0, "peak_mb": 150.0}}
+
+        assert len(compare(results, baseline, memory_threshold=0.2)) == 1
+        assert compare(results, baseline, memory_threshold=0.6) == []
+
+    def test_unmatched_workloads_are_ignored(self):
+        """Test that workloads on only one side are skipped."""
+        assert compare({"new": {"seconds": 9.0}}, {"old": {"seconds": 1.0}}) == []
+
+
+class TestRunner:
+    """Tests for the command-line runner."""
+
+    ARGS = ["--utm-urls", "50", "--corpus-sizes", "100", "--detect-rows", "500", "--repeat", "1"]
+
+    def test_saves_results_and_passes_against_itself(self, tmp_path, capsys):
+        """Test that a saved run is a passing baseline for an identical run."""
+        path = tmp_path / "baseline.json"
+
+        assert main(self.ARGS + ["--save", str(path)]) == 0
+        saved = json.loads(path.read_text())
+        assert set(saved["results"]) == {
+            "utm.check_rules[50]",
+            "rag.corpus_build[100]",
+            "rag.most_similar[100]",
+            "anomaly.detect[500]",
+        }
+        assert all(r["peak_mb"] >= 0 and r["items_per_sec"] > 0 for r in saved["results"].values())
+        assert "python" in saved["environment"]
+
+        # Generous thresholds so the comparison run cannot fail on noise.
+        assert main(self.ARGS + ["--baseline", str(path), "--threshold", "100", "--memory-threshold", "100"]) == 0
+
+    def test_fails_on_regression(self, tmp_path, capsys):
+        """Test that the exit status is 1 when the baseline was much faster."""
+        path = tmp_path / "baseline.json"
+        path.write_text(json.dumps({"results": {"anomaly.detect[500]": {"seconds": 1e-9}}}))
+
+        status = main(["--only", "anomaly", "--detect-rows", "500", "--repeat", "1", "--no-memory",
+                       "--baseline", str(path), "--threshold", "0", "--min-delta-ms", "0"])
+
+        assert status == 1
+        assert "anomaly.detect[500]" in capsys.readouterr().out
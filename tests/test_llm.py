@@ -0,0 +1,696 @@
+"""Tests for the shared LLM utilities."""
+
+import asyncio
+import json
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shared import (
+    LLMClientConfig,
+    Instrumentation,
+    LLMResponseCache,
+    acall_llm,
+    aclose_clients,
+    call_llm,
+    close_clients,
+    RateLimiter,
+    configure_cache,
+    configure_provider,
+    configure_rate_limiter,
+    gather_bounded,
+    get_async_client,
+    get_client,
+    metrics,
+    stream_llm,
+)
+from shared.providers import Completion, LLMProvider, OpenAIProvider
+from shared.ratelimit import TokenBucket, retry_after_seconds
+from shared.singleflight import SingleFlight
+from shared.standin import lognormal_latency, uniform_latency
+
+
+class TestClientRegistry:
+    """Tests for the pooled client registry."""
+
+    def test_get_client_is_reused(self, llm_server):
+        """Test that repeated lookups return the same client."""
+        assert get_client() is get_client()
+
+    def test_distinct_config_gets_distinct_client(self, llm_server):
+        """Test that pool settings are part of the registry key."""
+        small_pool = LLMClientConfig(max_connections=2, max_keepalive_connections=1)
+        assert get_client(config=small_pool) is not get_client()
+
+    def test_close_clients_resets_registry(self, llm_server):
+        """Test that close_clients forces a fresh client."""
+        first = get_client()
+        close_clients()
+        assert get_client() is not first
+
+    def test_aclose_clients_closes_loop_clients(self, llm_server):
+        """Test that aclose_clients closes the running loop's async clients."""
+
+        async def main():
+            client = get_async_client()
+            await aclose_clients()
+            return client, get_async_client()
+
+        first, second = asyncio.run(main())
+        assert first.is_closed()
+        assert second is not first
+
+    def test_close_clients_closes_async_clients(self, llm_server):
+        """Test that close_clients closes async clients on an idle or running loop."""
+        idle = asyncio.new_event_loop()
+        try:
+            async def fetch():
+                return get_async_client()
+
+            idle_client = idle.run_until_complete(fetch())
+            close_clients()
+            assert idle_client.is_closed()
+        finally:
+            idle.close()
+
+        async def main():
+            client = get_async_client()
+            close_clients()
+            for _ in range(10):
+                await asyncio.sleep(0)
+            return client
+
+        assert asyncio.run(main()).is_closed()
+
+    def test_missing_api_key_exits(self, monkeypatch):
+        """Test that a missing key still fails loudly."""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        with pytest.raises(SystemExit):
+            get_client()
+
+    def test_config_from_env(self, monkeypatch):
+        """Test reading pool settings from the environment."""
+        monkeypatch.setenv("LLM_MAX_CONNECTIONS", "7")
+        monkeypatch.setenv("LLM_TIMEOUT", "2.5")
+        config = LLMClientConfig.from_env()
+        assert config.max_connections == 7
+        assert config.timeout == 2.5
+
+
+class TestCallLLM:
+    """Tests for call_llm against a local stand-in server."""
+
+    def test_call_llm_returns_stripped_text(self, llm_server):
+        """Test that the response content is returned stripped."""
+        assert call_llm("hello") == "stub reply"
+        assert llm_server.requests[0]["messages"][0]["content"] == "hello"
+
+    def test_sequential_calls_share_one_connection(self, llm_server):
+        """Test that keep-alive reuses a single TCP connection."""
+        for _ in range(5):
+            call_llm("ping")
+        assert len(llm_server.requests) == 5
+        assert llm_server.connections == 1
+
+    def test_concurrent_calls_are_bounded_by_pool(self, llm_server):
+        """Test that threads share one client and reuse pooled connections."""
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            replies = list(pool.map(call_llm, ["ping"] * 20))
+        assert replies == ["stub reply"] * 20
+        assert llm_server.connections <= 4
+
+
+class TestStreamLLM:
+    """Tests for streaming responses."""
+
+    def test_stream_yields_chunks_and_timings(self, llm_server):
+        """Test that chunks arrive incrementally and join to the call_llm text."""
+        llm_server.reply = "one two three"
+        stream = stream_llm("hello")
+        assert stream.time_to_first_token is None
+
+        chunks = list(stream)
+
+        assert len(chunks) > 1
+        assert "".join(chunks).strip() == stream.text.strip() == "one two three"
+        assert llm_server.requests[0]["stream"] is True
+        assert 0 <= stream.time_to_first_token <= stream.total_seconds
+        assert "time to first token" in stream.timing_summary()
+
+    def test_stream_uses_cache(self, llm_server, tmp_path):
+        """Test that a completed stream is cached and replayed as one chunk."""
+        configure_cache(LLMResponseCache(path=tmp_path / "c.sqlite"))
+        assert "".join(stream_llm("same prompt")).strip() == "stub reply"
+
+        assert list(stream_llm("same prompt")) == ["stub reply"]
+        assert call_llm("same prompt") == "stub reply"
+        assert len(llm_server.requests) == 1
+
+
+class TestAsyncLLM:
+    """Tests for acall_llm and gather_bounded."""
+
+    def test_acall_llm_returns_stripped_text(self, llm_server):
+        """Test the async call against the stand-in server."""
+        assert asyncio.run(acall_llm("hello")) == "stub reply"
+
+    def test_many_async_calls_share_pool(self, llm_server):
+        """Test that concurrent coroutines reuse the loop's pooled client."""
+
+        async def run():
+            return await gather_bounded((acall_llm("ping") for _ in range(30)), limit=5)
+
+        assert asyncio.run(run()) == ["stub reply"] * 30
+        assert llm_server.connections <= 5
+
+    def test_gather_bounded_limits_concurrency_and_keeps_order(self):
+        """Test that no more than ``limit`` awaitables run at once."""
+        state = {"active": 0, "peak": 0}
+
+        async def work(i):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.001 * (10 - i % 10))
+            state["active"] -= 1
+            return i
+
+        results = asyncio.run(gather_bounded((work(i) for i in range(50)), limit=4))
+        assert results == list(range(50))
+        assert state["peak"] == 4
+
+    def test_gather_bounded_rejects_zero_limit(self):
+        """Test that a non-positive limit is rejected."""
+        with pytest.raises(ValueError):
+            asyncio.run(gather_bounded([], limit=0))
+
+
+class TestResponseCache:
+    """Tests for the two-tier LLM response cache."""
+
+    def test_key_covers_all_parameters(self):
+        """Test that any change in model, sampling or prompt changes the key."""
+        base = LLMResponseCache.make_key("gpt-4o-mini", 0.3, 400, "prompt")
+        assert base == LLMResponseCache.make_key("gpt-4o-mini", 0.3, 400, "prompt")
+        assert base != LLMResponseCache.make_key("gpt-4o", 0.3, 400, "prompt")
+        assert base != LLMResponseCache.make_key("gpt-4o-mini", 0.7, 400, "prompt")
+        assert base != LLMResponseCache.make_key("gpt-4o-mini", 0.3, 200, "prompt")
+        assert base != LLMResponseCache.make_key("gpt-4o-mini", 0.3, 400, "prompt ")
+
+    def test_memory_lru_eviction_and_stats(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = LLMResponseCache(max_memory_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        assert cache.get("a") == "1"
+        cache.set("c", "3")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        stats = cache.stats()
+        assert (stats.hits, stats.misses, stats.memory_evictions, stats.disk_evictions) == (2, 1, 1, 0)
+        assert stats.hit_rate == pytest.approx(2 / 3)
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Test that a new cache instance reads entries written by an old one."""
+        path = tmp_path / "llm_cache.sqlite"
+        first = LLMResponseCache(path=path)
+        first.set("key", "persisted")
+        first.close()
+
+        second = LLMResponseCache(path=path)
+        assert second.get("key") == "persisted"
+        assert second.stats().disk_hits == 1
+        second.close()
+
+    def test_ttl_expiry(self, tmp_path, monkeypatch):
+        """Test that entries older than the TTL are treated as misses."""
+        now = [1000.0]
+        monkeypatch.setattr("shared.cache.time.time", lambda: now[0])
+        cache = LLMResponseCache(path=tmp_path / "c.sqlite", ttl_seconds=60)
+        cache.set("key", "value")
+
+        now[0] += 30
+        assert cache.get("key") == "value"
+        now[0] += 60
+        assert cache.get("key") is None
+        assert len(cache) == 0
+        assert cache.stats().expirations == 1
+
+    def test_disk_size_eviction(self, tmp_path, monkeypatch):
+        """Test that the disk tier drops least recently used rows over budget."""
+        now = [0.0]
+        monkeypatch.setattr("shared.cache.time.time", lambda: now[0])
+        cache = LLMResponseCache(path=tmp_path / "c.sqlite", max_disk_bytes=25)
+        for key in ("a", "b", "c"):
+            now[0] += 1
+            cache.set(key, "x" * 10)
+
+        assert len(cache) == 2
+        stats = cache.stats()
+        assert (stats.disk_evictions, stats.memory_evictions) == (1, 0)
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_memory_hits_keep_entry_on_disk(self, tmp_path, monkeypatch):
+        """Test that a key served repeatedly from memory is not the first disk eviction."""
+        now = [0.0]
+        monkeypatch.setattr("shared.cache.time.time", lambda: now[0])
+        cache = LLMResponseCache(path=tmp_path / "c.sqlite", max_disk_bytes=25)
+        for key in ("hot", "warm"):
+            now[0] += 1
+            cache.set(key, "x" * 10)
+        for _ in range(5):
+            now[0] += 1
+            assert cache.get("hot") == "x" * 10
+
+        now[0] += 1
+        cache.set("new", "x" * 10)
+
+        assert cache.get("hot") == "x" * 10
+        assert cache.get("warm") is None
+        assert cache.stats().disk_hits == 0
+        cache.close()
+
+        reopened = LLMResponseCache(path=tmp_path / "c.sqlite")
+        assert reopened.get("hot") == "x" * 10
+        reopened.close()
+
+    def test_purge_expired_counts_each_key_once(self, tmp_path, monkeypatch):
+        """Test that purge_expired counts keys from both tiers without double counting."""
+        now = [0.0]
+        monkeypatch.setattr("shared.cache.time.time", lambda: now[0])
+        cache = LLMResponseCache(path=tmp_path / "c.sqlite", max_memory_entries=1, ttl_seconds=10)
+        cache.set("a", "1")
+        cache.set("b", "2")  # pushes "a" out of memory; both stay on disk
+        now[0] += 1
+        cache.set("c", "3")
+
+        now[0] += 10
+        assert cache.purge_expired() == 2
+        assert len(cache) == 1
+        cache.close()
+
+    def test_call_llm_serves_repeats_from_cache(self, llm_server, tmp_path):
+        """Test that identical prompts reach the server once per cache lifetime."""
+        configure_cache(LLMResponseCache(path=tmp_path / "c.sqlite"))
+
+        assert call_llm("same prompt") == "stub reply"
+        assert call_llm("same prompt") == "stub reply"
+        assert asyncio.run(acall_llm("same prompt")) == "stub reply"
+        assert call_llm("same prompt", use_cache=False) == "stub reply"
+        assert call_llm("same prompt", max_tokens=50) == "stub reply"
+
+        assert len(llm_server.requests) == 3
+
+
+class TestRateLimiter:
+    """Tests for RPM/TPM pacing and rate-limit retries."""
+
+    @pytest.fixture
+    def clock(self):
+        """A manual clock: call it for the time, append to advance."""
+        now = [0.0]
+        return now
+
+    def test_token_bucket_reservations_queue_up(self, clock):
+        """Test that reservations beyond the bucket wait in proportion to their size."""
+        bucket = TokenBucket(capacity=2, rate=1.0, clock=lambda: clock[0])
+        assert [bucket.reserve(1) for _ in range(4)] == [0.0, 0.0, 1.0, 2.0]
+        clock[0] += 10
+        assert bucket.reserve(1) == 0.0
+        assert bucket.reserve(5) == pytest.approx(4.0)
+
+    def test_paces_requests_and_tokens(self, clock):
+        """Test that whichever quota is tighter sets the wait."""
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600, headroom=1.0,
+                              burst_seconds=1, clock=lambda: clock[0])
+        assert limiter.reserve(10) == 0.0
+        assert limiter.reserve(10) == pytest.approx(1.0)  # requests: 1 per second
+        assert limiter.reserve(25) == pytest.approx(3.5)  # tokens: 10 per second
+        stats = limiter.stats
+        assert (stats.requests, stats.throttled) == (3, 2)
+
+    def test_settle_refunds_unused_tokens(self, clock):
+        """Test that actual usage from the response replaces the estimate."""
+        limiter = RateLimiter(tokens_per_minute=600, headroom=1.0, burst_seconds=1, clock=lambda: clock[0])
+        limiter.reserve(30)
+        limiter.settle(30, 10)
+        assert limiter.reserve(0) == pytest.approx(0.0)
+
+    def test_retry_after_pauses_every_caller(self, clock):
+        """Test that a Retry-After delay blocks new reservations too."""
+        limiter = RateLimiter(requests_per_minute=6000, base_delay=0.0, clock=lambda: clock[0])
+        assert limiter.backoff(0, retry_after=5.0) == pytest.approx(5.0)
+        assert limiter.reserve(0) == pytest.approx(5.0, abs=0.1)
+
+    def test_backoff_is_jittered_and_capped(self):
+        """Test full-jitter delays grow with the attempt but stay under max_delay."""
+        limiter = RateLimiter(base_delay=1.0, max_delay=8.0)
+        delays = [limiter.backoff(attempt, None) for attempt in range(10) for _ in range(20)]
+        assert all(0 <= d <= 8.0 for d in delays)
+        assert len(set(delays)) > 100
+
+    def test_retry_after_header_formats(self):
+        """Test Retry-After in seconds, in milliseconds, and as an HTTP date."""
+
+        class Error(Exception):
+            def __init__(self, headers):
+                self.response = type("Response", (), {"headers": headers, "status_code": 429})()
+
+        assert retry_after_seconds(Error({"retry-after": "3"})) == 3.0
+        assert retry_after_seconds(Error({"retry-after-ms": "250", "retry-after": "3"})) == 0.25
+        assert retry_after_seconds(Error({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+        assert retry_after_seconds(Error({"retry-after": "soon"})) is None
+        assert retry_after_seconds(Error({})) is None
+
+    def test_call_llm_retries_429(self, llm_server, monkeypatch):
+        """Test that call_llm waits out a 429 and then succeeds."""
+        sleeps = []
+        monkeypatch.setattr("shared.ratelimit.time.sleep", sleeps.append)
+        configure_rate_limiter(RateLimiter(requests_per_minute=6000, base_delay=0.01))
+        llm_server.errors = [(429, {"Retry-After": "2"}), (429, {})]
+
+        assert call_llm("prompt") == "stub reply"
+        assert len(llm_server.requests) == 3
+        assert sleeps[0] >= 2.0
+
+        configure_rate_limiter(RateLimiter(requests_per_minute=6000, base_delay=0.01))
+        llm_server.errors = [(429, {"Retry-After": "0"})]
+        assert asyncio.run(acall_llm("prompt")) == "stub reply"
+        assert len(llm_server.requests) == 5
+
+    def test_gives_up_after_max_retries(self, llm_server, monkeypatch):
+        """Test that persistent 429s and other errors are re-raised."""
+        monkeypatch.setattr("shared.ratelimit.time.sleep", lambda seconds: None)
+        configure_rate_limiter(RateLimiter(max_retries=2, base_delay=0.01))
+        llm_server.errors = [(429, {})] * 3 + [(400, {})]
+
+        with pytest.raises(Exception) as info:
+            call_llm("prompt")
+        assert getattr(info.value, "status_code", None) == 429
+        assert len(llm_server.requests) == 3
+
+        with pytest.raises(Exception) as info:
+            call_llm("prompt")
+        assert getattr(info.value, "status_code", None) == 400
+        assert len(llm_server.requests) == 4
+
+    def test_sdk_retries_are_disabled_under_limiter(self, llm_server, monkeypatch):
+        """Test that with the default client config, only the limiter retries 429s."""
+        monkeypatch.delenv("LLM_MAX_RETRIES", raising=False)
+        monkeypatch.setattr("shared.ratelimit.time.sleep", lambda seconds: None)
+        assert get_client().max_retries == 2
+        configure_rate_limiter(RateLimiter(max_retries=2, base_delay=0.01))
+        assert get_client().max_retries == 0
+
+        llm_server.errors = [(429, {"Retry-After": "0"})] * 10
+        with pytest.raises(Exception) as info:
+            call_llm("prompt")
+        assert getattr(info.value, "status_code", None) == 429
+        assert len(llm_server.requests) == 3  # one try plus the limiter's two retries
+
+    def test_limiter_retries_transient_errors(self, llm_server, monkeypatch):
+        """Test that 5xx responses are retried by the limiter without pausing other callers."""
+        monkeypatch.setattr("shared.ratelimit.time.sleep", lambda seconds: None)
+        limiter = RateLimiter(max_retries=3, base_delay=0.01)
+        configure_rate_limiter(limiter)
+        llm_server.errors = [(500, {}), (502, {})]
+
+        assert call_llm("prompt") == "stub reply"
+        assert len(llm_server.requests) == 3
+        assert limiter.stats.retries == 2
+        assert limiter.reserve(0) == 0.0
+
+    @pytest.mark.parametrize("status, expected_wait", [(500, 0.0), (429, 0.8)])
+    def test_failed_attempts_refund_tokens(self, clock, status, expected_wait):
+        """Test that each rejected attempt's token reservation is returned."""
+        limiter = RateLimiter(tokens_per_minute=600, headroom=1.0, burst_seconds=1, max_retries=2,
+                              base_delay=0.0, clock=lambda: clock[0])
+
+        class Rejected(Exception):
+            status_code = status
+
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise Rejected()
+            return "ok"
+
+        assert limiter.call(flaky, tokens=8) == "ok"
+        # Only the successful attempt stays charged. A 429 also drains the
+        # bucket, but the failed reservations do not push it further negative.
+        assert limiter.reserve(0) == pytest.approx(expected_wait)
+
+class TestSingleFlight:
+    """Tests for coalescing identical in-flight requests."""
+
+    def test_concurrent_threads_share_one_request(self, llm_server):
+        """Test that identical concurrent prompts reach the server once."""
+        llm_server.latency = 0.2
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            replies = list(pool.map(call_llm, ["same prompt"] * 8 + ["other prompt"] * 4))
+
+        assert replies == ["stub reply"] * 12
+        assert sorted(r["messages"][0]["content"] for r in llm_server.requests) == ["other prompt", "same prompt"]
+
+    def test_concurrent_coroutines_share_one_request(self, llm_server):
+        """Test that identical concurrent acall_llm calls reach the server once."""
+        llm_server.latency = 0.2
+
+        async def main():
+            return await asyncio.gather(*(acall_llm("same prompt") for _ in range(10)))
+
+        assert asyncio.run(main()) == ["stub reply"] * 10
+        assert len(llm_server.requests) == 1
+
+    def test_opt_out_and_later_calls_are_not_merged(self, llm_server):
+        """Test that use_cache=False and non-overlapping calls each send a request."""
+        llm_server.latency = 0.1
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda p: call_llm(p, use_cache=False), ["same prompt"] * 4))
+        assert len(llm_server.requests) == 4
+
+        call_llm("same prompt")
+        call_llm("same prompt")
+        assert len(llm_server.requests) == 6
+
+    def test_errors_reach_every_waiter(self, llm_server, monkeypatch):
+        """Test that a failed shared request raises in every coalesced caller."""
+        monkeypatch.setenv("LLM_MAX_RETRIES", "0")
+        llm_server.latency = 0.2
+        llm_server.errors = [(400, {})]
+
+        def attempt(_):
+            try:
+                return call_llm("same prompt")
+            except Exception as exc:
+                return getattr(exc, "status_code", None)
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            assert list(pool.map(attempt, range(5))) == [400] * 5
+        assert len(llm_server.requests) == 1
+
+    def test_cancelled_waiter_does_not_cancel_shared_call(self):
+        """Test that cancelling one coroutine leaves the call running for the others."""
+        flight = SingleFlight()
+        started = []
+
+        async def work():
+            started.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def main():
+            first = asyncio.ensure_future(flight.ado("k", work))
+            second = asyncio.ensure_future(flight.ado("k", work))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second, first.cancelled()
+
+        assert asyncio.run(main()) == ("done", True)
+        assert started == [1]
+        stats = flight.stats
+        assert (stats.calls, stats.coalesced) == (2, 1)
+
+
+class TestProviders:
+    """Tests for provider selection and the local stand-in server."""
+
+    def test_local_provider_needs_no_api_key(self, llm_server, monkeypatch):
+        """Test that LLM_PROVIDER=local talks to the stand-in without OPENAI_API_KEY."""
+        monkeypatch.delenv("OPENAI_API_KEY")
+        monkeypatch.delenv("OPENAI_BASE_URL")
+        monkeypatch.setenv("LLM_PROVIDER", "local")
+        monkeypatch.setenv("LLM_LOCAL_URL", llm_server.url)
+
+        assert call_llm("hello") == "stub reply"
+        assert len(llm_server.requests) == 1
+
+    def test_unknown_provider(self, llm_server, monkeypatch):
+        """Test that an unknown provider name is rejected."""
+        monkeypatch.setenv("LLM_PROVIDER", "nope")
+        with pytest.raises(ValueError, match="nope"):
+            call_llm("hello")
+
+    def test_configured_provider_serves_every_entry_point(self, llm_server):
+        """Test that call_llm, acall_llm and stream_llm all go through the installed provider."""
+
+        class Upper(LLMProvider):
+            def complete(self, prompt, model, temperature, max_tokens):
+                return Completion(prompt.upper())
+
+            async def acomplete(self, prompt, model, temperature, max_tokens):
+                return Completion(prompt.upper())
+
+            def stream(self, prompt, model, temperature, max_tokens):
+                return iter(prompt.upper().split(" "))
+
+        configure_provider(Upper())
+        assert call_llm("a b") == "A B"
+        assert asyncio.run(acall_llm("c d")) == "C D"
+        assert list(stream_llm("e f")) == ["E", "F"]
+        assert llm_server.requests == []
+
+    def test_usage_is_reported(self, llm_server):
+        """Test that the stand-in reports token usage and the provider passes it on."""
+        completion = OpenAIProvider().complete("x" * 40, "gpt-4o-mini", 0.0, 50)
+        assert completion.text.strip() == "stub reply"
+        assert (completion.prompt_tokens, completion.completion_tokens) == (11, 3)
+        assert completion.total_tokens == 14
+
+    def test_random_errors_are_retried(self, llm_server, monkeypatch):
+        """Test that a flaky stand-in is absorbed by the rate limiter's retries."""
+        llm_server.error_rate = 0.5
+        llm_server.retry_after = 0
+        llm_server._rng.seed(1)
+        configure_rate_limiter(RateLimiter(max_retries=20, base_delay=0.001))
+
+        replies = [call_llm(f"prompt {i}") for i in range(10)]
+
+        assert replies == ["stub reply"] * 10
+        assert len(llm_server.requests) > 10
+
+    def test_latency_and_streaming_speed(self, llm_server):
+        """Test that configured latency and chunk spacing are observable by callers."""
+        llm_server.latency = uniform_latency(0.05, 0.06)
+        llm_server.token_interval = 0.02
+        llm_server.reply = "one two three four"
+
+        stream = stream_llm("hello")
+        assert "".join(stream).strip() == "one two three four"
+        assert stream.time_to_first_token >= 0.05
+        assert stream.total_seconds - stream.time_to_first_token >= 0.06
+        assert lognormal_latency(0.2, 0.0)(random.Random(0)) == pytest.approx(0.2)
+
+
+class TestInstrumentation:
+    """Tests for opt-in stage timers and LLM usage metrics."""
+
+    def test_disabled_records_nothing(self, llm_server):
+        """Test that with instrumentation off, stages are no-ops and nothing is kept."""
+        assert not metrics.enabled
+        assert metrics.stage("a") is metrics.stage("b")
+        with metrics.stage("utm.parse"):
+            pass
+        call_llm("hello")
+
+        assert metrics.to_json() == {"counters": {}, "histograms": {}}
+        assert metrics.to_prometheus() == ""
+
+    def test_tokens_and_latency_from_usage(self, llm_server, recording_metrics):
+        """Test that request latency and the reported token usage are recorded per model."""
+        llm_server.latency = 0.02
+        call_llm("x" * 40, model="m1")
+
+        latency = recording_metrics.histogram("llm_request_seconds", model="m1")
+        assert latency.count == 1
+        assert latency.sum >= 0.02
+        assert recording_metrics.value("llm_tokens_total", model="m1", kind="prompt") == 11
+        assert recording_metrics.value("llm_tokens_total", model="m1", kind="completion") == 3
+
+    def test_streamed_call_records_latency_and_usage(self, llm_server, recording_metrics):
+        """Test that a streamed request is timed until exhausted and records usage from the final chunk."""
+        llm_server.latency = 0.3
+        llm_server.token_interval = 0.02
+        llm_server.reply = "one two three"
+
+        stream = stream_llm("x" * 40, model="m1").timed("test.llm")
+        assert recording_metrics.histogram("agent_stage_seconds", stage="test.llm") is None
+        assert "".join(stream).strip() == "one two three"
+
+        stage = recording_metrics.histogram("agent_stage_seconds", stage="test.llm")
+        request = recording_metrics.histogram("llm_request_seconds", model="m1")
+        assert stage.count == request.count == 1
+        assert stage.sum >= 0.3 + 2 * 0.02
+        assert request.sum >= 0.3 + 2 * 0.02
+        assert llm_server.requests[0]["stream_options"] == {"include_usage": True}
+        assert recording_metrics.value("llm_tokens_total", model="m1", kind="prompt") == 11
+        assert recording_metrics.value("llm_tokens_total", model="m1", kind="completion") == 4
+
+    def test_closed_stream_records_stage(self, llm_server, recording_metrics):
+        """Test that abandoning a stream part way still ends and records its stage."""
+        llm_server.latency = 0.1
+        llm_server.reply = "one two three"
+
+        stream = stream_llm("hello").timed("test.llm")
+        assert next(iter(stream)).strip() == "one"
+        stream.close()
+
+        assert recording_metrics.histogram("agent_stage_seconds", stage="test.llm").sum >= 0.1
+        assert recording_metrics.histogram("llm_request_seconds", model="gpt-4o-mini").count == 1
+
+    def test_calls_counted_by_source(self, llm_server, recording_metrics):
+        """Test that calls are split into api, coalesced and cache hits."""
+        configure_cache(LLMResponseCache())
+        llm_server.latency = 0.2
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(call_llm, ["same prompt"] * 4))
+        call_llm("same prompt")
+        asyncio.run(acall_llm("same prompt"))
+
+        sources = {
+            source: recording_metrics.value("llm_calls_total", model="gpt-4o-mini", source=source)
+            for source in ("api", "coalesced", "cache")
+        }
+        assert sources == {"api": 1, "coalesced": 3, "cache": 2}
+        assert len(llm_server.requests) == 1
+
+    def test_histogram_quantiles(self):
+        """Test bucket counts and interpolated quantiles."""
+        registry = Instrumentation(enabled=True, buckets=(0.1, 0.2, 0.4))
+        for seconds in (0.05, 0.15, 0.15, 0.3, 1.0):
+            registry.observe("latency", seconds)
+
+        histogram = registry.histogram("latency")
+        assert histogram.cumulative() == [1, 3, 4, 5]
+        assert histogram.quantile(0.5) == pytest.approx(0.175)
+        assert histogram.quantile(0.99) == 0.4
+        assert registry.to_json()["histograms"]["latency"][0]["p50"] == pytest.approx(0.175)
+
+    def test_prometheus_text_and_write(self, tmp_path):
+        """Test the exposition format and that write() picks it by file suffix."""
+        registry = Instrumentation(enabled=True, buckets=(0.5, 1.0))
+        registry.count("llm_calls_total", model="m", source="api")
+        with registry.stage('odd"name'):
+            pass
+
+        text = registry.to_prometheus()
+        assert "# TYPE llm_calls_total counter\n" in text
+        assert 'llm_calls_total{model="m",source="api"} 1\n' in text
+        assert 'agent_stage_seconds_bucket{stage="odd\\"name",le="0.5"} 1\n' in text
+        assert 'agent_stage_seconds_bucket{stage="odd\\"name",le="+Inf"} 1\n' in text
+        assert 'agent_stage_seconds_count{stage="odd\\"name"} 1\n' in text
+
+        registry.write(tmp_path / "metrics.prom")
+        registry.write(tmp_path / "metrics.json")
+        assert (tmp_path / "metrics.prom").read_text() == text
+        data = json.loads((tmp_path / "metrics.json").read_text())
+        assert data["counters"]["llm_calls_total"] == [{"labels": {"model": "m", "source": "api"}, "value": 1}]
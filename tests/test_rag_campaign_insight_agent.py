@@ -1,16 +1,24 @@
 """Tests for the RAG Campaign Insight Agent."""
 
+import asyncio
 import json
 import sys
+from dataclasses import replace
 from pathlib import Path
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch, MagicMock
 
 import pytest
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+import numpy as np
+from scipy import sparse
+
+from benchmarks.workloads import synthetic_corpus
 from rag_campaign_insight_agent import Campaign, CampaignCorpus, RAGCampaignInsightAgent
+from rag_campaign_insight_agent.rag_campaign_insight_agent import fingerprint_file
+from rag_campaign_insight_agent.retrieval import ExactBackend, IVFBackend, _top_k_1d, benchmark_recall
 
 
 class TestCampaign:
@@ -99,6 +107,314 @@ class TestCampaignCorpus:
         top_campaign, top_score = similar[0]
         assert top_campaign.channel == "email"
 
+    def test_most_similar_batch_matches_single(self, sample_campaigns):
+        """Test that batched retrieval returns the same rankings as one-at-a-time."""
+        corpus = CampaignCorpus(sample_campaigns)
+        briefs = ["email nurture for mid market", "enterprise paid search", "smb social awareness", "xyz"]
+
+        batched = corpus.most_similar_batch(briefs, top_n=2, block_size=3)
+
+        assert len(batched) == len(briefs)
+        for brief, results in zip(briefs, batched):
+            expected = corpus.most_similar(brief, top_n=2)
+            assert [(c.id, round(s, 9)) for c, s in results] == [(c.id, round(s, 9)) for c, s in expected]
+        assert batched[1][0][0].id == "C002"
+        # "xyz" scores 0.0 everywhere; ties rank later campaigns first, as a full argsort()[::-1] did.
+        assert [c.id for c, _ in batched[3]] == ["C003", "C002"]
+
+    def test_most_similar_batch_edge_cases(self, sample_campaigns):
+        """Test empty input and top_n larger than the corpus."""
+        corpus = CampaignCorpus(sample_campaigns)
+        corpus.remove_campaign("C003")
+
+        assert corpus.most_similar_batch([]) == []
+        assert len(corpus.most_similar_batch(["email"], top_n=10)[0]) == 2
+
+    def test_top_k_orders_best_first(self):
+        """Test the argpartition-based selection."""
+        sims = np.array([[0.1, 0.9, 0.3, 0.7, 0.5], [0.5, 0.4, 0.3, 0.2, 0.1]])
+        assert CampaignCorpus._top_k(sims, 3).tolist() == [[1, 3, 4], [0, 1, 2]]
+        assert CampaignCorpus._top_k(sims, 9).shape == (2, 5)
+
+    def test_top_k_breaks_ties_like_full_sort(self):
+        """Test that tied scores keep the order of a full ``argsort()[::-1]``."""
+        rng = np.random.default_rng(0)
+        sims = rng.integers(0, 4, size=(50, 12)).astype(float)
+        sims[0] = 0.0
+        for k in (1, 3, 7, 12):
+            expected = np.argsort(sims, axis=1, kind="stable")[:, ::-1][:, :k]
+            assert CampaignCorpus._top_k(sims, k).tolist() == expected.tolist()
+            assert [_top_k_1d(row, k).tolist() for row in sims] == expected.tolist()
+
+    @pytest.fixture
+    def new_campaign(self):
+        """A campaign added after the corpus was built."""
+        return Campaign(
+            id="C004",
+            name="Email Winback",
+            channel="email",
+            audience="smb",
+            objective="retention",
+            kpis={"open_rate": 0.22},
+            summary="Email winback campaign for lapsed SMB customers.",
+        )
+
+    def test_add_campaigns_without_refit(self, sample_campaigns, new_campaign):
+        """Test that added campaigns are searchable before compaction."""
+        corpus = CampaignCorpus(sample_campaigns)
+        vocabulary = dict(corpus.vectorizer.vocabulary_)
+
+        corpus.add_campaigns([new_campaign])
+
+        assert len(corpus) == 4
+        assert corpus.matrix.shape[0] == 3  # still in the delta segment
+        assert corpus.vectorizer.vocabulary_ == vocabulary
+        ids = [c.id for c, _ in corpus.most_similar("email campaign for smb customers", top_n=2)]
+        assert ids[0] == "C004"
+
+    def test_remove_campaign_hides_row(self, sample_campaigns):
+        """Test that removed campaigns drop out of results."""
+        corpus = CampaignCorpus(sample_campaigns)
+
+        assert corpus.remove_campaign("C001")
+        assert not corpus.remove_campaign("C001")
+
+        similar = corpus.most_similar("email nurture campaign for mid market", top_n=3)
+        assert len(similar) == 2
+        assert all(c.id != "C001" for c, _ in similar)
+
+    def test_compact_matches_incremental_scores(self, sample_campaigns, new_campaign):
+        """Test that compaction changes layout but not results."""
+        corpus = CampaignCorpus(sample_campaigns)
+        corpus.add_campaigns([new_campaign])
+        corpus.remove_campaign("C002")
+        brief = "email campaign for smb customers"
+        before = [(c.id, round(s, 9)) for c, s in corpus.most_similar(brief, top_n=5)]
+
+        corpus.compact()
+
+        assert corpus.matrix.shape[0] == 3
+        assert [c.id for c in corpus.campaigns] == ["C001", "C003", "C004"]
+        assert [(c.id, round(s, 9)) for c, s in corpus.most_similar(brief, top_n=5)] == before
+
+    def test_add_replaces_existing_id_and_auto_compacts(self, sample_campaigns, new_campaign):
+        """Test upsert-by-id and the compaction threshold."""
+        corpus = CampaignCorpus(sample_campaigns, compact_threshold=2)
+        updated = replace(sample_campaigns[0], summary="Rewritten winback summary.")
+
+        corpus.add_campaigns([updated, new_campaign])
+
+        assert len(corpus) == 4
+        assert corpus.matrix.shape[0] == 4
+        assert [c.summary for c in corpus.campaigns if c.id == "C001"] == ["Rewritten winback summary."]
+
+    def test_filters_score_only_matching_rows(self, sample_campaigns, new_campaign):
+        """Test channel/audience filters, including delta and removed rows."""
+        corpus = CampaignCorpus(sample_campaigns)
+        corpus.add_campaigns([new_campaign])
+        brief = "email campaign for smb customers"
+
+        email = corpus.most_similar(brief, top_n=5, filters={"channel": "email"})
+        assert sorted(c.id for c, _ in email) == ["C001", "C004"]
+        unfiltered = dict((c.id, s) for c, s in corpus.most_similar(brief, top_n=5))
+        assert all(s == pytest.approx(unfiltered[c.id]) for c, s in email)
+
+        filters = {"channel": {"email", "paid_search"}, "audience": "smb"}
+        both = corpus.most_similar(brief, top_n=5, filters=filters)
+        assert [c.id for c, _ in both] == ["C004"]
+
+        corpus.remove_campaign("C004")
+        assert [c.id for c, _ in corpus.most_similar(brief, filters={"channel": ["email"]})] == ["C001"]
+        assert corpus.most_similar_batch([brief], filters={"channel": "display"}) == [[]]
+
+        corpus.compact()
+        assert corpus.filter_rows({"audience": "smb"}).tolist() == [2]
+        with pytest.raises(ValueError):
+            corpus.filter_rows({"name": "x"})
+
+    def test_reweight_learns_new_terms(self, sample_campaigns, new_campaign):
+        """Test that reweight refits vocabulary over the live campaigns."""
+        corpus = CampaignCorpus(sample_campaigns)
+        corpus.add_campaigns([new_campaign])
+        assert "winback" not in corpus.vectorizer.vocabulary_
+
+        corpus.reweight()
+
+        assert "winback" in corpus.vectorizer.vocabulary_
+        assert corpus.most_similar("winback", top_n=1)[0][0].id == "C004"
+
+
+class TestCorpusIndex:
+    """Tests for saving and memory-mapping a prebuilt TF-IDF index."""
+
+    @pytest.fixture
+    def history_path(self):
+        """The bundled campaign history."""
+        return Path(__file__).resolve().parent.parent / "rag_campaign_insight_agent" / "campaign_history.json"
+
+    @pytest.fixture
+    def kpi_path(self):
+        """The bundled KPI dictionary."""
+        return Path(__file__).resolve().parent.parent / "rag_campaign_insight_agent" / "kpi_dictionary.yaml"
+
+    def test_round_trip_matches_fitted_corpus(self, history_path, kpi_path, tmp_path):
+        """Test that a loaded index ranks exactly like a freshly fitted one."""
+        fitted = RAGCampaignInsightAgent(history_path, kpi_path).corpus
+        fitted.save_index(tmp_path, "fp")
+
+        loaded = CampaignCorpus.load_index(tmp_path, fitted.campaigns, "fp")
+
+        # Read-only means the arrays are views of the memory-mapped files, not copies.
+        assert not loaded.matrix.data.flags.writeable
+        brief = "paid search free trial campaign for mid market"
+        assert [(c.id, round(s, 9)) for c, s in loaded.most_similar(brief, top_n=5)] == [
+            (c.id, round(s, 9)) for c, s in fitted.most_similar(brief, top_n=5)
+        ]
+
+    def test_resave_over_mapped_index(self, history_path, kpi_path, tmp_path):
+        """Test that saving a memory-mapped index over its own directory keeps it intact."""
+        fitted = RAGCampaignInsightAgent(history_path, kpi_path).corpus
+        fitted.save_index(tmp_path, "fp")
+        brief = "paid search free trial campaign for mid market"
+        expected = [(c.id, round(s, 9)) for c, s in fitted.most_similar(brief, top_n=5)]
+
+        loaded = CampaignCorpus.load_index(tmp_path, fitted.campaigns, "fp", mmap=True)
+        loaded.save_index(tmp_path, "fp")
+        reloaded = CampaignCorpus.load_index(tmp_path, fitted.campaigns, "fp", mmap=True)
+
+        assert reloaded.matrix.nnz == fitted.matrix.nnz
+        assert [(c.id, round(s, 9)) for c, s in loaded.most_similar(brief, top_n=5)] == expected
+        assert [(c.id, round(s, 9)) for c, s in reloaded.most_similar(brief, top_n=5)] == expected
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_stale_or_missing_index_is_ignored(self, history_path, kpi_path, tmp_path):
+        """Test that a fingerprint or version mismatch forces a rebuild."""
+        corpus = RAGCampaignInsightAgent(history_path, kpi_path).corpus
+        assert CampaignCorpus.load_index(tmp_path, corpus.campaigns, "fp") is None
+
+        corpus.save_index(tmp_path, "fp")
+        assert CampaignCorpus.load_index(tmp_path, corpus.campaigns, "other") is None
+        assert CampaignCorpus.load_index(tmp_path, corpus.campaigns[:-1], "fp") is None
+
+    def test_agent_builds_then_reuses_index(self, history_path, kpi_path, tmp_path):
+        """Test that the agent saves an index once and then loads it without fitting."""
+        index_dir = tmp_path / "index"
+        RAGCampaignInsightAgent(history_path, kpi_path, index_dir=index_dir)
+        meta = json.loads((index_dir / "meta.json").read_text())
+        assert meta["fingerprint"] == fingerprint_file(history_path)
+
+        with patch("rag_campaign_insight_agent.rag_campaign_insight_agent.TfidfVectorizer.fit_transform") as fit:
+            agent = RAGCampaignInsightAgent(history_path, kpi_path, index_dir=index_dir)
+
+        fit.assert_not_called()
+        assert len(agent.corpus.most_similar("email onboarding", top_n=2)) == 2
+
+
+class TestRetrievalBackends:
+    """Tests for pluggable exact and IVF retrieval backends."""
+
+    @pytest.fixture
+    def synthetic(self):
+        """A small synthetic corpus with clustered topics."""
+        return synthetic_corpus(2000)
+
+    def test_ivf_scores_match_exact(self, synthetic):
+        """Test that IVF results are exactly re-scored and recall is high."""
+        corpus, briefs = synthetic
+        exact = {b: dict((c.id, s) for c, s in corpus.most_similar(b, top_n=5)) for b in briefs}
+
+        corpus.set_backend(IVFBackend())
+        try:
+            hits = 0
+            for brief in briefs:
+                for campaign, score in corpus.most_similar(brief, top_n=5):
+                    if campaign.id in exact[brief]:
+                        hits += 1
+                        assert score == pytest.approx(exact[brief][campaign.id])
+            assert hits / (5 * len(briefs)) >= 0.8
+        finally:
+            corpus.set_backend(None)
+
+    def test_exact_backend_has_full_recall(self, synthetic):
+        """Test the recall harness against itself."""
+        corpus, briefs = synthetic
+        stats = benchmark_recall(corpus, ExactBackend(), briefs[:10], top_n=5)
+        assert stats["recall"] == 1.0
+
+    def test_backend_follows_add_and_remove(self, sample_campaigns_with_backend):
+        """Test that pending and compacted updates are visible through the backend."""
+        corpus = sample_campaigns_with_backend
+        corpus.add_campaigns(
+            [
+                Campaign(
+                    id="C010",
+                    name="Winback Email",
+                    channel="email",
+                    audience="smb",
+                    objective="retention",
+                    kpis={},
+                    summary="Winback email for lapsed smb customers.",
+                )
+            ]
+        )
+        corpus.remove_campaign("C001")
+        assert corpus.most_similar("winback lapsed", top_n=1)[0][0].id == "C010"
+        assert "C001" not in [c.id for c, _ in corpus.most_similar("email", top_n=10)]
+
+        corpus.compact()
+        assert corpus.most_similar("winback lapsed", top_n=1)[0][0].id == "C010"
+        assert "C001" not in [c.id for c, _ in corpus.most_similar("email", top_n=10)]
+
+    @pytest.mark.parametrize("shape", [(1, 1), (1, 6), (2, 1), (2, 2), (3, 2)])
+    def test_ivf_fits_tiny_matrices(self, shape):
+        """Test that IVF fits corpora too small for SVD or k-means and matches exact search."""
+        rng = np.random.default_rng(0)
+        matrix = sparse.csr_matrix(rng.random(shape) + 0.1)
+        exact = ExactBackend()
+        exact.fit(matrix)
+        backend = IVFBackend(n_probe=8, rerank_factor=8)
+        backend.fit(matrix)
+
+        indices, scores = backend.search(matrix, shape[0])
+        expected_indices, expected_scores = exact.search(matrix, shape[0])
+        assert np.array_equal(np.sort(indices, axis=1), np.sort(expected_indices, axis=1))
+        assert np.allclose(np.sort(scores, axis=1), np.sort(expected_scores, axis=1))
+
+    def test_single_campaign_corpus_with_ivf(self, sample_campaigns_with_backend):
+        """Test that a one-campaign corpus can use the IVF backend and grow afterwards."""
+        first = sample_campaigns_with_backend.campaigns[0]
+        corpus = CampaignCorpus([first], backend=IVFBackend())
+        assert corpus.most_similar("email nurture", top_n=3)[0][0].id == first.id
+
+        corpus.add_campaigns(sample_campaigns_with_backend.campaigns[1:])
+        corpus.compact()
+        assert sorted(c.id for c, _ in corpus.most_similar("campaign", top_n=4)) == ["C001", "C002", "C003", "C004"]
+
+    @pytest.fixture
+    def sample_campaigns_with_backend(self):
+        """A tiny corpus searched through an IVF backend."""
+        campaigns = [
+            Campaign(
+                id=f"C00{i}",
+                name=name,
+                channel=channel,
+                audience="enterprise",
+                objective="acquisition",
+                kpis={},
+                summary=summary,
+            )
+            for i, (name, channel, summary) in enumerate(
+                [
+                    ("Email Launch", "email", "Email nurture campaign for product launch."),
+                    ("Search Trial", "paid_search", "Paid search free trial signup campaign."),
+                    ("Social Awareness", "paid_social", "LinkedIn awareness campaign for enterprise."),
+                    ("Display Retarget", "display", "Display retargeting for trial visitors."),
+                ],
+                start=1,
+            )
+        ]
+        return CampaignCorpus(campaigns, backend=IVFBackend(n_components=2, n_lists=2, n_probe=2))
+
 
 class TestRAGCampaignInsightAgent:
     """Tests for RAGCampaignInsightAgent class."""
@@ -151,3 +467,43 @@ class TestRAGCampaignInsightAgent:
 
         mock_llm.assert_called_once()
         assert insight == "Based on similar campaigns, here are insights..."
+
+    @patch("rag_campaign_insight_agent.rag_campaign_insight_agent.call_llm")
+    def test_generate_insight_records_stages(self, mock_llm, agent, recording_metrics):
+        """Test that vectorize, similarity, prompt build and LLM time are recorded separately."""
+        mock_llm.return_value = "Insight."
+        agent.generate_insight("Plan a new email campaign")
+
+        for stage in ("rag.vectorize", "rag.similarity", "rag.prompt", "rag.llm"):
+            assert recording_metrics.histogram("agent_stage_seconds", stage=stage).count == 1
+
+    @patch("rag_campaign_insight_agent.rag_campaign_insight_agent.acall_llm", new_callable=AsyncMock)
+    def test_agenerate_insight_awaits_llm(self, mock_llm, agent):
+        """Test that agenerate_insight awaits the async LLM call."""
+        mock_llm.return_value = "Async insight."
+
+        insight = asyncio.run(agent.agenerate_insight("Plan a new email campaign"))
+
+        mock_llm.assert_awaited_once()
+        assert insight == "Async insight."
+
+    def test_stream_insight_times_the_llm_stage(self, agent, llm_server, recording_metrics):
+        """Test that the rag.llm stage covers the streamed request, not just its creation."""
+        llm_server.latency = 0.3
+
+        stream = agent.stream_insight("Plan a new email campaign")
+        assert recording_metrics.histogram("agent_stage_seconds", stage="rag.llm") is None
+        "".join(stream)
+
+        assert recording_metrics.histogram("agent_stage_seconds", stage="rag.llm").sum >= 0.3
+
+    def test_stream_insight_prints_chunks(self, agent, llm_server, capsys):
+        """Test that a streamed insight is echoed as it arrives, with timings."""
+        llm_server.reply = "Lean into email nurture."
+
+        agent.print_stream(agent.stream_insight("Plan a new email campaign"))
+
+        out, err = capsys.readouterr()
+        assert out.strip() == "Lean into email nurture."
+        assert "time to first token" in err
+        assert llm_server.requests[0]["stream"] is True
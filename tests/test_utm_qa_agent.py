@@ -1,15 +1,19 @@
 """Tests for the UTM QA Agent."""
 
+import asyncio
+import io
+import json
 import sys
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from ai_utm_qa_agent import UTMQAAgent, UTMCheckResult, UTMCheckIssue
+from ai_utm_qa_agent import CompiledTaxonomy, UTMQAAgent, UTMCheckResult, UTMCheckIssue
+from ai_utm_qa_agent.pipeline import detect_format, iter_inputs, stream_results, write_results
 
 
 class TestUTMQAAgent:
@@ -72,6 +76,283 @@ class TestUTMQAAgent:
         assert result.channel_guess == "email"
         assert result.is_pass  # No errors expected
 
+    def test_check_rules_skips_llm(self, agent):
+        """Test that the rules-only path never calls the LLM."""
+        with patch("ai_utm_qa_agent.utm_qa_agent.call_llm") as mock_llm:
+            result = agent.check_rules("utm_source=email&utm_medium=email")
+
+        mock_llm.assert_not_called()
+        assert result.explanation == ""
+        assert not result.is_pass
+
+    @patch("ai_utm_qa_agent.utm_qa_agent.call_llm")
+    def test_run_check_records_stages(self, mock_llm, agent, recording_metrics):
+        """Test that parse, checks and LLM time are recorded as separate stages."""
+        mock_llm.return_value = "Summary."
+        agent.run_check("utm_source=email&utm_medium=email")
+
+        for stage in ("utm.parse", "utm.checks", "utm.llm"):
+            assert recording_metrics.histogram("agent_stage_seconds", stage=stage).count == 1
+
+    @patch("ai_utm_qa_agent.utm_qa_agent.acall_llm", new_callable=AsyncMock)
+    def test_arun_checks_matches_sync_rules(self, mock_llm, agent):
+        """Test that the async batch path returns one result per input, in order."""
+        mock_llm.return_value = "Async summary."
+        inputs = [
+            "https://example.com/?utm_source=email&utm_medium=email&utm_campaign=fy25_a",
+            "utm_source=newsletter&utm_medium=email",
+        ]
+
+        results = asyncio.run(agent.arun_checks(inputs, concurrency=2))
+
+        assert [r.original_url for r in results] == inputs
+        assert [r.is_pass for r in results] == [True, False]
+        assert all(r.explanation == "Async summary." for r in results)
+        assert mock_llm.await_count == 2
+
+
+class TestCompiledTaxonomy:
+    """Tests for the precomputed taxonomy lookups."""
+
+    @pytest.fixture
+    def taxonomy(self):
+        """A taxonomy with overlapping prefixes and a shared medium."""
+        return {
+            "required_params": ["utm_source", "utm_medium"],
+            "allowed_values": {
+                "utm_source": ["email", "google", "linkedin"],
+                "utm_medium": ["email", "cpc", "social"],
+                "utm_campaign_prefixes": ["fy25_", "fy25.q1_", "brand+"],
+            },
+            "channel_defaults": {
+                "paid_search": {"utm_source": "google", "utm_medium": "cpc"},
+                "bing": {"utm_source": "bing", "utm_medium": "cpc"},
+                "paid_social": {"utm_source": "linkedin", "utm_medium": "social"},
+            },
+        }
+
+    def test_from_dict(self, taxonomy):
+        """Test the derived lookup structures."""
+        compiled = CompiledTaxonomy.from_dict(taxonomy)
+
+        assert compiled.allowed_sources == frozenset({"email", "google", "linkedin"})
+        assert compiled.medium_to_channel == {"cpc": "paid_search", "social": "paid_social"}
+        assert compiled.campaign_prefix_pattern.match("brand+spring")
+        assert not compiled.campaign_prefix_pattern.match("fy25xq1_")
+
+    def test_matches_linear_scan(self, taxonomy):
+        """Test that compiled checks give the same answers as the raw lists."""
+        agent = UTMQAAgent()
+        agent.taxonomy = taxonomy
+        agent.compile_taxonomy()
+        allowed = taxonomy["allowed_values"]
+
+        for campaign in ["fy25_x", "fy25.q1_y", "fy25-q1_z", "brand+a", "brand_a", "x"]:
+            issues = agent.check_allowed_values({"utm_campaign": campaign})
+            expected = any(campaign.startswith(p) for p in allowed["utm_campaign_prefixes"])
+            assert (not issues) == expected
+        for medium in ["cpc", "social", "email", "display"]:
+            expected = next(
+                (c for c, d in taxonomy["channel_defaults"].items() if d["utm_medium"] == medium), None
+            )
+            assert agent.guess_channel({"utm_source": "other", "utm_medium": medium}) == expected
+
+    def test_messages_keep_original_lists(self):
+        """Test that issue messages still quote the taxonomy lists."""
+        agent = UTMQAAgent()
+        issues = agent.check_allowed_values({"utm_source": "newsletter"})
+        assert str(agent.taxonomy["allowed_values"]["utm_source"]) in issues[0].message
+
+
+class TestRunBatch:
+    """Tests for the bulk validation mode."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create a UTMQAAgent instance."""
+        return UTMQAAgent()
+
+    @pytest.fixture
+    def inputs(self):
+        """Inputs with two repeated issue signatures plus one clean URL."""
+        return [
+            "https://example.com/a?utm_source=email&utm_medium=email",
+            "https://example.com/b?utm_source=email&utm_medium=email",
+            "https://example.com/c?utm_source=email&utm_medium=email&utm_campaign=fy25_x",
+            "https://example.com/d?utm_source=email&utm_medium=email&utm_campaign=fy25_y",
+            "https://example.com/e?utm_source=email&utm_medium=email",
+        ]
+
+    def test_rules_only_makes_no_llm_calls(self, agent, inputs):
+        """Test that rules-only mode matches run_check without calling the LLM."""
+        with patch("ai_utm_qa_agent.utm_qa_agent.call_llm") as mock_llm:
+            results = agent.run_batch(inputs, rules_only=True)
+
+        mock_llm.assert_not_called()
+        assert [r.original_url for r in results] == inputs
+        assert [r.is_pass for r in results] == [False, False, True, True, False]
+        assert all(r.explanation == "" for r in results)
+
+    @patch("ai_utm_qa_agent.utm_qa_agent.call_llm")
+    def test_one_llm_call_per_signature(self, mock_llm, agent, inputs):
+        """Test that identical issue sets share a single explanation."""
+        mock_llm.side_effect = lambda prompt: "missing" if "Missing" in prompt else "clean"
+
+        results = agent.run_batch(inputs)
+
+        assert mock_llm.call_count == 2
+        assert [r.explanation for r in results] == ["missing", "missing", "clean", "clean", "missing"]
+        assert all("Suggested URL" not in call.args[0] for call in mock_llm.call_args_list)
+
+    @patch("ai_utm_qa_agent.utm_qa_agent.acall_llm", new_callable=AsyncMock)
+    def test_arun_batch_matches_run_batch(self, mock_llm, agent, inputs):
+        """Test that the async batch groups the same way as the sync one."""
+        mock_llm.return_value = "shared"
+
+        results = asyncio.run(agent.arun_batch(inputs, concurrency=2))
+
+        assert mock_llm.await_count == 2
+        assert all(r.explanation == "shared" for r in results)
+
+
+class TestPipeline:
+    """Tests for streaming ingestion and output."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create a UTMQAAgent instance."""
+        return UTMQAAgent()
+
+    def test_iter_inputs_txt_skips_blanks_and_comments(self):
+        """Test plain-text input parsing."""
+        stream = io.StringIO("# header\nutm_source=email\n\n  https://example.com/?a=b  \n")
+        assert list(iter_inputs(stream, "txt")) == ["utm_source=email", "https://example.com/?a=b"]
+
+    def test_iter_inputs_csv_uses_named_column(self):
+        """Test CSV input with a header row."""
+        stream = io.StringIO("id,url\n1,utm_source=email\n2,\n3,utm_source=display\n")
+        assert list(iter_inputs(stream, "csv")) == ["utm_source=email", "utm_source=display"]
+
+    def test_iter_inputs_csv_without_header(self):
+        """Test CSV input where every row is data."""
+        stream = io.StringIO("utm_source=email,x\nutm_source=display,y\n")
+        assert list(iter_inputs(stream, "csv")) == ["utm_source=email", "utm_source=display"]
+
+    def test_iter_inputs_jsonl_strings_and_objects(self):
+        """Test JSONL input with bare strings and objects."""
+        stream = io.StringIO('"utm_source=email"\n{"url": "utm_source=display"}\n{"other": 1}\n')
+        assert list(iter_inputs(stream, "jsonl")) == ["utm_source=email", "utm_source=display"]
+
+    def test_iter_inputs_csv_header_is_case_insensitive(self):
+        """Test that a header like 'URL' is matched, not checked as an input."""
+        stream = io.StringIO("ID, URL \n1,utm_source=email\n")
+        assert list(iter_inputs(stream, "csv")) == ["utm_source=email"]
+
+    def test_iter_inputs_csv_missing_column_fails_clearly(self):
+        """Test that a header row without the requested column raises."""
+        stream = io.StringIO("id,link\n1,utm_source=email\n")
+        with pytest.raises(ValueError, match="no 'url' column"):
+            list(iter_inputs(stream, "csv"))
+
+    def test_iter_inputs_jsonl_skips_bad_lines(self):
+        """Test that malformed or non-object JSONL lines are reported and skipped."""
+        stream = io.StringIO(
+            '"utm_source=email"\n42\nnull\n[1, 2]\n{not json\n{"url": 7}\n{"url": "utm_source=display"}\n'
+            '{"other": 1}\n{"url": ""}\n""\n'
+        )
+        skipped = []
+
+        values = list(iter_inputs(stream, "jsonl", on_skip=lambda n, reason: skipped.append((n, reason))))
+
+        assert values == ["utm_source=email", "utm_source=display"]
+        assert [n for n, _ in skipped] == [2, 3, 4, 5, 6, 8, 9, 10]
+        assert skipped[-2] == (9, "missing 'url'")
+
+    def test_detect_format(self):
+        """Test format detection from file extensions."""
+        assert detect_format("urls.CSV", ("txt", "csv", "jsonl"), "txt") == "csv"
+        assert detect_format("urls.json", ("txt", "csv", "jsonl"), "txt") == "jsonl"
+        assert detect_format("-", ("jsonl", "csv"), "jsonl") == "jsonl"
+
+    def test_stream_results_is_lazy(self, agent):
+        """Test that results are produced before the input is exhausted."""
+        consumed = []
+
+        def source():
+            for i in range(10):
+                consumed.append(i)
+                yield f"utm_source=email&utm_medium=email&utm_campaign=fy25_{i}"
+
+        results = stream_results(agent, source(), rules_only=True, chunk_size=3)
+        first = next(results)
+
+        assert first.is_pass
+        assert len(consumed) == 3
+
+    @patch("ai_utm_qa_agent.utm_qa_agent.call_llm")
+    def test_stream_results_reuses_explanations_across_chunks(self, mock_llm, agent):
+        """Test that a repeated issue set is explained once for the whole stream."""
+        mock_llm.return_value = "shared"
+        inputs = ["utm_source=email&utm_medium=email"] * 7
+
+        results = list(stream_results(agent, inputs, chunk_size=2))
+
+        assert len(results) == 7
+        assert mock_llm.call_count == 1
+
+    def test_write_results_jsonl_and_csv(self, agent):
+        """Test both output formats and the returned counts."""
+        results = agent.run_batch(
+            ["utm_source=email&utm_medium=email&utm_campaign=fy25_a", "utm_source=email"], rules_only=True
+        )
+
+        jsonl = io.StringIO()
+        counts = write_results(results, jsonl, "jsonl")
+        rows = [json.loads(line) for line in jsonl.getvalue().splitlines()]
+
+        assert counts == {"total": 2, "failed": 1}
+        assert rows[1]["issues"][0]["type"] == "missing_param"
+
+        csv_out = io.StringIO()
+        write_results(results, csv_out, "csv")
+        lines = csv_out.getvalue().splitlines()
+        assert lines[0].startswith("original_url,normalized_url")
+        assert len(lines) == 3
+
+
+class TestRunParallel:
+    """Tests for process-pool validation."""
+
+    @pytest.fixture
+    def agent(self):
+        """Create a UTMQAAgent instance."""
+        return UTMQAAgent()
+
+    @pytest.fixture
+    def inputs(self):
+        """A mix of passing and failing inputs."""
+        return [
+            f"https://example.com/p{i}?utm_source=email&utm_medium=email&utm_campaign=fy25_{i}"
+            if i % 3
+            else f"utm_source=src{i}&utm_medium=cpc"
+            for i in range(50)
+        ]
+
+    def test_matches_serial_results_in_order(self, agent, inputs):
+        """Test that sharded results equal the serial path, in input order."""
+        parallel = agent.run_parallel(inputs, rules_only=True, workers=2, chunk_size=7)
+        assert parallel == agent.run_batch(inputs, rules_only=True)
+
+    def test_stream_results_with_workers(self, agent, inputs):
+        """Test that the streaming path can use the process pool."""
+        streamed = list(stream_results(agent, iter(inputs), rules_only=True, chunk_size=8, workers=2))
+        assert [r.original_url for r in streamed] == inputs
+
+    def test_from_taxonomy_skips_file_lookup(self, agent):
+        """Test building an agent from an in-memory taxonomy."""
+        clone = UTMQAAgent.from_taxonomy(agent.taxonomy)
+        assert clone.compiled == agent.compiled
+
 
 class TestUTMCheckIssue:
     """Tests for UTMCheckIssue dataclass."""